@@ -0,0 +1,658 @@
+import argparse
+import asyncio
+import bisect
+import csv
+import glob
+import json
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime, timedelta, timezone
+
+from aiohttp import web
+
+CRAWLER_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PORT = 8910
+DEFAULT_REPORT_FILE = "result/benchmark.json"
+TARGETS = ("jira", "jira-sharded", "github", "fetcher")
+ATTACHMENT_CHUNK_SIZE = 64 * 1024
+GITHUB_OWNER = "bench"
+GITHUB_REPO = "crawler"
+GITHUB_START = datetime(2022, 1, 1, tzinfo=timezone.utc)
+GITHUB_END = datetime(2022, 12, 31, 23, 59, 59, tzinfo=timezone.utc)
+GITHUB_RESULT_CAP = 1000
+LOG_LINE = "2024-01-01 12:00:00,000 INFO  [Executor task launch worker-{n}] memory store usage {n}4096 bytes\n"
+OOM_LINE = "2024-01-01 12:00:01,000 ERROR [Executor task launch worker-0] java.lang.OutOfMemoryError: Java heap space\n"
+
+
+def _chunk(size):
+    lines = []
+    length = 0
+    n = 0
+    while length < size:
+        line = LOG_LINE.format(n=n % 64)
+        lines.append(line)
+        length += len(line)
+        n += 1
+    return "".join(lines).encode()[:size]
+
+
+class FakeServices:
+    """
+    Local stand-ins for the JIRA REST API, the GitHub search and comments
+    API and an OpenAI-compatible chat completions, files and batches API,
+    served by one aiohttp application.
+
+    The data is synthetic and deterministic: `jira_issues` issues with a
+    log attachment on every `attachment_every`-th one, `attachment_bytes`
+    long and streamed from one reused chunk (so GB-size attachments cost
+    the server no memory), and `github_issues` issues created across 2022.
+    Every request waits `latency` seconds (± `jitter`), and is answered
+    with an injected 429 (`rate_limit_rate`) or 503 (`error_rate`) at the
+    given rates. With `jira_capacity`, JIRA requests beyond that many at
+    once are answered with 503, like an overloaded server. A batch stays in progress for `batch_seconds`, then its
+    output file holds one stand-in answer per request. `/_stats` returns the
+    request, byte and fault counters.
+
+    Routes:
+        GET  /jira/rest/api/2/search, /jira/rest/api/2/issue/<key>, /jira/attachment/<key>/<name>
+        GET  /github/search/issues, /github/repos/<owner>/<repo>/issues/<n>/comments
+        POST /openai/v1/chat/completions, /openai/v1/files, /openai/v1/batches
+        GET  /openai/v1/files/<id>/content, /openai/v1/batches, /openai/v1/batches/<id>
+    """
+
+    def __init__(self, jira_issues=200, github_issues=2000, attachment_every=2, attachment_bytes=1 << 20,
+                 latency=0.02, jitter=0.5, error_rate=0.0, rate_limit_rate=0.0, retry_after=1, llm_latency=0.2,
+                 batch_seconds=2.0, jira_capacity=0, seed=1):
+        self.jira_issues = jira_issues
+        self.attachment_every = attachment_every
+        self.attachment_bytes = attachment_bytes
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.llm_latency = llm_latency
+        self.batch_seconds = batch_seconds
+        self.jira_capacity = jira_capacity
+        self._jira_in_flight = 0
+        self._files = {}
+        self._batches = {}
+        self.stats = {"requests": {}, "bytes": 0, "injected_429": 0, "injected_errors": 0, "overloaded": 0}
+        self._random = random.Random(seed)
+        span = int((GITHUB_END - GITHUB_START).total_seconds())
+        # (created epoch, number), oldest first, for bisecting `created:` ranges
+        self._github = sorted((int(GITHUB_START.timestamp()) + self._random.randrange(span), number)
+                              for number in range(1, github_issues + 1))
+        self._github_times = [created for created, _ in self._github]
+        self._chunk = _chunk(ATTACHMENT_CHUNK_SIZE)
+
+    def app(self):
+        app = web.Application(middlewares=[self._inject_faults])
+        app.add_routes([
+            web.get("/_stats", self._stats),
+            web.get("/jira/rest/api/2/search", self._jira_search),
+            web.get("/jira/rest/api/2/issue/{key}", self._jira_issue),
+            web.get("/jira/attachment/{key}/{name}", self._jira_attachment),
+            web.get("/github/search/issues", self._github_search),
+            web.get("/github/repos/{owner}/{repo}/issues/{number}/comments", self._github_comments),
+            web.post("/openai/v1/chat/completions", self._chat),
+            web.post("/openai/v1/files", self._upload),
+            web.get("/openai/v1/files/{file_id}/content", self._file_content),
+            web.post("/openai/v1/batches", self._create_batch),
+            web.get("/openai/v1/batches", self._list_batches),
+            web.get("/openai/v1/batches/{batch_id}", self._retrieve_batch),
+        ])
+        return app
+
+    def _count(self, route, size=0):
+        self.stats["requests"][route] = self.stats["requests"].get(route, 0) + 1
+        self.stats["bytes"] += size
+
+    def _json(self, route, data, headers=None):
+        body = json.dumps(data).encode()
+        self._count(route, len(body))
+        return web.Response(body=body, content_type="application/json", headers=headers)
+
+    @web.middleware
+    async def _inject_faults(self, request, handler):
+        if request.path == "/_stats":
+            return await handler(request)
+        if self.jira_capacity and request.path.startswith("/jira/"):
+            if self._jira_in_flight >= self.jira_capacity:
+                self.stats["overloaded"] += 1
+                await asyncio.sleep(self.latency)
+                return web.json_response({"message": "overloaded"}, status=503)
+            self._jira_in_flight += 1
+            try:
+                return await self._serve(request, handler)
+            finally:
+                self._jira_in_flight -= 1
+        return await self._serve(request, handler)
+
+    async def _serve(self, request, handler):
+        await asyncio.sleep(self.latency * self._random.uniform(1 - self.jitter, 1 + self.jitter))
+        roll = self._random.random()
+        if roll < self.rate_limit_rate:
+            self.stats["injected_429"] += 1
+            return web.json_response({"message": "rate limited (injected)"}, status=429,
+                                     headers={"Retry-After": str(self.retry_after)})
+        if roll < self.rate_limit_rate + self.error_rate:
+            self.stats["injected_errors"] += 1
+            return web.json_response({"message": "service unavailable (injected)"}, status=503)
+        return await handler(request)
+
+    async def _stats(self, request):
+        return web.json_response(self.stats)
+
+    # JIRA
+
+    def _jira_issue_data(self, number, base, fields=None):
+        key = f"BENCH-{number}"
+        data = {
+            "summary": f"Memory leak in component {number % 50} after restart",
+            "description": f"The heap of worker {number % 7} grows until the process is killed. " * 4,
+            "created": "2024-01-01T00:00:00.000+0000",
+            "updated": f"2024-03-{number % 28 + 1:02d}T10:30:00.000+0800",
+            "resolution": {"name": "Fixed"},
+        }
+        if number % self.attachment_every == 0:
+            data["attachment"] = [{"filename": f"{key}.log", "content": f"{base}/jira/attachment/{key}/{key}.log",
+                                   "size": self.attachment_bytes}]
+        else:
+            data["attachment"] = []
+        if fields:
+            data = {name: value for name, value in data.items() if name in fields}
+        return {"key": key, "fields": data}
+
+    async def _jira_search(self, request):
+        start_at = int(request.query.get("startAt", 0))
+        max_results = min(int(request.query.get("maxResults", 50)), 100)
+        fields = request.query.get("fields")
+        fields = fields.split(",") if fields else None
+        base = f"http://{request.host}"
+        numbers = range(start_at + 1, min(self.jira_issues, start_at + max_results) + 1)
+        return self._json("jira_search", {
+            "startAt": start_at, "maxResults": max_results, "total": self.jira_issues,
+            "issues": [self._jira_issue_data(number, base, fields) for number in numbers],
+        })
+
+    async def _jira_issue(self, request):
+        number = int(request.match_info["key"].rsplit("-", 1)[1])
+        return self._json("jira_issue", self._jira_issue_data(number, f"http://{request.host}"))
+
+    async def _jira_attachment(self, request):
+        key = request.match_info["key"]
+        etag = f'"{key}-{self.attachment_bytes}"'
+        if request.headers.get("If-None-Match") == etag:
+            self._count("jira_attachment_304")
+            return web.Response(status=304, headers={"ETag": etag})
+        # half of the logs carry a memory signature, so the LLM stage sees some of them
+        tail = OOM_LINE.encode() if int(key.rsplit("-", 1)[1]) % (2 * self.attachment_every) == 0 else b""
+        size = max(self.attachment_bytes - len(tail), 0)
+        response = web.StreamResponse(headers={"ETag": etag, "Content-Type": "text/plain"})
+        response.content_length = size + len(tail)
+        await response.prepare(request)
+        sent = 0
+        while sent < size:
+            piece = self._chunk[:min(len(self._chunk), size - sent)]
+            await response.write(piece)
+            sent += len(piece)
+        if tail:
+            await response.write(tail)
+        self._count("jira_attachment", size + len(tail))
+        await response.write_eof()
+        return response
+
+    # GitHub
+
+    def _github_range(self, query):
+        low, high = self._github_times[0] if self._github_times else 0, float("inf")
+        for part in query.split():
+            if not part.startswith("created:"):
+                continue
+            value = part[len("created:"):]
+            if ".." in value:
+                start, end = value.split("..", 1)
+                low, high = _epoch(start), _epoch(end, end_of_day=True)
+            elif value.startswith(">"):
+                low = _epoch(value.lstrip(">=")) + (0 if value.startswith(">=") else 1)
+            elif value.startswith("<"):
+                high = _epoch(value.lstrip("<="), end_of_day=value.startswith("<="))
+        return bisect.bisect_left(self._github_times, low), bisect.bisect_right(self._github_times, high)
+
+    def _github_item(self, created, number, base):
+        return {
+            "number": number,
+            "title": f"Memory usage of node {number % 40} keeps growing",
+            "body": f"After upgrading, the heap of node {number % 40} grows by {number % 9 + 1}MB per hour.",
+            "user": {"login": f"user{number % 100}"},
+            "state": "closed",
+            "labels": [{"name": "bug"}, {"name": "memory"}],
+            "html_url": f"{base}/github/{GITHUB_OWNER}/{GITHUB_REPO}/issues/{number}",
+            "created_at": datetime.fromtimestamp(created, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "comments": number % 4,
+            "repository_url": f"{base}/github/repos/{GITHUB_OWNER}/{GITHUB_REPO}",
+            "comments_url": f"{base}/github/repos/{GITHUB_OWNER}/{GITHUB_REPO}/issues/{number}/comments",
+        }
+
+    def _github_headers(self):
+        return {"X-RateLimit-Remaining": "5000", "X-RateLimit-Reset": str(int(time.time()) + 3600)}
+
+    async def _github_search(self, request):
+        per_page = min(int(request.query.get("per_page", 30)), 100)
+        page = int(request.query.get("page", 1))
+        first, last = self._github_range(request.query.get("q", ""))
+        # newest first, and never more than the first 1000 results, like the real Search API
+        matches = self._github[first:last][::-1][:GITHUB_RESULT_CAP]
+        base = f"http://{request.host}"
+        items = [self._github_item(created, number, base)
+                 for created, number in matches[(page - 1) * per_page:page * per_page]]
+        return self._json("github_search", {"total_count": last - first, "incomplete_results": False,
+                                            "items": items}, self._github_headers())
+
+    async def _github_comments(self, request):
+        number = int(request.match_info["number"])
+        comments = [{"user": {"login": f"user{(number + index) % 100}"}, "created_at": "2022-06-01T00:00:00Z",
+                     "body": f"Heap dump {index} of issue {number} attached, the cache is never evicted."}
+                    for index in range(number % 4)]
+        return self._json("github_comments", comments, self._github_headers())
+
+    # OpenAI
+
+    def _completion(self, payload, number):
+        prompt = "".join(message.get("content", "") for message in payload.get("messages", []))
+        prompt_tokens = len(prompt) // 4 + 1
+        answer = "NO: no evidence in the log (benchmark stand-in)"
+        return {
+            "id": f"chatcmpl-bench-{number}",
+            "object": "chat.completion",
+            "model": payload.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": 12, "total_tokens": prompt_tokens + 12},
+        }
+
+    async def _chat(self, request):
+        payload = await request.json()
+        await asyncio.sleep(self.llm_latency)
+        return self._json("chat", self._completion(payload, self.stats["requests"].get("chat", 0)))
+
+    async def _upload(self, request):
+        form = await request.post()
+        upload = form["file"]
+        content = upload.file.read()
+        file_id = f"file-bench-{len(self._files) + 1}"
+        self._files[file_id] = content
+        return self._json("files", {"id": file_id, "object": "file", "bytes": len(content),
+                                    "filename": upload.filename, "purpose": form.get("purpose")})
+
+    async def _file_content(self, request):
+        content = self._files.get(request.match_info["file_id"])
+        if content is None:
+            return web.json_response({"error": {"message": "no such file"}}, status=404)
+        self._count("file_content", len(content))
+        return web.Response(body=content, content_type="application/jsonl")
+
+    async def _create_batch(self, request):
+        payload = await request.json()
+        if payload.get("input_file_id") not in self._files:
+            return web.json_response({"error": {"message": "no such input file"}}, status=400)
+        batch_id = f"batch-bench-{len(self._batches) + 1}"
+        self._batches[batch_id] = {
+            "id": batch_id, "object": "batch", "endpoint": payload.get("endpoint"),
+            "input_file_id": payload["input_file_id"], "completion_window": payload.get("completion_window"),
+            "status": "validating", "output_file_id": None, "error_file_id": None, "created_at": int(time.time()),
+            "metadata": payload.get("metadata"), "request_counts": {"total": 0, "completed": 0, "failed": 0},
+        }
+        return self._json("batches", self._batches[batch_id])
+
+    async def _list_batches(self, request):
+        limit = int(request.query.get("limit", 20))
+        batches = sorted(self._batches.values(), key=lambda batch: batch["id"], reverse=True)[:limit]
+        return self._json("batches", {"object": "list", "data": batches})
+
+    def _advance(self, batch):
+        if batch["status"] in ("completed", "failed", "expired", "cancelled"):
+            return
+        requests = [json.loads(line) for line in self._files[batch["input_file_id"]].splitlines() if line.strip()]
+        batch["request_counts"]["total"] = len(requests)
+        if time.time() - batch["created_at"] < self.batch_seconds:
+            batch["status"] = "in_progress"
+            return
+        lines = [json.dumps({"id": f"batch_req_{index}", "custom_id": line["custom_id"],
+                             "response": {"status_code": 200, "request_id": f"req_{index}",
+                                          "body": self._completion(line["body"], index)},
+                             "error": None})
+                 for index, line in enumerate(requests)]
+        output_file_id = f"file-bench-{len(self._files) + 1}"
+        self._files[output_file_id] = ("\n".join(lines) + "\n").encode()
+        batch.update(status="completed", output_file_id=output_file_id, completed_at=int(time.time()))
+        batch["request_counts"]["completed"] = len(requests)
+
+    async def _retrieve_batch(self, request):
+        batch = self._batches.get(request.match_info["batch_id"])
+        if batch is None:
+            return web.json_response({"error": {"message": "no such batch"}}, status=404)
+        self._advance(batch)
+        return self._json("batches", batch)
+
+
+def _epoch(value, end_of_day=False):
+    moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    if end_of_day and len(value) == 10:
+        moment += timedelta(days=1, seconds=-1)
+    return moment.timestamp()
+
+
+def serve(args):
+    services = FakeServices(
+        jira_issues=args.jira_issues, github_issues=args.github_issues, attachment_every=args.attachment_every,
+        attachment_bytes=int(args.attachment_mb * (1 << 20)), latency=args.latency_ms / 1000, jitter=args.jitter,
+        error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after,
+        llm_latency=args.llm_latency_ms / 1000, batch_seconds=args.batch_seconds,
+        jira_capacity=args.jira_capacity, seed=args.seed)
+    web.run_app(services.app(), host="127.0.0.1", port=args.port, print=None, access_log=None)
+
+
+def fetch_github(args):
+    """Runs the GitHub fetcher alone (sharded search plus comment threads) against `args.api`."""
+    sys.path.insert(0, CRAWLER_DIR)
+    import metrics
+    from github_fetcher import configure_endpoints, fetch_github_issues
+
+    configure_endpoints(f"{args.api}/search/issues")
+    issues = fetch_github_issues(GITHUB_OWNER, GITHUB_REPO, state="closed", per_page=100, max_pages=10,
+                                 start_date=GITHUB_START.strftime("%Y-%m-%d"),
+                                 end_date=GITHUB_END.strftime("%Y-%m-%d"), include_comments=True,
+                                 shard_by_date=True, workers=args.workers)
+    metrics.write("result/metrics.json", "json")
+    print(json.dumps({"issues": len(issues)}))
+
+
+# Harness
+
+def _get_json(url):
+    with urllib.request.urlopen(url, timeout=10) as response:
+        return json.load(response)
+
+
+def start_server(args):
+    """Starts `benchmark.py serve` with the scenario of `args` and waits until it answers."""
+    command = [sys.executable, os.path.abspath(__file__), "serve", "--port", str(args.port)]
+    for option in ("jira_issues", "github_issues", "attachment_every", "attachment_mb", "latency_ms", "jitter",
+                   "error_rate", "rate_limit_rate", "retry_after", "llm_latency_ms", "batch_seconds", "jira_capacity",
+                   "seed"):
+        command += [f"--{option.replace('_', '-')}", str(getattr(args, option))]
+    server = subprocess.Popen(command)
+    deadline = time.time() + 15
+    while True:
+        try:
+            _get_json(f"http://127.0.0.1:{args.port}/_stats")
+            return server
+        except OSError:
+            if server.poll() is not None or time.time() > deadline:
+                server.kill()
+                raise RuntimeError(f"fake services did not start on port {args.port}")
+            time.sleep(0.2)
+
+
+def _load_json(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_json(path, data):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+
+
+def _common_config(config, workdir, base, concurrency, llm_batch=False):
+    config["llm"].update(base_url=f"{base}/openai/v1", requests_per_minute=100000, tokens_per_minute=100000000,
+                         max_in_flight=concurrency)
+    config["llm_batch"] = {"enabled": llm_batch, "path": os.path.join(workdir, "result", "llm_batch.sqlite"),
+                           "poll_interval": 1}
+    config["metrics"] = {"enabled": True, "path": os.path.join(workdir, "result", "metrics.json"),
+                         "format": "json", "interval": 60}
+    return config
+
+
+def prepare_jira(workdir, base, concurrency, args):
+    """Lays out a working directory in which run_jira.py crawls the fake JIRA."""
+    config = _load_json(os.path.join(CRAWLER_DIR, "config", "memory_bug", "config.json"))
+    config["jira"].update(search_api=f"{base}/jira/rest/api/2/search",
+                          issue_detail_api=f"{base}/jira/rest/api/2/issue/",
+                          browse_url=f"{base}/jira/browse/", max_total_issues=args.jira_issues, page_size=50,
+                          search_fan_out=concurrency, log_save_path=os.path.join(workdir, "logs") + "/")
+    config["http"].update(max_connections=max(100, 2 * concurrency), max_per_host=concurrency)
+    config["http"].setdefault("adaptive", {})["enabled"] = not args.fixed_per_host
+    config["pipeline"].update(attachment_workers=concurrency, analysis_workers=min(concurrency, os.cpu_count() or 1),
+                              llm_workers=concurrency)
+    _write_json(os.path.join(workdir, "config", "memory_bug", "config.json"),
+                _common_config(config, workdir, base, concurrency, args.llm_batch))
+    os.symlink(os.path.join(CRAWLER_DIR, "prompt_template"), os.path.join(workdir, "prompt_template"))
+    store_file = config["excel"]["store_file_name"].format(bug_type=config["jira"]["bug_type"])
+    return os.path.join(workdir, store_file)
+
+
+def prepare_github(workdir, base, concurrency, args):
+    """Lays out a working directory in which run_github_issues.py crawls the fake GitHub."""
+    config = _load_json(os.path.join(CRAWLER_DIR, "config", "config.json"))
+    config["github"].update(owner=GITHUB_OWNER, repo=GITHUB_REPO, search_api=f"{base}/github/search/issues",
+                            state="closed", per_page=100, max_pages=10, token="", tokens=[], api="rest",
+                            include_comments=True, shard_by_date=True, search_workers=concurrency,
+                            start_date=GITHUB_START.strftime("%Y-%m-%d"), end_date=GITHUB_END.strftime("%Y-%m-%d"))
+    config["pipeline"].update(comment_workers=concurrency, llm_workers=concurrency)
+    crawler_dir = os.path.join(workdir, "bug_crawler")
+    _write_json(os.path.join(crawler_dir, "config", "config.json"),
+                _common_config(config, workdir, base, concurrency, args.llm_batch))
+    os.symlink(os.path.join(CRAWLER_DIR, "prompt_template"), os.path.join(crawler_dir, "prompt_template"))
+    return os.path.join(workdir, config["csv"]["file_name"].format(repo=GITHUB_REPO,
+                                                                   bug_type=config["github"]["bug_type"]))
+
+
+def count_results(target, output):
+    if not os.path.exists(output):
+        return 0
+    if target == "github":
+        with open(output, newline="", encoding="utf-8") as f:
+            return sum(1 for _ in csv.DictReader(f))
+    conn = sqlite3.connect(output)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def sum_metrics(workdir, prefix):
+    """Sums the counters starting with `prefix` over the metrics files of a run (one per process)."""
+    total = 0
+    for path in glob.glob(os.path.join(workdir, "result", "metrics*.json")):
+        total += sum(metric["value"] for metric in _load_json(path)["counters"] if metric["name"].startswith(prefix))
+    return total
+
+
+def run_once(target, concurrency, args):
+    """Runs one target at one concurrency against the fake services and measures it."""
+    base = f"http://127.0.0.1:{args.port}"
+    workdir = tempfile.mkdtemp(prefix=f"bench-{target}-{concurrency}-", dir=args.workdir)
+    env = dict(os.environ, OPENAI_API_KEY="benchmark")
+    output = None
+    if target in ("jira", "jira-sharded"):
+        output = prepare_jira(workdir, base, concurrency, args)
+        command = [sys.executable, os.path.join(CRAWLER_DIR, "run_jira.py")]
+        if target == "jira-sharded":
+            # concurrency is the number of worker processes, each with the default pipeline
+            command += ["--workers", str(concurrency)]
+    elif target == "github":
+        output = prepare_github(workdir, base, concurrency, args)
+        command = [sys.executable, os.path.join(CRAWLER_DIR, "run_github_issues.py")]
+    else:
+        command = [sys.executable, os.path.abspath(__file__), "fetch-github", "--api", f"{base}/github",
+                   "--workers", str(concurrency)]
+
+    before = _get_json(f"{base}/_stats")
+    log_path = os.path.join(workdir, "run.log")
+    started = time.perf_counter()
+    with open(log_path, "w") as log:
+        process = subprocess.Popen(command, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            # wait4 reports the peak RSS of the process (and of the worker processes it waited for)
+            _, status, usage = os.wait4(process.pid, 0)
+        except BaseException:
+            process.kill()
+            raise
+        process.returncode = os.waitstatus_to_exitcode(status)
+    elapsed = time.perf_counter() - started
+    after = _get_json(f"{base}/_stats")
+
+    if output:
+        issues = count_results(target, output)
+    else:
+        with open(log_path, encoding="utf-8", errors="replace") as f:
+            lines = [line for line in f if line.startswith('{"issues"')]
+        issues = json.loads(lines[-1])["issues"] if lines else 0
+    downloaded = after["bytes"] - before["bytes"]
+    result = {
+        "target": target,
+        "concurrency": concurrency,
+        "exit_code": process.returncode,
+        "seconds": round(elapsed, 3),
+        "issues": issues,
+        "issues_per_second": round(issues / elapsed, 2) if elapsed else 0,
+        "bytes": downloaded,
+        "bytes_per_second": round(downloaded / elapsed) if elapsed else 0,
+        # ru_maxrss is in KiB on Linux and in bytes on macOS
+        "peak_rss_mb": round(usage.ru_maxrss / (1 << 20 if sys.platform == "darwin" else 1 << 10), 1),
+        "requests": sum(after["requests"].values()) - sum(before["requests"].values()),
+        "injected_429": after["injected_429"] - before["injected_429"],
+        # 503s, injected at random or for going over --jira-capacity
+        "injected_errors": (after["injected_errors"] + after["overloaded"]
+                            - before["injected_errors"] - before["overloaded"]),
+        "retries": sum_metrics(workdir, "crawler_http_retries_total") + sum_metrics(workdir,
+                                                                                 "crawler_github_retries_total")
+                   + sum_metrics(workdir, "crawler_llm_retries_total"),
+    }
+    if process.returncode != 0:
+        with open(log_path, encoding="utf-8", errors="replace") as f:
+            print(f"❌ {target} (concurrency {concurrency}) 退出码 {process.returncode}，日志末尾：\n"
+                  + "".join(f.readlines()[-20:]))
+    if args.keep:
+        result["workdir"] = workdir
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+
+def print_report(results):
+    print("\n📊 基准测试结果：")
+    print(f"  {'target':<13} {'conc':>5} {'issues':>7} {'seconds':>8} {'issues/s':>9} {'MB/s':>8} "
+          f"{'peak RSS':>9} {'speedup':>8} {'retries':>8} {'429':>5} {'5xx':>5}")
+    baseline = {}
+    for result in results:
+        rate = result["issues_per_second"]
+        baseline.setdefault(result["target"], rate)
+        speedup = rate / baseline[result["target"]] if baseline[result["target"]] else 0
+        status = "" if result["exit_code"] == 0 else "  (failed)"
+        print(f"  {result['target']:<13} {result['concurrency']:>5} {result['issues']:>7} {result['seconds']:>8.1f} "
+              f"{rate:>9.1f} {result['bytes_per_second'] / (1 << 20):>8.1f} {result['peak_rss_mb']:>7.1f}MB "
+              f"{speedup:>7.2f}x {result['retries']:>8} {result['injected_429']:>5} "
+              f"{result['injected_errors']:>5}{status}")
+
+
+def run(args):
+    targets = args.targets.split(",")
+    unknown = set(targets) - set(TARGETS)
+    if unknown:
+        raise SystemExit(f"unknown target(s): {', '.join(sorted(unknown))}; choose from {', '.join(TARGETS)}")
+    concurrency_levels = [int(level) for level in args.concurrency.split(",")]
+    if any(target.startswith("jira") for target in targets):
+        sys.path.insert(0, CRAWLER_DIR)
+        try:
+            import service.gpt_service.util  # noqa: F401 - run_jira.py reads the OpenAI key file on import
+        except FileNotFoundError as e:
+            raise SystemExit(f"run_jira.py reads the OpenAI key from {e.filename}; create it first "
+                             f"(any content will do against the fake services)")
+    server = start_server(args)
+    results = []
+    try:
+        for target in targets:
+            for concurrency in concurrency_levels:
+                print(f"▶️ {target}，并发 {concurrency}")
+                results.append(run_once(target, concurrency, args))
+    finally:
+        server.terminate()
+        server.wait()
+    print_report(results)
+    _write_json(args.output, {"scenario": {name: value for name, value in vars(args).items()
+                                           if name not in ("command", "output", "workdir", "keep")},
+                              "results": results})
+    print(f"\n✅ 结果已写入 {args.output}")
+
+
+def add_scenario_arguments(parser):
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--jira-issues", type=int, default=200, help="Issues in the fake JIRA.")
+    parser.add_argument("--github-issues", type=int, default=2000, help="Issues in the fake GitHub repository.")
+    parser.add_argument("--attachment-every", type=int, default=2, help="Every n-th JIRA issue has a log attached.")
+    parser.add_argument("--attachment-mb", type=float, default=1.0,
+                        help="Size of each log attachment; GB sizes are streamed without buffering.")
+    parser.add_argument("--latency-ms", type=float, default=20, help="Latency added to every request.")
+    parser.add_argument("--jitter", type=float, default=0.5, help="Latency varies by up to this fraction.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 503.")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0,
+                        help="Fraction of requests answered with 429 and Retry-After.")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After of the injected 429s (seconds).")
+    parser.add_argument("--llm-latency-ms", type=float, default=200, help="Time the fake LLM takes per answer.")
+    parser.add_argument("--batch-seconds", type=float, default=2.0,
+                        help="How long a fake batch stays in progress before its results are ready.")
+    parser.add_argument("--jira-capacity", type=int, default=0,
+                        help="Concurrent JIRA requests beyond this are answered with 503 (0: unlimited).")
+    parser.add_argument("--seed", type=int, default=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the crawlers end to end against local stand-ins for JIRA, GitHub and OpenAI.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run the benchmark and report throughput, RSS and scaling.")
+    add_scenario_arguments(run_parser)
+    run_parser.add_argument("--targets", default="jira,github,fetcher",
+                            help=f"Comma-separated, from: {', '.join(TARGETS)}.")
+    run_parser.add_argument("--concurrency", default="1,4,16",
+                            help="Comma-separated concurrency levels (worker processes for jira-sharded).")
+    run_parser.add_argument("--output", default=DEFAULT_REPORT_FILE, help="JSON report file.")
+    run_parser.add_argument("--workdir", default=None, help="Where the per-run working directories are created.")
+    run_parser.add_argument("--keep", action="store_true", help="Keep the per-run working directories.")
+    run_parser.add_argument("--llm-batch", action="store_true",
+                            help="Run the crawlers in LLM batch mode (the llm_batch config section).")
+    run_parser.add_argument("--fixed-per-host", action="store_true",
+                            help="Keep JIRA requests per host at the concurrency level instead of adapting it.")
+
+    serve_parser = commands.add_parser("serve", help="Only start the fake services.")
+    add_scenario_arguments(serve_parser)
+
+    fetch_parser = commands.add_parser("fetch-github", help="Run the GitHub fetcher alone (used by 'run').")
+    fetch_parser.add_argument("--api", required=True, help="Base URL of the (fake) GitHub API.")
+    fetch_parser.add_argument("--workers", type=int, default=4)
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        serve(args)
+    elif args.command == "fetch-github":
+        fetch_github(args)
+    else:
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+import asyncio
+import json
+import os
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+
+import metrics
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Status codes worth another attempt: throttling and transient server errors.
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# Smoothing of a host's recent and usual time to first byte, and the responses needed before spikes count.
+RECENT_LATENCY_ALPHA = 0.25
+USUAL_LATENCY_ALPHA = 0.02
+LATENCY_MIN_SAMPLES = 20
+
+
+class AdaptiveLimit:
+    """
+    Concurrency limit of one host, adjusted AIMD style like TCP congestion control.
+
+    Every healthy response raises the limit by 1/limit, i.e. by one request
+    per round of `limit` responses, as long as the limit is actually used.
+    A throttled or failed request (429, 5xx, timeout, connection error) or a
+    latency spike (the recent average time to first byte above
+    `latency_spike` times the host's usual one) multiplies it by
+    `decrease_factor`. Requests that were already
+    in flight when the limit was cut do not cut it again, so one burst of
+    errors counts once. After a cut the recent latency starts over from
+    the usual one, so a spike must show again in LATENCY_MIN_SAMPLES new
+    responses before it cuts the limit again. With `minimum == maximum` the
+    limit is fixed.
+
+    The limit is published as the gauge crawler_http_concurrency_limit{host}.
+    """
+
+    def __init__(self, host, initial, minimum=1, maximum=64, decrease_factor=0.5, latency_spike=2.0):
+        self.host = host
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.decrease_factor = decrease_factor
+        self.latency_spike = latency_spike
+        self.in_flight = 0
+        self._recent = self._usual = None  # fast and slow EWMAs of the time to first byte
+        self._samples = 0
+        self._samples_since_cut = 0
+        self._last_cut = 0.0
+        self._freed = asyncio.Event()
+        self._publish()
+
+    def _publish(self):
+        metrics.set_gauge("crawler_http_concurrency_limit", round(self.limit, 2), host=self.host)
+
+    async def acquire(self):
+        """Waits for a free slot; returns the ticket to pass to `release`."""
+        while self.in_flight >= int(self.limit):
+            self._freed.clear()
+            await self._freed.wait()
+        self.in_flight += 1
+        return time.monotonic()
+
+    def _spike(self, latency):
+        if self._samples == 0:
+            self._recent = self._usual = latency
+        else:
+            self._recent += RECENT_LATENCY_ALPHA * (latency - self._recent)
+            # slow responses feed the usual latency too, so a host that got slower for good becomes the new normal
+            self._usual += USUAL_LATENCY_ALPHA * (latency - self._usual)
+        self._samples += 1
+        self._samples_since_cut += 1
+        return self._samples_since_cut >= LATENCY_MIN_SAMPLES and self._recent > self.latency_spike * self._usual
+
+    def release(self, ticket, healthy, latency=None):
+        """
+        Frees the slot taken with `ticket` and adjusts the limit.
+
+        Args:
+            ticket (float): The value returned by `acquire`.
+            healthy (bool | None): True for a good response, False for
+                throttling or a failure, None when it says nothing about the
+                host's load (e.g. a 404).
+            latency (float, optional): Time to first byte of a good response.
+        """
+        saturated = self.in_flight >= int(self.limit)
+        self.in_flight -= 1
+        if healthy is False or (healthy and latency is not None and self._spike(latency)):
+            if ticket >= self._last_cut and self.limit > self.minimum:
+                self._last_cut = time.monotonic()
+                self.limit = max(self.minimum, self.limit * self.decrease_factor)
+                # a fresh window: the spike that caused this cut must not cause the next one
+                self._recent = self._usual
+                self._samples_since_cut = 0
+                metrics.inc("crawler_http_concurrency_decreases_total", host=self.host,
+                            reason="error" if healthy is False else "latency")
+                self._publish()
+        elif healthy and saturated and self.limit < self.maximum:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._publish()
+        self._freed.set()
+
+
+class CrawlEngine:
+    """
+    Asyncio HTTP engine used by the JIRA fetchers.
+
+    One pooled aiohttp session is kept for the whole crawl, so keep-alive
+    connections to the issue tracker are reused across search pages, issue
+    details and attachments. Requests are capped per host and transient
+    failures (connection errors, timeouts, 429 and 5xx) are retried with
+    exponential backoff. The cap is `max_per_host`, or with `adaptive` (the
+    "adaptive" settings of the "http" section: min_per_host, max_per_host,
+    decrease_factor, latency_spike) it starts there and follows the host's
+    health, see `AdaptiveLimit`. With an `HttpCache`, JSON responses and attachment
+    downloads are served from the cache or revalidated with conditional
+    requests.
+
+    Usage:
+        async with CrawlEngine(max_per_host=10) as engine:
+            data = await engine.get_json(url, params={"startAt": 0})
+    """
+
+    def __init__(self, max_connections=100, max_per_host=10, timeout=10, retries=3,
+                 backoff=1.0, headers=None, cache=None, adaptive=None):
+        self.max_connections = max_connections
+        self.max_per_host = max_per_host
+        self.adaptive = adaptive
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.headers = headers or {}
+        self.cache = cache
+        self._session = None
+        self._host_limits = {}
+
+    @classmethod
+    def from_config(cls, http_config, cache=None):
+        """Build an engine from the optional "http" section of a crawler config."""
+        adaptive = http_config.get("adaptive")
+        return cls(
+            max_connections=http_config.get("max_connections", 100),
+            max_per_host=http_config.get("max_per_host", 10),
+            timeout=http_config.get("timeout", 10),
+            retries=http_config.get("retries", 3),
+            backoff=http_config.get("backoff", 1.0),
+            headers=http_config.get("headers"),
+            cache=cache,
+            adaptive=adaptive if adaptive and adaptive.get("enabled", False) else None,
+        )
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.max_connections, limit_per_host=self._ceiling())
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            headers=self.headers,
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=self.timeout, sock_read=self.timeout),
+        )
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._session.close()
+        self._session = None
+
+    def _ceiling(self):
+        if self.adaptive:
+            return max(self.max_per_host, self.adaptive.get("max_per_host", 64))
+        return self.max_per_host
+
+    def _host_limit(self, host):
+        if host not in self._host_limits:
+            if self.adaptive:
+                self._host_limits[host] = AdaptiveLimit(
+                    host, self.max_per_host, minimum=self.adaptive.get("min_per_host", 1), maximum=self._ceiling(),
+                    decrease_factor=self.adaptive.get("decrease_factor", 0.5),
+                    latency_spike=self.adaptive.get("latency_spike", 2.0))
+            else:
+                self._host_limits[host] = AdaptiveLimit(host, self.max_per_host, self.max_per_host,
+                                                        self.max_per_host)
+        return self._host_limits[host]
+
+    def _retry_delay(self, attempt, response=None):
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                return float(retry_after)
+        return self.backoff * (2 ** attempt)
+
+    async def request(self, url, handler, params=None, headers=None):
+        """
+        Sends a GET request and passes the response to `handler`.
+
+        The handler is an async callable that consumes the response body and
+        returns a value; it is re-run from scratch on every retry.
+
+        Args:
+            url (str): The request URL.
+            handler (callable): `async def handler(response)`.
+            params (dict, optional): Query string parameters.
+            headers (dict, optional): Extra request headers.
+        Returns:
+            The value returned by `handler`.
+        """
+        host = urlsplit(url).netloc
+        limit = self._host_limit(host)
+        attempt = 0
+        while True:
+            ticket = await limit.acquire()
+            started = time.perf_counter()
+            status = "error"
+            healthy = latency = None
+            try:
+                async with self._session.get(url, params=params, headers=headers) as response:
+                    status = response.status
+                    # the time to the headers is the host's queueing, whatever the size of the body
+                    latency = time.perf_counter() - started
+                    if response.status in RETRY_STATUS:
+                        healthy = False
+                    elif response.status < 400:
+                        healthy = True
+                    if response.status in RETRY_STATUS and attempt < self.retries:
+                        delay = self._retry_delay(attempt, response)
+                    else:
+                        response.raise_for_status()
+                        return await handler(response)
+            except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError) as e:
+                healthy = False
+                if attempt >= self.retries:
+                    raise
+                status = type(e).__name__
+                delay = self._retry_delay(attempt)
+            finally:
+                limit.release(ticket, healthy, latency)
+                # the latency covers the handler, i.e. reading the whole body
+                metrics.observe("crawler_http_request_seconds", time.perf_counter() - started, host=host)
+                metrics.inc("crawler_http_requests_total", host=host, status=status)
+            metrics.inc("crawler_http_retries_total", host=host, reason=status)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def get_json(self, url, params=None, headers=None):
+        if self.cache is None:
+            async def read_json(response):
+                return await response.json(content_type=None)
+            return await self.request(url, read_json, params=params, headers=headers)
+
+        key = self.cache.cache_key(url, params)
+        entry = self.cache.get(key)
+        if entry and entry["body"] is not None:
+            if self.cache.is_fresh(entry):
+                self.cache.record_hit(entry, revalidated=False)
+                return json.loads(entry["body"])
+            headers = {**(headers or {}), **self.cache.conditional_headers(entry)}
+        else:
+            entry = None
+
+        async def read_json_cached(response):
+            if response.status == 304 and entry:
+                self.cache.record_hit(entry, revalidated=True)
+                return json.loads(entry["body"])
+            body = await response.read()
+            self.cache.store(key, url, response.headers, body=body)
+            return json.loads(body)
+        return await self.request(url, read_json_cached, params=params, headers=headers)
+
+    async def get_text(self, url, params=None, headers=None):
+        async def read_text(response):
+            return await response.text(errors="replace")
+        return await self.request(url, read_text, params=params, headers=headers)
+
+    async def download(self, url, dest_path=None, chunk_size=DOWNLOAD_CHUNK_SIZE, headers=None):
+        """
+        Streams a response body to disk while counting its lines.
+
+        Only one chunk is held in memory at a time. The body is written to
+        `dest_path + ".part"` and renamed once complete, so an interrupted
+        download never leaves a truncated file behind. With `dest_path=None`
+        the body is only counted, not stored.
+
+        With a cache, a previous download of the same URL to the same path is
+        reused while fresh, and revalidated with a conditional request after
+        that; a 304 keeps the file on disk and its recorded line count.
+
+        Returns:
+            tuple: (line_count, bytes_downloaded). A final line without a
+            trailing newline is counted as a line.
+        """
+        key = entry = None
+        if self.cache is not None:
+            key = self.cache.cache_key(url)
+            entry = self.cache.get(key)
+            if entry and not self._download_reusable(entry, dest_path):
+                entry = None
+            if entry:
+                if self.cache.is_fresh(entry):
+                    self.cache.record_hit(entry, revalidated=False)
+                    return entry["meta"]["line_count"], entry["size"]
+                headers = {**(headers or {}), **self.cache.conditional_headers(entry)}
+
+        async def stream_to_disk(response):
+            if response.status == 304 and entry:
+                self.cache.record_hit(entry, revalidated=True)
+                return entry["meta"]["line_count"], entry["size"]
+            line_count = 0
+            size = 0
+            last_byte = b"\n"
+            part_path = dest_path + ".part" if dest_path else None
+            if part_path:
+                os.makedirs(os.path.dirname(part_path) or ".", exist_ok=True)
+            f = open(part_path, "wb") if part_path else None
+            try:
+                async for chunk in response.content.iter_chunked(chunk_size):
+                    line_count += chunk.count(b"\n")
+                    size += len(chunk)
+                    last_byte = chunk[-1:]
+                    if f:
+                        f.write(chunk)
+            finally:
+                if f:
+                    f.close()
+            metrics.inc("crawler_http_download_bytes_total", size, host=urlsplit(url).netloc)
+            if last_byte != b"\n":
+                line_count += 1
+            if part_path:
+                os.replace(part_path, dest_path)
+            if key:
+                self.cache.store(key, url, response.headers, local_path=dest_path,
+                                 meta={"line_count": line_count}, size=size)
+            return line_count, size
+
+        return await self.request(url, stream_to_disk, headers=headers)
+
+    @staticmethod
+    def _download_reusable(entry, dest_path):
+        if "line_count" not in entry["meta"] or entry["local_path"] != dest_path:
+            return False
+        return dest_path is None or (os.path.exists(dest_path) and os.path.getsize(dest_path) == entry["size"])
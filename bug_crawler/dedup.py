@@ -0,0 +1,225 @@
+import argparse
+import os
+import re
+import sqlite3
+import threading
+import zlib
+
+import numpy as np
+
+from log_access import iter_chunks
+
+DEFAULT_DEDUP_FILE = "result/dedup.sqlite"
+NUM_PERM = 128
+NUM_BANDS = 32
+SHINGLE_WORDS = 3
+MAX_SHINGLES = 20000
+ATTACHMENT_SAMPLE_BYTES = 64 * 1024
+SEED = 20240501
+# Keys kept per LSH bucket; members of one bucket are near-identical, so a few suffice as candidates.
+MAX_BUCKET_SIZE = 32
+
+_WORD_PATTERN = re.compile(r"[a-z_][a-z0-9_.$]*|\d+")
+
+
+def _mix(values):
+    """splitmix64 finaliser; uint64 arithmetic wraps, which is what the mixer expects."""
+    values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+def shingles(text):
+    """
+    32-bit hashes of the word 3-grams of `text`.
+
+    Words are hashed once and combined into n-gram hashes with vectorised
+    arithmetic; standalone numbers are masked so re-filed reports with new
+    ids still match.
+    """
+    words = _WORD_PATTERN.findall(text.lower())[:MAX_SHINGLES + SHINGLE_WORDS - 1]
+    words = np.fromiter((zlib.crc32(b"0" if word.isdigit() else word.encode("utf-8")) for word in words),
+                        dtype=np.uint64, count=len(words))
+    if len(words) >= SHINGLE_WORDS:
+        grams = np.zeros(len(words) - SHINGLE_WORDS + 1, dtype=np.uint64)
+        for offset in range(SHINGLE_WORDS):
+            grams = grams * np.uint64(0x9E3779B1) + words[offset:len(words) - SHINGLE_WORDS + 1 + offset]
+        words = grams & np.uint64(0xFFFFFFFF)
+    return np.unique(words)
+
+
+def attachment_sample(path, max_bytes=ATTACHMENT_SAMPLE_BYTES):
+    """The head of a downloaded attachment, as text, for the issue's signature."""
+    sample = bytearray()
+    for chunk in iter_chunks(path):
+        sample += chunk[:max_bytes - len(sample)]
+        if len(sample) >= max_bytes:
+            break
+    return sample.decode("utf-8", errors="replace")
+
+
+class DedupIndex:
+    """
+    Groups near-duplicate issues (backports, clones, re-filed OOMs) into clusters.
+
+    Each issue gets a MinHash signature over the word shingles of its text;
+    LSH banding (NUM_BANDS bands of NUM_PERM / NUM_BANDS rows) finds the
+    earlier issues sharing a band, so an issue is compared with a handful
+    of candidates instead of every issue seen. A candidate joins when the
+    estimated Jaccard similarity reaches `threshold`, and the issue takes
+    its cluster id, which is the key of the cluster's first issue.
+
+    Signatures and cluster ids are persisted, so clusters are stable across
+    runs and delta crawls; the band buckets are rebuilt in memory on open,
+    and catch up with other processes sharing the database before each
+    assignment.
+
+    Usage:
+        index = DedupIndex("result/dedup.sqlite")
+        cluster_id = index.assign("FLINK-1", "title\\nbody\\nlog head")
+    """
+
+    def __init__(self, path=DEFAULT_DEDUP_FILE, threshold=0.7, num_perm=NUM_PERM, num_bands=NUM_BANDS):
+        if num_perm % num_bands:
+            raise ValueError("num_perm must be a multiple of num_bands")
+        self.path = path
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.num_bands = num_bands
+        # one seed per hash function of the MinHash
+        self._seeds = np.random.default_rng(SEED).integers(0, np.iinfo(np.uint64).max, size=(num_perm, 1),
+                                                            dtype=np.uint64, endpoint=True)
+        self._buckets = [{} for _ in range(num_bands)]  # band -> {band bytes: [keys]}
+        self._signatures = {}  # key -> uint32 signature
+        self._clusters = {}  # key -> cluster id
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS signatures (
+                key TEXT PRIMARY KEY,
+                cluster TEXT NOT NULL,
+                signature BLOB NOT NULL
+            )
+        """)
+        self._conn.commit()
+        self._last_rowid = 0
+        self.refresh()
+
+    @classmethod
+    def from_config(cls, dedup_config):
+        """Build an index from the "dedup" config section, or return None if it is disabled."""
+        if not dedup_config or not dedup_config.get("enabled", True):
+            return None
+        return cls(path=dedup_config.get("path", DEFAULT_DEDUP_FILE),
+                   threshold=dedup_config.get("threshold", 0.7))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def signature(self, text):
+        """MinHash signature of `text` (NUM_PERM uint32 values), computed in blocks of shingles."""
+        signature = np.full(self.num_perm, np.iinfo(np.uint64).max, dtype=np.uint64)
+        hashes = shingles(text)
+        for start in range(0, len(hashes), 2048):
+            block = hashes[None, start:start + 2048]
+            np.minimum(signature, _mix(block ^ self._seeds).min(axis=1), out=signature)
+        return (signature & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+
+    def refresh(self):
+        """
+        Loads the signatures stored since the last load, including those of
+        other processes sharing the database.
+        """
+        rows = self._conn.execute("SELECT rowid, key, cluster, signature FROM signatures WHERE rowid > ? "
+                                  "ORDER BY rowid", (self._last_rowid,)).fetchall()
+        for rowid, key, cluster, blob in rows:
+            self._last_rowid = rowid
+            signature = np.frombuffer(blob, dtype=np.uint32)
+            if key not in self._clusters and len(signature) == self.num_perm:
+                self._index(key, signature, cluster)
+
+    def _bands(self, signature):
+        rows = self.num_perm // self.num_bands
+        return [signature[band * rows:(band + 1) * rows].tobytes() for band in range(self.num_bands)]
+
+    def _index(self, key, signature, cluster):
+        self._signatures[key] = signature
+        self._clusters[key] = cluster
+        for buckets, band in zip(self._buckets, self._bands(signature)):
+            bucket = buckets.setdefault(band, [])
+            if len(bucket) < MAX_BUCKET_SIZE:
+                bucket.append(key)
+
+    def cluster_of(self, key):
+        return self._clusters.get(key)
+
+    def assign(self, key, text):
+        """Returns the cluster id of issue `key`, indexing it on first sight."""
+        return self.assign_many([(key, text)])[0]
+
+    def assign_many(self, issues):
+        """Cluster ids of `(key, text)` pairs, assigned in order and persisted in one transaction."""
+        clusters = [self._assign(key, text) for key, text in issues]
+        with self._lock:
+            self._conn.commit()
+        return clusters
+
+    def _assign(self, key, text):
+        with self._lock:
+            if key in self._clusters:
+                return self._clusters[key]
+        if not _WORD_PATTERN.search(text.lower()):
+            return key  # nothing to compare
+        signature = self.signature(text)
+        with self._lock:
+            self.refresh()
+            if key in self._clusters:
+                return self._clusters[key]
+            best, best_similarity = None, self.threshold
+            seen = set()
+            for buckets, band in zip(self._buckets, self._bands(signature)):
+                for candidate in buckets.get(band, ()):
+                    if candidate in seen:
+                        continue
+                    seen.add(candidate)
+                    similarity = float(np.mean(self._signatures[candidate] == signature))
+                    if similarity >= best_similarity:
+                        best, best_similarity = candidate, similarity
+            cluster = self._clusters[best] if best else key
+            self._index(key, signature, cluster)
+            self._conn.execute("INSERT OR REPLACE INTO signatures VALUES (?, ?, ?)",
+                               (key, cluster, signature.tobytes()))
+        return cluster
+
+    def is_representative(self, key):
+        return self._clusters.get(key) == key
+
+    def stats(self):
+        with self._lock:
+            sizes = {}
+            for cluster in self._clusters.values():
+                sizes[cluster] = sizes.get(cluster, 0) + 1
+        return {"issues": len(self._clusters), "clusters": len(sizes),
+                "duplicates": len(self._clusters) - len(sizes),
+                "largest": sorted(sizes.items(), key=lambda item: -item[1])[:10]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect the near-duplicate clusters of crawled issues.")
+    parser.add_argument("--db", default=DEFAULT_DEDUP_FILE, help="Path of the dedup database.")
+    args = parser.parse_args()
+
+    index = DedupIndex(args.db)
+    stats = index.stats()
+    index.close()
+    print(f"Issues: {stats['issues']}, clusters: {stats['clusters']}, duplicates: {stats['duplicates']}")
+    for cluster, size in stats["largest"]:
+        if size > 1:
+            print(f"  {cluster}: {size} issues")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,63 @@
-import requests
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 
-def fetch_issue_comments(issue, headers):
+from github_rate_limiter import GitHubTokenPool
+
+SEARCH_API = "https://api.github.com/search/issues"
+SEARCH_HEADERS = {"Accept": "application/vnd.github.v3+json"}
+# The Search API never returns more than this many results for one query.
+SEARCH_RESULT_CAP = 1000
+GITHUB_EPOCH = datetime(2008, 1, 1, tzinfo=timezone.utc)
+GITHUB_GRAPHQL_API = "https://api.github.com/graphql"
+GRAPHQL_COMMENT_PAGE = 100
+GRAPHQL_BATCH_SIZE = 20
+
+# Issues, labels and the first page of comments in one search round-trip.
+SEARCH_ISSUES_QUERY = """
+query($q: String!, $first: Int!, $after: String, $withComments: Boolean!) {
+  search(query: $q, type: ISSUE, first: $first, after: $after) {
+    pageInfo { hasNextPage endCursor }
+    nodes {
+      ... on Issue {
+        id
+        number
+        title
+        body
+        state
+        url
+        createdAt
+        author { login }
+        labels(first: 100) { nodes { name } }
+        commentCount: comments { totalCount }
+        comments(first: %d) @include(if: $withComments) {
+          pageInfo { hasNextPage endCursor }
+          nodes { author { login } createdAt body }
+        }
+      }
+    }
+  }
+}
+""" % GRAPHQL_COMMENT_PAGE
+
+COMMENT_PAGE_FRAGMENT = """
+  %s: node(id: "%s") {
+    ... on Issue {
+      comments(first: %d, after: "%s") {
+        pageInfo { hasNextPage endCursor }
+        nodes { author { login } createdAt body }
+      }
+    }
+  }
+"""
+
+def configure_endpoints(search_api=None, graphql_api=None):
+    """Points the fetchers at another API host, e.g. GitHub Enterprise or a local stand-in server."""
+    global SEARCH_API, GITHUB_GRAPHQL_API
+    SEARCH_API = search_api or SEARCH_API
+    GITHUB_GRAPHQL_API = graphql_api or GITHUB_GRAPHQL_API
+
+
+def fetch_issue_comments(issue, headers, cache=None, token_pool=None):
     """
     Fetches comments for a specific GitHub issue.
 
@@ -9,11 +66,14 @@ def fetch_issue_comments(issue, headers):
         owner (str): The repository owner.
         repo (str): The repository name.
         headers (dict): Headers for the API request.
+        cache (HttpCache, optional): Serves unchanged threads from disk via conditional requests.
+        token_pool (GitHubTokenPool, optional): Supplies the token and waits out rate limits.
     Returns:
         list: A list of comment dictionaries.
     """
     comments_url = issue["comments_url"]
-    comments_resp = requests.get(comments_url, headers=headers)
+    token_pool = token_pool or GitHubTokenPool()
+    comments_resp = token_pool.get(comments_url, headers=headers, cache=cache)
     if comments_resp.status_code == 200:
         comments_thread = [
             {
@@ -25,37 +85,15 @@ def fetch_issue_comments(issue, headers):
         ]
     else:
         comments_thread = []
-    comments_thread_text = "\n".join([f"Comment by {c['user']} at {c['created_at']}:\n{c['body']}\n" for c in comments_thread])
-    return comments_thread, comments_thread_text
-
+    return comments_thread, format_comments_thread(comments_thread)
 
-def fetch_github_issues(owner, repo, state="open", per_page=30, max_pages=5, token=None,
-                        start_date=None, end_date=None, keywords=None, include_comments=False):
-    """
-    Fetches GitHub issues for a repository using the Search API to filter by creation date, keywords,
-    and optionally includes the full discussion thread (comments).
-
-    Args:
-        owner (str): The repository owner.
-        repo (str): The repository name.
-        state (str): 'open' or 'closed'. Note: Search API doesn't support 'all'.
-        per_page (int): Number of items per page (max 100).
-        max_pages (int): Maximum number of pages to fetch.
-        token (str, optional): A GitHub Personal Access Token.
-        start_date (str, optional): Start date in "YYYY-MM-DD" format.
-        end_date (str, optional): End date in "YYYY-MM-DD" format.
-        keywords (str | list, optional): Keyword(s) to search for in issues' title or body.
-        include_comments (bool): If True, fetches each issue's comment thread.
 
-    Returns:
-        list: A list of issue dictionaries (each may include 'comments_thread' if requested).
-    """
+def format_comments_thread(comments_thread):
+    return "\n".join([f"Comment by {c['user']} at {c['created_at']}:\n{c['body']}\n" for c in comments_thread])
 
-    search_url = "https://api.github.com/search/issues"
-    headers = {"Accept": "application/vnd.github.v3+json"}
-    if token:
-        headers["Authorization"] = f"Bearer {token}"
 
+def build_search_query(owner, repo, state, start_date=None, end_date=None, keywords=None, updated_since=None):
+    """Builds the GitHub issue search string shared by the REST and GraphQL fetchers."""
     query_parts = [
         f"repo:{owner}/{repo}",
         "is:issue",
@@ -70,6 +108,10 @@ def fetch_github_issues(owner, repo, state="open", per_page=30, max_pages=5, tok
     elif end_date:
         query_parts.append(f"created:<{end_date}")
 
+    # Only issues changed since the last crawl
+    if updated_since:
+        query_parts.append(f"updated:>{_format_date(updated_since)}")
+
     # Add keyword search
     if keywords:
         if isinstance(keywords, list):
@@ -78,48 +120,362 @@ def fetch_github_issues(owner, repo, state="open", per_page=30, max_pages=5, tok
             keyword_query = keywords
         query_parts.append(keyword_query)
 
-    query_string = " ".join(query_parts)
+    return " ".join(query_parts)
 
-    issues = []
-    for page in range(1, max_pages + 1):
-        params = {
-            "q": query_string,
-            "sort": "created",
-            "order": "desc",
-            "per_page": per_page,
-            "page": page
+
+def _search_page(token_pool, query_string, page, per_page, cache=None):
+    params = {
+        "q": query_string,
+        "sort": "created",
+        "order": "desc",
+        "per_page": per_page,
+        "page": page
+    }
+    response = token_pool.get(SEARCH_API, params=params, headers=SEARCH_HEADERS, cache=cache)
+    if response.status_code != 200:
+        raise RuntimeError(f"GitHub API error: {response.status_code} {response.text}")
+    return response.json()
+
+
+def _issue_data(issue):
+    return {
+        "number": issue["number"],
+        "title": issue.get("title"),
+        "body": issue.get("body"),
+        "user": issue.get("user", {}).get("login"),
+        "state": issue.get("state"),
+        "labels": [label.get("name") for label in issue.get("labels", [])],
+        "url": issue.get("html_url"),
+        "created_at": issue.get("created_at"),
+        "comments": issue.get("comments", 0),
+        "repository_url": issue.get("repository_url"),
+        "html_url": issue.get("html_url")
+    }
+
+
+def _parse_date(value, end_of_day=False):
+    """Parses "YYYY-MM-DD" or an ISO timestamp; a bare end date covers that whole day."""
+    moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    if end_of_day and len(value) == 10:
+        moment += timedelta(days=1, seconds=-1)
+    return moment
+
+
+def _format_date(moment):
+    return moment.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S+00:00")
+
+
+def _fetchable(per_page, max_pages=None):
+    """How many results of one query can be paged through: the Search API cap, or fewer with `max_pages`."""
+    return min(SEARCH_RESULT_CAP, max_pages * per_page) if max_pages else SEARCH_RESULT_CAP
+
+
+def plan_date_shards(token_pool, owner, repo, state, start_date=None, end_date=None, keywords=None,
+                     per_page=30, cache=None, workers=4, updated_since=None, max_pages=None):
+    """
+    Splits a creation-date window into `created:` sub-ranges that can each be fetched completely.
+
+    Every range is probed with its first result page; a range whose
+    `total_count` is more than can be paged through (the Search API cap,
+    or `max_pages` pages of `per_page` if that is less) is halved and both
+    halves are probed again, level by level with `workers` concurrent requests.
+
+    Returns:
+        list: (query_string, first page JSON) for each shard.
+    """
+    start = _parse_date(start_date) if start_date else GITHUB_EPOCH
+    end = _parse_date(end_date, end_of_day=True) if end_date else datetime.now(timezone.utc).replace(microsecond=0)
+
+    def probe(window):
+        query_string = build_search_query(owner, repo, state, _format_date(window[0]), _format_date(window[1]),
+                                          keywords, updated_since)
+        return query_string, _search_page(token_pool, query_string, 1, per_page, cache)
+
+    limit = _fetchable(per_page, max_pages)
+    shards = []
+    pending = [(start, end)]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while pending:
+            split = []
+            for (low, high), (query_string, data) in zip(pending, executor.map(probe, pending)):
+                if data.get("total_count", 0) <= limit:
+                    shards.append((query_string, data))
+                elif high - low <= timedelta(seconds=1):
+                    # cannot be split any further; `_iter_shard_pages` reports the cut
+                    shards.append((query_string, data))
+                else:
+                    middle = low + (high - low) // 2
+                    middle = middle.replace(microsecond=0)
+                    split += [(low, middle), (middle + timedelta(seconds=1), high)]
+            pending = split
+    print(f"Split the search into {len(shards)} date range(s)")
+    return shards
+
+
+def _report_truncated(query_string, total, fetchable, on_truncated=None):
+    print(f"⚠️ {total} issues match \"{query_string}\", only the first {fetchable} can be fetched")
+    if on_truncated:
+        on_truncated(query_string, total)
+
+
+def _iter_shard_pages(token_pool, query_string, first_page, per_page, max_pages, cache=None, on_truncated=None):
+    """
+    Yields the result items of one shard page by page, starting from its already fetched first page.
+
+    A shard with more results than can be paged through is reported to
+    `on_truncated(query_string, total_count)`.
+    """
+    yield first_page.get("items", [])
+    total = first_page.get("total_count", 0)
+    fetchable = _fetchable(per_page, max_pages)
+    if total > fetchable:
+        _report_truncated(query_string, total, fetchable, on_truncated)
+    last_page = -(-min(total, fetchable) // per_page)
+    for page in range(2, last_page + 1):
+        page_items = _search_page(token_pool, query_string, page, per_page, cache).get("items", [])
+        if not page_items:
+            break
+        yield page_items
+
+
+def _fetch_shard(token_pool, query_string, first_page, per_page, max_pages, cache=None, on_truncated=None):
+    """All result items of one shard, starting from its already fetched first page."""
+    return [item for items in _iter_shard_pages(token_pool, query_string, first_page, per_page, max_pages, cache,
+                                                on_truncated)
+            for item in items]
+
+
+def fetch_github_issues(owner, repo, state="open", per_page=30, max_pages=5, token=None,
+                        start_date=None, end_date=None, keywords=None, include_comments=False, cache=None,
+                        api="rest", token_pool=None, shard_by_date=False, workers=4, updated_since=None,
+                        on_truncated=None):
+    """
+    Fetches GitHub issues for a repository using the Search API to filter by creation date, keywords,
+    and optionally includes the full discussion thread (comments).
+
+    Args:
+        owner (str): The repository owner.
+        repo (str): The repository name.
+        state (str): 'open' or 'closed'. Note: Search API doesn't support 'all'.
+        per_page (int): Number of items per page (max 100).
+        max_pages (int): Maximum number of pages to fetch (per date range when sharding;
+            the ranges are then made small enough to fit).
+        token (str | list, optional): A GitHub Personal Access Token, or several to spread
+            the rate limit over.
+        start_date (str, optional): Start date in "YYYY-MM-DD" format.
+        end_date (str, optional): End date in "YYYY-MM-DD" format.
+        keywords (str | list, optional): Keyword(s) to search for in issues' title or body.
+        include_comments (bool): If True, fetches each issue's comment thread.
+        cache (HttpCache, optional): On-disk HTTP cache; unchanged pages come back as 304s
+            that do not count against the rate limit.
+        api (str): 'rest', or 'graphql' to fetch issues together with their complete
+            comment threads in batched GraphQL queries (requires a token).
+        token_pool (GitHubTokenPool, optional): A pool shared with other fetchers; built from
+            `token` when omitted. Requests wait for the rate limit to reset instead of failing.
+        shard_by_date (bool): If True, splits the date window into `created:` ranges of at
+            most 1000 results each (the Search API cap) and at most `max_pages` pages, so the
+            whole window is fetched.
+        workers (int): Number of date ranges / comment threads fetched concurrently.
+        updated_since (datetime, optional): Only fetch issues updated after this moment (delta crawl).
+        on_truncated (callable, optional): Called with (query_string, total_count) for every
+            search that had more results than could be fetched.
+
+    Returns:
+        list: A list of issue dictionaries (each may include 'comments_thread' if requested).
+    """
+
+    token_pool = token_pool or GitHubTokenPool(token)
+    if shard_by_date:
+        shards = plan_date_shards(token_pool, owner, repo, state, start_date, end_date, keywords,
+                                  per_page, cache, workers, updated_since, max_pages)
+    else:
+        shards = [(build_search_query(owner, repo, state, start_date, end_date, keywords, updated_since), None)]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        if api == "graphql":
+            shard_issues = executor.map(
+                lambda shard: fetch_github_issues_graphql(shard[0], owner, repo, per_page, max_pages, token_pool,
+                                                          include_comments, on_truncated), shards)
+            return _merge_shards(shard_issues)
+
+        shard_items = executor.map(
+            lambda shard: _fetch_shard(token_pool, shard[0],
+                                       shard[1] or _search_page(token_pool, shard[0], 1, per_page, cache),
+                                       per_page, max_pages, cache, on_truncated), shards)
+        items = _merge_shards(shard_items)
+        issues = [_issue_data(issue) for issue in items]
+
+        # Fetch comments if requested
+        if include_comments:
+            with_comments = [(issue, issue_data) for issue, issue_data in zip(items, issues)
+                             if issue.get("comments", 0) > 0]
+            threads = executor.map(
+                lambda pair: fetch_issue_comments(pair[0], SEARCH_HEADERS, cache, token_pool), with_comments)
+            for (_, issue_data), (comments_thread, comments_thread_text) in zip(with_comments, threads):
+                issue_data["comments_thread"] = comments_thread
+                issue_data["comments_thread_text"] = comments_thread_text
+
+    return issues
+
+
+def iter_github_issues(owner, repo, state="open", per_page=30, max_pages=5, token=None,
+                       start_date=None, end_date=None, keywords=None, include_comments=False, cache=None,
+                       api="rest", token_pool=None, shard_by_date=False, workers=4, updated_since=None,
+                       on_truncated=None):
+    """
+    Streaming variant of `fetch_github_issues`: yields issue dicts as search pages arrive.
+
+    Shards are read one after the other and issues seen in an earlier shard
+    are skipped, so only the issue numbers are kept in memory. REST results
+    come without `comments_thread` (`include_comments` only applies to the
+    GraphQL API); fetch threads per issue with `fetch_issue_comments`.
+    The arguments are those of `fetch_github_issues`.
+    """
+    token_pool = token_pool or GitHubTokenPool(token)
+    if shard_by_date:
+        shards = plan_date_shards(token_pool, owner, repo, state, start_date, end_date, keywords,
+                                  per_page, cache, workers, updated_since, max_pages)
+    else:
+        shards = [(build_search_query(owner, repo, state, start_date, end_date, keywords, updated_since), None)]
+
+    seen = set()
+    for query_string, first_page in shards:
+        if api == "graphql":
+            pages = [fetch_github_issues_graphql(query_string, owner, repo, per_page, max_pages, token_pool,
+                                                 include_comments, on_truncated)]
+        else:
+            pages = _iter_shard_pages(token_pool, query_string,
+                                      first_page or _search_page(token_pool, query_string, 1, per_page, cache),
+                                      per_page, max_pages, cache, on_truncated)
+        for items in pages:
+            for issue in items:
+                if issue["number"] in seen:
+                    continue
+                seen.add(issue["number"])
+                yield issue if api == "graphql" else _issue_data(issue)
+
+
+def _merge_shards(shard_results):
+    """Concatenates per-shard issue lists, dropping duplicates by issue number, newest first."""
+    merged = {}
+    for issues in shard_results:
+        for issue in issues:
+            merged.setdefault(issue["number"], issue)
+    return sorted(merged.values(), key=lambda issue: issue.get("created_at") or "",
+                  reverse=True)
+
+
+def _graphql(query, variables, token_pool):
+    response = token_pool.post(GITHUB_GRAPHQL_API, json={"query": query, "variables": variables})
+    if response.status_code != 200:
+        raise RuntimeError(f"GitHub GraphQL error: {response.status_code} {response.text}")
+    data = response.json()
+    if data.get("errors"):
+        raise RuntimeError(f"GitHub GraphQL error: {data['errors']}")
+    return data["data"]
+
+
+def _graphql_comments(nodes):
+    return [
+        {
+            "user": (c.get("author") or {}).get("login", "ghost"),
+            "created_at": c["createdAt"],
+            "body": c["body"]
         }
+        for c in nodes
+    ]
 
-        response = requests.get(search_url, headers=headers, params=params)
-        if response.status_code != 200:
-            raise RuntimeError(f"GitHub API error: {response.status_code} {response.text}")
 
-        data = response.json()
-        items = data.get("items", [])
-        if not items:
+def _fetch_remaining_comments(pending, token_pool):
+    """
+    Pages through the comments of issues whose thread did not fit the first page.
+
+    Up to GRAPHQL_BATCH_SIZE issues are advanced per query using aliased `node` lookups.
+
+    Args:
+        pending (dict): issue node id -> [issue_data, end cursor].
+    """
+    while pending:
+        batch = list(pending.items())[:GRAPHQL_BATCH_SIZE]
+        fragments = "".join(
+            COMMENT_PAGE_FRAGMENT % (f"i{index}", node_id, GRAPHQL_COMMENT_PAGE, cursor)
+            for index, (node_id, (_, cursor)) in enumerate(batch)
+        )
+        data = _graphql("query {%s}" % fragments, {}, token_pool)
+        for index, (node_id, (issue_data, _)) in enumerate(batch):
+            comments = data[f"i{index}"]["comments"]
+            issue_data["comments_thread"].extend(_graphql_comments(comments["nodes"]))
+            if comments["pageInfo"]["hasNextPage"]:
+                pending[node_id][1] = comments["pageInfo"]["endCursor"]
+            else:
+                del pending[node_id]
+
+
+def fetch_github_issues_graphql(query_string, owner, repo, per_page=30, max_pages=5, token_pool=None,
+                                include_comments=False, on_truncated=None):
+    """
+    GraphQL variant of `fetch_github_issues`.
+
+    Each search page returns issues, labels and the first page of comments;
+    longer threads are completed with cursor pagination in batched follow-up
+    queries, so `comments_thread` is never truncated. The returned dicts
+    have the same shape as the REST fetcher's. A search with more pages
+    than `max_pages` is reported to `on_truncated(query_string, None)`.
+    """
+    if token_pool is None or token_pool.tokens == [None]:
+        raise RuntimeError("The GitHub GraphQL API requires a token.")
+    repository_url = f"https://api.github.com/repos/{owner}/{repo}"
+
+    issues = []
+    pending_comments = {}
+    cursor = None
+    for page in range(1, max_pages + 1):
+        variables = {
+            "q": f"{query_string} sort:created-desc",
+            "first": min(per_page, 100),
+            "after": cursor,
+            "withComments": include_comments
+        }
+        search = _graphql(SEARCH_ISSUES_QUERY, variables, token_pool)["search"]
+        nodes = [node for node in search["nodes"] if node]
+        if not nodes:
             break
 
-        for issue in items:
+        for issue in nodes:
             issue_data = {
                 "number": issue["number"],
                 "title": issue.get("title"),
                 "body": issue.get("body"),
-                "user": issue.get("user", {}).get("login"),
-                "state": issue.get("state"),
-                "labels": [label.get("name") for label in issue.get("labels", [])],
-                "url": issue.get("html_url"),
-                "created_at": issue.get("created_at"),
-                "comments": issue.get("comments", 0),
-                "repository_url": issue.get("repository_url"),
-                "html_url": issue.get("html_url")
+                "user": (issue.get("author") or {}).get("login"),
+                "state": issue.get("state", "").lower(),
+                "labels": [label["name"] for label in issue["labels"]["nodes"]],
+                "url": issue.get("url"),
+                "created_at": issue.get("createdAt"),
+                "comments": issue["commentCount"]["totalCount"],
+                "repository_url": repository_url,
+                "html_url": issue.get("url")
             }
 
-            # Fetch comments if requested
-            if include_comments and issue.get("comments", 0) > 0:
-                comments_thread, comments_thread_text = fetch_issue_comments(issue, headers)
-                issue_data["comments_thread"] = comments_thread
-                issue_data["comments_thread_text"] = comments_thread_text
-            
+            if include_comments and issue_data["comments"] > 0:
+                comments = issue["comments"]
+                issue_data["comments_thread"] = _graphql_comments(comments["nodes"])
+                if comments["pageInfo"]["hasNextPage"]:
+                    pending_comments[issue["id"]] = [issue_data, comments["pageInfo"]["endCursor"]]
+
             issues.append(issue_data)
 
+        if not search["pageInfo"]["hasNextPage"]:
+            break
+        if page == max_pages:
+            print(f"⚠️ \"{query_string}\" has more than {max_pages} pages, only those were fetched")
+            if on_truncated:
+                on_truncated(query_string, None)
+        cursor = search["pageInfo"]["endCursor"]
+
+    _fetch_remaining_comments(pending_comments, token_pool)
+    for issue_data in issues:
+        if "comments_thread" in issue_data:
+            issue_data["comments_thread_text"] = format_comments_thread(issue_data["comments_thread"])
     return issues
@@ -0,0 +1,147 @@
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+
+import metrics
+from http_cache import cached_get, fresh_response
+
+# Fallback pause when GitHub signals a secondary rate limit without Retry-After.
+SECONDARY_LIMIT_PAUSE = 60
+# Remaining budget assumed for a token/resource pair before GitHub has reported one.
+UNKNOWN_REMAINING = 1 << 30
+
+
+def retry_after_seconds(value, now):
+    """Parses a Retry-After header, either delta-seconds or an HTTP-date; None if it is neither."""
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - now, 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def resource_for(url):
+    """GitHub keeps separate quotas per resource; the Search API has its own, much smaller one."""
+    if "/graphql" in url:
+        return "graphql"
+    if "/search/" in url:
+        return "search"
+    return "core"
+
+
+class GitHubTokenPool:
+    """
+    Spreads GitHub API requests over a pool of tokens within their rate limits.
+
+    The pool tracks `X-RateLimit-Remaining` / `X-RateLimit-Reset` per token
+    and per resource (core, search, graphql), always picks the token with
+    the most budget left for the resource being called, and sleeps until the
+    earliest reset instead of failing when every token is exhausted.
+    Secondary rate limits (403/429 with `Retry-After`) pause only the
+    offending token. Thread-safe, so concurrent fetchers can share one pool.
+
+    Usage:
+        pool = GitHubTokenPool(["ghp_a", "ghp_b"])
+        response = pool.get("https://api.github.com/search/issues", params={"q": "..."})
+    """
+
+    def __init__(self, tokens=None, max_retries=10):
+        if isinstance(tokens, str):
+            tokens = [tokens]
+        # an anonymous client is a pool of one token-less slot
+        self.tokens = [token for token in (tokens or []) if token] or [None]
+        self.max_retries = max_retries
+        self._remaining = {}  # (token, resource) -> remaining requests
+        self._reset = {}  # (token, resource) -> epoch seconds of the next reset
+        self._paused_until = {}  # token -> epoch seconds
+        self._lock = threading.Lock()
+
+    def _available(self, token, resource, now):
+        if self._paused_until.get(token, 0) > now:
+            return 0
+        key = (token, resource)
+        if key in self._reset and self._reset[key] <= now:
+            # the window has rolled over since GitHub last reported it
+            return UNKNOWN_REMAINING
+        return self._remaining.get(key, UNKNOWN_REMAINING)
+
+    def _next_ready(self, token, resource, now):
+        ready = self._paused_until.get(token, 0)
+        if self._remaining.get((token, resource), 1) <= 0:
+            ready = max(ready, self._reset.get((token, resource), now))
+        return ready
+
+    def acquire(self, resource):
+        """Returns the token with the most budget for `resource`, sleeping until a reset if none has any."""
+        while True:
+            with self._lock:
+                now = time.time()
+                token = max(self.tokens, key=lambda t: self._available(t, resource, now))
+                if self._available(token, resource, now) > 0:
+                    key = (token, resource)
+                    if key in self._remaining and self._reset.get(key, 0) > now:
+                        self._remaining[key] -= 1
+                    return token
+                wake_at = min(self._next_ready(t, resource, now) for t in self.tokens)
+            delay = max(wake_at - time.time(), 0) + 1
+            print(f"⏳ GitHub {resource} rate limit exhausted on all {len(self.tokens)} token(s), "
+                  f"sleeping {delay:.0f}s")
+            time.sleep(delay)
+
+    def update(self, token, response, resource):
+        """Records the budget GitHub reported; returns True if the request was rejected by a rate limit."""
+        headers = response.headers
+        now = time.time()
+        with self._lock:
+            resource = headers.get("X-RateLimit-Resource", resource)
+            if headers.get("X-RateLimit-Remaining") is not None:
+                self._remaining[(token, resource)] = int(headers["X-RateLimit-Remaining"])
+            if headers.get("X-RateLimit-Reset") is not None:
+                self._reset[(token, resource)] = int(headers["X-RateLimit-Reset"])
+
+            if response.status_code not in (403, 429):
+                return False
+            retry_after = headers.get("Retry-After")
+            if retry_after is not None:
+                delay = retry_after_seconds(retry_after, now)
+                self._paused_until[token] = now + (SECONDARY_LIMIT_PAUSE if delay is None else delay)
+                return True
+            if headers.get("X-RateLimit-Remaining") == "0":
+                return True
+            if "secondary rate limit" in response.text.lower():
+                self._paused_until[token] = now + SECONDARY_LIMIT_PAUSE
+                return True
+        return False
+
+    def _send(self, url, send):
+        resource = resource_for(url)
+        for _ in range(self.max_retries):
+            token = self.acquire(resource)
+            with metrics.timer("crawler_github_request_seconds", resource=resource):
+                response = send({"Authorization": f"Bearer {token}"} if token else {})
+            metrics.inc("crawler_github_requests_total", resource=resource, status=response.status_code)
+            if not self.update(token, response, resource):
+                return response
+            metrics.inc("crawler_github_retries_total", resource=resource)
+        return response
+
+    def get(self, url, params=None, headers=None, cache=None, timeout=30):
+        """
+        GET through the pool (and the optional `HttpCache`); rate-limited answers are retried.
+
+        A fresh cache entry is returned without taking a token, so it costs no budget.
+        """
+        fresh = fresh_response(cache, url, params)
+        if fresh is not None:
+            return fresh
+        return self._send(url, lambda auth: cached_get(cache, url, params=params, headers={**(headers or {}), **auth},
+                                                       timeout=timeout))
+
+    def post(self, url, json=None, headers=None, timeout=30):
+        return self._send(url, lambda auth: requests.post(url, json=json, headers={**(headers or {}), **auth},
+                                                          timeout=timeout))
@@ -0,0 +1,284 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import requests
+
+import metrics
+
+DEFAULT_CACHE_FILE = "result/http_cache.sqlite"
+STAT_NAMES = ("fresh_hits", "revalidated", "misses", "bytes_saved")
+
+
+class CachedResponse:
+    """Minimal stand-in for `requests.Response` returned by `cached_get`."""
+
+    def __init__(self, status_code, headers, content, from_cache=False):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.from_cache = from_cache
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Error: {self.text[:200]}")
+
+
+class HttpCache:
+    """
+    On-disk HTTP cache shared by the GitHub and JIRA fetchers.
+
+    Responses are stored in SQLite together with their ETag / Last-Modified
+    validators. An entry younger than `ttl` seconds is served without any
+    request; an older one is revalidated with If-None-Match /
+    If-Modified-Since, so an unchanged resource comes back as a cheap 304
+    (which GitHub does not count against the rate limit). Entries older than
+    `max_age` seconds are dropped and the least recently used ones are evicted
+    once the stored bodies exceed `max_bytes`.
+
+    Attachments are not stored in the database: their entry points at the
+    downloaded file and keeps its line count in `meta`.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_FILE, ttl=3600, max_age=30 * 24 * 3600,
+                 max_bytes=1024 * 1024 * 1024, evict_every=500):
+        self.path = path
+        self.ttl = ttl
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.evict_every = evict_every
+        self._stores_since_evict = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                url TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                body BLOB,
+                local_path TEXT,
+                meta TEXT,
+                size INTEGER,
+                stored_bytes INTEGER,
+                stored_at REAL,
+                accessed_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at);
+            CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER);
+        """)
+        self._conn.commit()
+
+    @classmethod
+    def from_config(cls, cache_config):
+        """Build a cache from the "http_cache" config section, or return None if it is disabled."""
+        if not cache_config or not cache_config.get("enabled", True):
+            return None
+        return cls(
+            path=cache_config.get("path", DEFAULT_CACHE_FILE),
+            ttl=cache_config.get("ttl", 3600),
+            max_age=cache_config.get("max_age_days", 30) * 24 * 3600,
+            max_bytes=cache_config.get("max_mb", 1024) * 1024 * 1024,
+        )
+
+    @staticmethod
+    def cache_key(url, params=None):
+        params = sorted((params or {}).items())
+        return hashlib.sha256(json.dumps([url, params], default=str).encode("utf-8")).hexdigest()
+
+    def close(self):
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT url, etag, last_modified, body, local_path, meta, size, stored_at FROM entries WHERE key = ?",
+                (key,)).fetchone()
+        if row is None:
+            return None
+        url, etag, last_modified, body, local_path, meta, size, stored_at = row
+        return {
+            "key": key, "url": url, "etag": etag, "last_modified": last_modified, "body": body,
+            "local_path": local_path, "meta": json.loads(meta) if meta else {}, "size": size,
+            "stored_at": stored_at,
+        }
+
+    def is_fresh(self, entry):
+        return time.time() - entry["stored_at"] < self.ttl
+
+    @staticmethod
+    def conditional_headers(entry):
+        headers = {}
+        if entry and entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def store(self, key, url, response_headers, body=None, local_path=None, meta=None, size=None):
+        """Stores a 200 response. Responses without validators are still served while fresh."""
+        now = time.time()
+        stored_bytes = len(body) if body is not None else 0
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, url, response_headers.get("ETag"), response_headers.get("Last-Modified"), body,
+                 local_path, json.dumps(meta) if meta else None,
+                 size if size is not None else stored_bytes, stored_bytes, now, now))
+            self._bump("misses", 1)
+            self._conn.commit()
+            self._stores_since_evict += 1
+            evict = self._stores_since_evict >= self.evict_every
+        if evict:
+            self.evict()
+
+    def record_hit(self, entry, revalidated):
+        """Marks a fresh hit or a 304 revalidation and credits the bytes not transferred."""
+        metrics.inc("crawler_http_cache_hits_total", kind="revalidated" if revalidated else "fresh")
+        now = time.time()
+        with self._lock:
+            if revalidated:
+                self._conn.execute("UPDATE entries SET stored_at = ?, accessed_at = ? WHERE key = ?",
+                                   (now, now, entry["key"]))
+            else:
+                self._conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, entry["key"]))
+            self._bump("revalidated" if revalidated else "fresh_hits", 1)
+            self._bump("bytes_saved", entry["size"] or 0)
+            self._conn.commit()
+
+    def _bump(self, name, amount):
+        self._conn.execute(
+            "INSERT INTO stats VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            (name, amount))
+
+    def evict(self):
+        """Drops expired entries, then least recently used ones until the cache fits `max_bytes`."""
+        with self._lock:
+            self._stores_since_evict = 0
+            removed = self._conn.execute("DELETE FROM entries WHERE stored_at < ?",
+                                         (time.time() - self.max_age,)).rowcount
+            total = self._conn.execute("SELECT COALESCE(SUM(stored_bytes), 0) FROM entries").fetchone()[0]
+            if total > self.max_bytes:
+                rows = self._conn.execute("SELECT key, stored_bytes FROM entries ORDER BY accessed_at").fetchall()
+                doomed = []
+                for key, stored_bytes in rows:
+                    if total <= self.max_bytes:
+                        break
+                    doomed.append((key,))
+                    total -= stored_bytes or 0
+                self._conn.executemany("DELETE FROM entries WHERE key = ?", doomed)
+                removed += len(doomed)
+            self._conn.commit()
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.execute("DELETE FROM stats")
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            values = dict(self._conn.execute("SELECT name, value FROM stats").fetchall())
+            entries, stored = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(stored_bytes), 0) FROM entries").fetchone()
+        result = {name: values.get(name, 0) for name in STAT_NAMES}
+        hits = result["fresh_hits"] + result["revalidated"]
+        lookups = hits + result["misses"]
+        result["hit_ratio"] = hits / lookups if lookups else 0.0
+        result["entries"] = entries
+        result["stored_bytes"] = stored
+        return result
+
+
+def fresh_response(cache, url, params=None):
+    """Returns the cached response for a GET while it is fresh, else None; no request is sent."""
+    if cache is None:
+        return None
+    entry = cache.get(cache.cache_key(url, params))
+    if entry and entry["body"] is not None and cache.is_fresh(entry):
+        cache.record_hit(entry, revalidated=False)
+        return CachedResponse(200, {}, entry["body"], from_cache=True)
+    return None
+
+
+def cached_get(cache, url, params=None, headers=None, timeout=30):
+    """
+    `requests.get` through an `HttpCache`.
+
+    With `cache=None` this is a plain request. Only 200 responses are stored;
+    anything else is returned as is.
+
+    Returns:
+        CachedResponse
+    """
+    if cache is None:
+        response = requests.get(url, params=params, headers=headers, timeout=timeout)
+        return CachedResponse(response.status_code, response.headers, response.content)
+
+    fresh = fresh_response(cache, url, params)
+    if fresh is not None:
+        return fresh
+
+    key = cache.cache_key(url, params)
+    entry = cache.get(key)
+    request_headers = dict(headers or {})
+    if entry and entry["body"] is not None:
+        request_headers.update(cache.conditional_headers(entry))
+    response = requests.get(url, params=params, headers=request_headers, timeout=timeout)
+    if response.status_code == 304 and entry:
+        cache.record_hit(entry, revalidated=True)
+        return CachedResponse(200, response.headers, entry["body"], from_cache=True)
+    if response.status_code == 200:
+        cache.store(key, url, response.headers, body=response.content)
+    return CachedResponse(response.status_code, response.headers, response.content)
+
+
+def format_bytes(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or maintain the crawler HTTP cache.")
+    parser.add_argument("command", choices=["stats", "evict", "clear"])
+    parser.add_argument("--db", default=DEFAULT_CACHE_FILE, help="Path of the cache database.")
+    args = parser.parse_args()
+
+    cache = HttpCache(args.db)
+    if args.command == "evict":
+        print(f"Evicted {cache.evict()} entries.")
+    elif args.command == "clear":
+        cache.clear()
+        print("Cache cleared.")
+    else:
+        stats = cache.stats()
+        print(f"Entries:      {stats['entries']} ({format_bytes(stats['stored_bytes'])} stored)")
+        print(f"Fresh hits:   {stats['fresh_hits']}")
+        print(f"304 hits:     {stats['revalidated']}")
+        print(f"Misses:       {stats['misses']}")
+        print(f"Hit ratio:    {stats['hit_ratio']:.1%}")
+        print(f"Bytes saved:  {format_bytes(stats['bytes_saved'])}")
+    cache.close()
+
+
+if __name__ == "__main__":
+    main()
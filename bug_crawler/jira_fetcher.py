@@ -0,0 +1,176 @@
+import asyncio
+import os
+from collections import deque
+
+import aiohttp
+
+from log_access import archive_kind, expand_archive
+from watermark import jql_latest_updated_first, parse_jira_time
+
+
+async def _read_json(response):
+    return await response.json(content_type=None)
+
+
+async def fetch_search_page(engine, search_api, jql, start_at, page_size, fields=None):
+    """
+    One JIRA search page: the response JSON with `issues`, `total` and `maxResults`.
+
+    Always asked of JIRA, past the HTTP cache: a cached page would replay
+    the search as it was when cached and hide issues updated since, which
+    is exactly what reruns and delta crawls come for.
+    """
+    params = {
+        "jql": jql,
+        "startAt": start_at,
+        "maxResults": page_size
+    }
+    if fields:
+        params["fields"] = ",".join(fields)
+    data = await engine.request(search_api, _read_json, params=params)
+    print(f"Fetched {len(data.get('issues', []))} issues (startAt={start_at})")
+    return data
+
+
+async def latest_update(engine, search_api, jql):
+    """
+    The latest `updated` time of the issues matching `jql`, in JIRA's own timezone, or None if none match.
+
+    Used as the delta crawl watermark, so the next `updated >=` query is
+    read against the same clock and timezone as the one that produced it.
+    """
+    params = {"jql": jql_latest_updated_first(jql), "startAt": 0, "maxResults": 1, "fields": "updated"}
+    # past the HTTP cache: a cached answer would be as old as the cache entry
+    data = await engine.request(search_api, _read_json, params=params)
+    issues = data.get("issues") or []
+    if not issues or not issues[0].get("fields", {}).get("updated"):
+        return None
+    return parse_jira_time(issues[0]["fields"]["updated"])
+
+
+async def iter_search_pages(engine, search_api, jql, page_size, max_total_issues, fan_out=4, fields=None):
+    """
+    Pages through a JIRA search and yields the issues page by page.
+
+    The first page is fetched alone to learn `total`; the remaining `startAt`
+    offsets are independent and are fetched concurrently, at most `fan_out`
+    at a time. Pages are yielded in `startAt` order as soon as they (and all
+    pages before them) have arrived, so callers can process results while the
+    rest of the search is still in flight. For a stable order across pages
+    the JQL should end with an explicit `ORDER BY`.
+
+    Args:
+        engine (CrawlEngine): The shared HTTP engine.
+        search_api (str): The JIRA search endpoint.
+        jql (str): The JQL query.
+        page_size (int): Requested `maxResults` per page.
+        max_total_issues (int): Stop after this many issues.
+        fan_out (int): Maximum number of pages fetched concurrently.
+        fields (list, optional): Issue fields to return, e.g. ["summary", "attachment"].
+            Defaults to JIRA's full navigable field set.
+    Yields:
+        list: The issues of one search page.
+    """
+    async def fetch_page(start_at):
+        return await fetch_search_page(engine, search_api, jql, start_at, page_size, fields)
+
+    first = await fetch_page(0)
+    issues = first.get("issues", [])
+    if not issues:
+        return
+    yield issues
+
+    # the server may cap maxResults below what was requested
+    step = first.get("maxResults") or page_size
+    total = min(first.get("total", 0), max_total_issues)
+    offsets = iter(range(step, total, step))
+    pending = deque()
+    try:
+        for start_at in offsets:
+            pending.append(asyncio.ensure_future(fetch_page(start_at)))
+            if len(pending) >= fan_out:
+                break
+        while pending:
+            data = await pending.popleft()
+            start_at = next(offsets, None)
+            if start_at is not None:
+                pending.append(asyncio.ensure_future(fetch_page(start_at)))
+            issues = data.get("issues", [])
+            if issues:
+                yield issues
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def attachment_save_path(log_save_path, issue_key, attachment_file_name):
+    return os.path.join(log_save_path, issue_key, attachment_file_name)
+
+
+async def fetch_attachments_with_linecount(engine, issue_detail_api, issue, log_save_path=None,
+                                           expand_archives=False):
+    """
+    Downloads the attachments of one JIRA issue and counts the lines of each attachment.
+
+    The attachment list is read from the issue itself when the search asked
+    for the `attachment` field; only otherwise is the issue detail API called.
+
+    Each attachment is downloaded exactly once and streamed to
+    `<log_save_path>/<issue_key>/<file name>`, so later stages read the local
+    copy instead of downloading it again. Without `log_save_path` the
+    attachment is streamed and counted but not stored.
+
+    With `expand_archives`, a stored `.gz`, `.zip` or tarball attachment is
+    stream-decompressed next to it and replaced in the result by its member
+    files, linked as `<attachment url>!<member name>`, each with its own line
+    count.
+
+    An attachment the server refuses for good (a 4xx such as a deleted
+    attachment) gets the line count "N/A". Any other failure, of the issue
+    detail or of a download that ran out of retries, is raised, so the
+    issue counts as failed and is crawled again next time.
+
+    Args:
+        engine (CrawlEngine): The shared HTTP engine.
+        issue_detail_api (str): Issue detail endpoint, the issue key is appended to it.
+        issue (dict): A search result issue, or just its key, e.g. "FLINK-20663".
+        log_save_path (str, optional): Root folder for downloaded attachments.
+        expand_archives (bool): Expose the files inside compressed attachments.
+    Returns:
+        tuple: (issue_key, [(attachment_link, attachment_file_name, line_count, local_path)]).
+        `local_path` is None when the attachment was not stored.
+    """
+    if isinstance(issue, str):
+        issue = {"key": issue}
+    issue_key = issue["key"]
+    fields = issue.get("fields", {})
+    if "attachment" not in fields:
+        fields = (await engine.get_json(f"{issue_detail_api}{issue_key}")).get("fields", {})
+    attachments = fields.get("attachment") or []
+    result = []
+
+    for att in attachments:
+        att_url = att["content"]
+        att_file_name = att['filename']
+        local_path = attachment_save_path(log_save_path, issue_key, att_file_name) if log_save_path else None
+        try:
+            line_count, _ = await engine.download(att_url, local_path)
+        except aiohttp.ClientResponseError as e:
+            if not 400 <= e.status < 500 or e.status in (408, 429):
+                raise
+            print(f"⚠️ 附件无法获取：{att_url}，Error：{e}")
+            line_count = "N/A"
+            local_path = None
+
+        if expand_archives and local_path and archive_kind(att_file_name):
+            try:
+                members = await asyncio.to_thread(expand_archive, local_path)
+                result.extend((f"{att_url}!{member_name}", member_name, member_lines, member_path)
+                              for member_name, member_path, member_lines in members)
+                continue
+            except Exception as e:
+                print(f"⚠️ 压缩附件无法解压：{att_url}，Error：{e}")
+
+        result.append((att_url, att_file_name, line_count, local_path))
+
+    return issue_key, result
@@ -0,0 +1,172 @@
+import gzip
+import json
+import os
+import tarfile
+import zipfile
+
+READ_CHUNK_SIZE = 1024 * 1024
+MAX_ARCHIVE_MEMBERS = 500
+MAX_EXPANDED_BYTES = 8 * 1024 * 1024 * 1024
+MANIFEST_FILE = ".manifest.json"
+
+
+class LineCounter:
+    """Counts lines over a stream of byte chunks; a final line without a trailing newline counts too."""
+
+    def __init__(self):
+        self.newlines = 0
+        self.size = 0
+        self._last_byte = b"\n"
+
+    def update(self, chunk):
+        if chunk:
+            self.newlines += chunk.count(b"\n")
+            self.size += len(chunk)
+            self._last_byte = chunk[-1:]
+
+    @property
+    def lines(self):
+        return self.newlines + (self._last_byte != b"\n")
+
+
+def archive_kind(file_name):
+    """'tar', 'zip' or 'gz' for a compressed attachment name, None for anything else."""
+    name = file_name.lower()
+    if name.endswith((".tar.gz", ".tgz", ".tar.bz2", ".tar.xz", ".tar")):
+        return "tar"
+    if name.endswith(".zip"):
+        return "zip"
+    if name.endswith(".gz"):
+        return "gz"
+    return None
+
+
+def open_log(path):
+    """Opens a log for binary reading, decompressing a single-file `.gz` on the fly."""
+    if archive_kind(path) == "gz":
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def iter_chunks(path, chunk_size=READ_CHUNK_SIZE):
+    with open_log(path) as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            yield chunk
+
+
+def count_lines(path, chunk_size=READ_CHUNK_SIZE):
+    """Line count of a (possibly gzipped) file, holding one chunk in memory at a time."""
+    counter = LineCounter()
+    for chunk in iter_chunks(path, chunk_size):
+        counter.update(chunk)
+    return counter.lines
+
+
+def iter_line_chunks(path, chunk_size=READ_CHUNK_SIZE, max_line=4 * READ_CHUNK_SIZE):
+    """
+    Yields `(offset, chunk)` pairs whose chunks end at a line boundary.
+
+    A line longer than `max_line` bytes is cut, so memory stays bounded even
+    for files without newlines.
+    """
+    offset = 0
+    buffer = b""
+    for chunk in iter_chunks(path, chunk_size):
+        buffer += chunk
+        cut = buffer.rfind(b"\n") + 1
+        if cut == 0:
+            if len(buffer) < max_line:
+                continue  # wait for the end of an overlong line
+            cut = len(buffer)
+        yield offset, buffer[:cut]
+        offset += cut
+        buffer = buffer[cut:]
+    if buffer:
+        yield offset, buffer
+
+
+def _member_path(dest_dir, member_name):
+    """Destination of an archive member, refusing absolute paths and `..` escapes."""
+    relative = os.path.normpath(member_name.replace("\\", "/")).lstrip("/")
+    if relative.startswith("..") or os.path.isabs(relative):
+        raise ValueError(f"unsafe archive member name: {member_name}")
+    return os.path.join(dest_dir, relative)
+
+
+def _copy_counting(src, dest_path, budget):
+    """Streams `src` to `dest_path` while counting lines; returns (line_count, size)."""
+    os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+    counter = LineCounter()
+    part_path = dest_path + ".part"
+    with open(part_path, "wb") as out:
+        for chunk in iter(lambda: src.read(READ_CHUNK_SIZE), b""):
+            counter.update(chunk)
+            if counter.size > budget:
+                out.close()
+                os.remove(part_path)
+                raise ValueError("archive expands beyond the size limit")
+            out.write(chunk)
+    os.replace(part_path, dest_path)
+    return counter.lines, counter.size
+
+
+def _iter_members(archive_path, kind):
+    """Yields `(member_name, readable binary stream)` for every regular file of an archive."""
+    if kind == "gz":
+        with gzip.open(archive_path, "rb") as src:
+            yield os.path.basename(archive_path)[:-3], src
+    elif kind == "zip":
+        with zipfile.ZipFile(archive_path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    with archive.open(info) as src:
+                        yield info.filename, src
+    else:
+        # stream mode reads the tarball front to back once, never seeking
+        with tarfile.open(archive_path, "r|*") as archive:
+            for member in archive:
+                if member.isfile():
+                    yield member.name, archive.extractfile(member)
+
+
+def expand_archive(archive_path, dest_dir=None, max_members=MAX_ARCHIVE_MEMBERS, max_bytes=MAX_EXPANDED_BYTES):
+    """
+    Stream-decompresses a `.gz`, `.zip` or tarball attachment into `dest_dir`.
+
+    Members are copied chunk by chunk while their lines are counted, so
+    neither the archive nor a member is ever held in memory. A manifest
+    written next to the members lets a later run reuse the expansion of an
+    unchanged archive.
+
+    Args:
+        archive_path (str): The downloaded archive.
+        dest_dir (str, optional): Where members go; defaults to `<archive_path>.d`.
+        max_members (int): Members beyond this number are ignored.
+        max_bytes (int): Total expanded size at which expansion is aborted.
+    Returns:
+        list: [(member_name, local_path, line_count)], or [] if the file is not an archive.
+    """
+    kind = archive_kind(archive_path)
+    if kind is None:
+        return []
+    dest_dir = dest_dir or archive_path + ".d"
+    manifest_path = os.path.join(dest_dir, MANIFEST_FILE)
+    if os.path.exists(manifest_path) and os.path.getmtime(manifest_path) >= os.path.getmtime(archive_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return [tuple(member) for member in json.load(f)]
+
+    members = []
+    budget = max_bytes
+    for member_name, src in _iter_members(archive_path, kind):
+        if len(members) >= max_members:
+            print(f"⚠️ {archive_path}: 仅展开前 {max_members} 个文件")
+            break
+        local_path = _member_path(dest_dir, member_name)
+        line_count, size = _copy_counting(src, local_path, budget)
+        budget -= size
+        members.append((member_name, local_path, line_count))
+
+    os.makedirs(dest_dir, exist_ok=True)
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(members, f, ensure_ascii=False)
+    return members
@@ -0,0 +1,225 @@
+import heapq
+import re
+from collections import Counter, deque
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:  # fall back to a character estimate
+    tiktoken = None
+
+# Lines that point at the memory problem itself; kept with the widest neighbourhood.
+MEMORY_PATTERN = re.compile(
+    r"OutOfMemory|GC overhead|oom[-_ ]?kill|Killed process|java heap space|heap dump|"
+    r"Direct buffer memory|Metaspace|memory limit|Cannot allocate memory|#instances",
+    re.IGNORECASE)
+# Generic failures; kept, with a smaller neighbourhood.
+ERROR_PATTERN = re.compile(r"\b(ERROR|FATAL|SEVERE)\b|Exception|Caused by|Traceback")
+STACK_FRAME_PATTERN = re.compile(r"^\s+(at \S|\.\.\. \d+ more)|^\s+File \".*\", line \d+")
+# Variable parts of a line, masked to build its template.
+VARIABLE_PATTERN = re.compile(
+    r"[A-Za-z0-9+/]{20,}={0,2}|\b0x[0-9a-fA-F]+\b|\b[0-9a-fA-F]{8,}\b|\d+(?:\.\d+)?")
+
+MAX_LINE_CHARS = 400
+MAX_STACK_FRAMES = 200
+MAX_CANDIDATES = 20000
+TOP_TEMPLATES = 15
+
+
+@lru_cache(maxsize=None)
+def _encoding(model):
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # the encoding files are downloaded on first use
+        print(f"⚠️ tiktoken encoding unavailable, estimating tokens instead: {e}")
+        return None
+
+
+def count_tokens(text, model="gpt-4"):
+    """Counts tokens with tiktoken when it is available, otherwise estimates 4 characters per token."""
+    encoding = _encoding(model)
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def line_template(line):
+    return VARIABLE_PATTERN.sub("<N>", line)
+
+
+def clip(line):
+    if len(line) <= MAX_LINE_CHARS:
+        return line
+    return f"{line[:MAX_LINE_CHARS]}…[+{len(line) - MAX_LINE_CHARS} chars]"
+
+
+def _collapsed_entries(lines, repeat_limit, template_counts, totals):
+    """
+    Turns raw lines into entries `(first_line_no, text, count)`.
+
+    Consecutive lines with the same template become one entry with a count,
+    a stack trace identical to an earlier one is replaced by a one-line
+    reference, and a template already seen `repeat_limit` times is dropped
+    (it is reported in the template summary instead). Memory lines are
+    never dropped.
+    """
+    seen_stacks = set()
+    stack = []
+    run = None  # [line_no, text, template, count]
+
+    def flush_run():
+        nonlocal run
+        if run:
+            yield run[0], run[1], run[3]
+            run = None
+
+    def flush_stack():
+        if not stack:
+            return
+        key = tuple(template for _, _, template in stack)
+        if key in seen_stacks:
+            yield stack[0][0], f"\t[... same {len(stack)}-frame stack trace as above]", 1
+        else:
+            seen_stacks.add(key)
+            for line_no, text, _ in stack[:MAX_STACK_FRAMES]:
+                yield line_no, text, 1
+            if len(stack) > MAX_STACK_FRAMES:
+                yield stack[MAX_STACK_FRAMES][0], f"\t[... {len(stack) - MAX_STACK_FRAMES} more frames]", 1
+        stack.clear()
+
+    for line_no, line in enumerate(lines, start=1):
+        totals["lines"] = line_no
+        line = clip(line.rstrip("\r\n"))
+        template = line_template(line)
+        if STACK_FRAME_PATTERN.match(line):
+            yield from flush_run()
+            stack.append((line_no, line, template))
+            continue
+        yield from flush_stack()
+
+        if run and run[2] == template:
+            run[3] += 1
+            continue
+        yield from flush_run()
+
+        if len(template_counts) < MAX_CANDIDATES or template in template_counts:
+            template_counts[template] += 1
+        if template_counts[template] > repeat_limit and not MEMORY_PATTERN.search(line):
+            continue
+        run = [line_no, line, template, 1]
+
+    yield from flush_stack()
+    yield from flush_run()
+
+
+def reduce_log(file_path, token_budget=6000, model="gpt-4", head_lines=40, tail_lines=80,
+               memory_context=30, error_context=5, repeat_limit=3):
+    """
+    Reduces a log file to a plaintext excerpt that fits `token_budget` tokens.
+
+    The file is read line by line, so memory stays bounded whatever its size.
+    Repeated lines and stack traces are collapsed into templates with counts,
+    and the excerpt keeps the head and the tail of the log plus the
+    neighbourhoods of memory (OOM, GC, killed process, heap histogram) and
+    error lines. Each kept entry gets a rank (0 for memory lines, growing
+    with the distance from them and from the ends of the file); the
+    excerpt includes the entries with the lowest ranks that still fit the
+    budget, measured with a real tokenizer when tiktoken is installed.
+
+    Returns:
+        str: The reduced log, with gaps marked as "[... N lines omitted ...]".
+    """
+    template_counts = Counter()
+    candidates = {}  # entry index -> [rank, line_no, text, count]
+    pre_context = deque(maxlen=memory_context)
+    tail = deque(maxlen=tail_lines)
+    follow = []  # [remaining, rank offset, rank step, length] of each open neighbourhood
+    totals = {"lines": 0}
+
+    def keep(index, entry, rank):
+        current = candidates.get(index)
+        if current is None:
+            candidates[index] = [rank, *entry]
+        elif rank < current[0]:
+            current[0] = rank
+
+    with open(file_path, "r", encoding="utf-8", errors="replace") as f:
+        for index, entry in enumerate(_collapsed_entries(f, repeat_limit, template_counts, totals)):
+            text = entry[1]
+            if index < head_lines:
+                keep(index, entry, index)
+            if MEMORY_PATTERN.search(text):
+                keep(index, entry, 0)
+                for distance, (prev_index, prev_entry) in enumerate(reversed(pre_context), start=1):
+                    keep(prev_index, prev_entry, distance)
+                follow.append([memory_context, 0, 1, memory_context])
+            elif ERROR_PATTERN.search(text):
+                keep(index, entry, 10)
+                for distance, (prev_index, prev_entry) in enumerate(reversed(pre_context), start=1):
+                    if distance > error_context:
+                        break
+                    keep(prev_index, prev_entry, 10 + 3 * distance)
+                follow.append([error_context, 10, 3, error_context])
+            elif follow:
+                keep(index, entry, min(offset + step * (length - remaining + 1)
+                                       for remaining, offset, step, length in follow))
+            for window in follow:
+                window[0] -= 1
+            follow = [window for window in follow if window[0] > 0]
+            pre_context.append((index, entry))
+            tail.append((index, entry))
+            if len(candidates) > 2 * MAX_CANDIDATES:
+                best = heapq.nsmallest(MAX_CANDIDATES, candidates.items(), key=lambda item: item[1][0])
+                candidates = dict(best)
+
+    for distance, (index, entry) in enumerate(reversed(tail)):
+        keep(index, entry, distance)
+
+    header = _template_summary(template_counts, repeat_limit)
+    ranks = sorted({candidate[0] for candidate in candidates.values()})
+    budget = token_budget - count_tokens(header, model)
+
+    # binary search the largest rank threshold whose excerpt fits the budget
+    best_text = ""
+    low, high = 0, len(ranks) - 1
+    while low <= high:
+        middle = (low + high) // 2
+        text = _render(candidates, ranks[middle], totals["lines"])
+        if count_tokens(text, model) <= budget:
+            best_text = text
+            low = middle + 1
+        else:
+            high = middle - 1
+    return header + best_text
+
+
+def _template_summary(template_counts, repeat_limit):
+    repeated = [(count, template) for template, count in template_counts.most_common(TOP_TEMPLATES)
+                if count > repeat_limit]
+    if not repeated:
+        return ""
+    lines = ["== Most frequent line templates (variable parts shown as <N>) =="]
+    lines += [f"{count}× {template[:200]}" for count, template in repeated]
+    return "\n".join(lines) + "\n\n== Log excerpt ==\n"
+
+
+def _render(candidates, max_rank, total_lines):
+    lines = []
+    next_line_no = 1
+    for index in sorted(candidates):
+        rank, line_no, text, count = candidates[index]
+        if rank > max_rank:
+            continue
+        if line_no > next_line_no:
+            lines.append(f"[... {line_no - next_line_no} lines omitted ...]")
+        lines.append(text if count == 1 else f"{text}  [×{count} similar lines]")
+        next_line_no = line_no + count
+    if total_lines >= next_line_no:
+        lines.append(f"[... {total_lines - next_line_no + 1} lines omitted ...]")
+    return "\n".join(lines)
@@ -0,0 +1,107 @@
+import argparse
+import os
+import re
+
+from log_access import iter_line_chunks
+
+SCAN_CHUNK_SIZE = 1024 * 1024
+MAX_OFFSETS = 5
+
+# Memory signatures: label -> pattern, matched against the lower-cased log
+# and its file name. They are compiled into one alternation, so a log is
+# scanned once whatever the number of signatures. Only evidence of an actual
+# OOM or crash counts: memory settings and usage figures appear in every
+# healthy JVM or Hadoop log and in source patches, and would send them all to
+# GPT (tests/test_log_scanner.py checks both sides).
+SIGNATURES = {
+    "OutOfMemoryError": rb"outofmemoryerror|outofdirectmemoryerror",
+    "GC overhead limit": rb"gc overhead limit exceeded",
+    "Java heap space": rb"java heap space",
+    "Direct buffer memory": rb"direct buffer memory|failed to allocate direct memory",
+    "Native thread limit": rb"unable to create (?:new )?native thread",
+    "Native memory": rb"out of swap space|native memory allocation \(\w+\) failed|"
+                     rb"insufficient memory for the java runtime",
+    "Heap dump": rb"dumping heap to|heapdumponoutofmemoryerror",
+    "Heap histogram": rb"num\s+#instances\s+#bytes\s+class name",
+    "OOMKilled": rb"oomkilled|oom[-_ ]?kill(?:er|ed)?\b|memory cgroup out of memory",
+    "Killed process": rb"killed process \d+",
+    "Exit code 137": rb"exit (?:code|status)(?: is|:|=)? ?137\b|exited with (?:code|status) 137\b",
+    "Cannot allocate memory": rb"cannot allocate memory|std::bad_alloc|\bmemoryerror\b",
+    "Allocation failure": rb"(?:failed to|unable to|could not|cannot) allocate (?:memory|\d+ bytes)|out of memory",
+    "Memory limit exceeded": rb"running beyond (?:physical|virtual) memory|memory limit exceeded",
+    "Memory leak": rb"memory leak|leaksanitizer|definitely lost:",
+    "Process crash": rb"segmentation fault|\bsig(?:segv|bus)\b|core dumped|double free|"
+                     rb"heap-(?:use-after-free|buffer-overflow)|hs_err_pid|exception_access_violation",
+}
+# Every signature contains one of these literals; a chunk without any of
+# them is skipped with a few substring searches instead of a regex pass.
+ANCHORS = (b"memory", b"heap", b"oom", b"kill", b"alloc", b"leak", b"overhead", b"#instances", b"native thread",
+           b"definitely lost", b"out of swap", b"exit code", b"exit status", b"exited with", b"segmentation",
+           b"sigsegv", b"sigbus", b"core dumped", b"double free", b"hs_err", b"access_violation")
+SIGNATURE_PATTERN = re.compile(b"|".join(SIGNATURES.values()))
+_LABELLED_PATTERNS = [(label, re.compile(pattern)) for label, pattern in SIGNATURES.items()]
+
+
+def _label(text):
+    for label, pattern in _LABELLED_PATTERNS:
+        if pattern.fullmatch(text):
+            return label
+
+
+def scan_log(file_path, max_offsets=MAX_OFFSETS):
+    """
+    Scans a log for memory signatures with constant memory.
+
+    The file (or the decompressed stream of a `.gz`) is read in binary
+    chunks cut at line boundaries; chunks that contain one of the ANCHORS
+    literals are matched against all signatures at once. The file name is
+    matched too, since reporters often name the evidence
+    ("oomkilled_taskmanager.log", "hs_err_pid1234.log"); such hits are labelled
+    "<label> (file name)" and have no offsets.
+
+    Returns:
+        dict: signature label -> [match count, byte offsets of the first `max_offsets` matches],
+            empty if the log shows no memory evidence.
+    """
+    matches = {}
+    for match in SIGNATURE_PATTERN.finditer(os.path.basename(file_path).lower().encode("utf-8", "replace")):
+        matches.setdefault(f"{_label(match.group())} (file name)", [1, []])
+    for base, chunk in iter_line_chunks(file_path, SCAN_CHUNK_SIZE):
+        text = chunk.lower()
+        if not any(anchor in text for anchor in ANCHORS):
+            continue
+        for match in SIGNATURE_PATTERN.finditer(text):
+            found = matches.setdefault(_label(match.group()), [0, []])
+            found[0] += 1
+            if len(found[1]) < max_offsets:
+                found[1].append(base + match.start())
+    return matches
+
+
+def format_signatures(matches):
+    """One spreadsheet cell: "label ×count @offset,offset; ...", or "none"."""
+    if not matches:
+        return "none"
+    return "; ".join(f"{label} ×{count}" + (f" @{','.join(map(str, offsets))}" if offsets else "")
+                     for label, (count, offsets) in sorted(matches.items(), key=lambda item: -item[1][0]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scan log files for memory signatures.")
+    parser.add_argument("paths", nargs="+", help="Log files or directories (scanned recursively).")
+    args = parser.parse_args()
+
+    scanned = flagged = 0
+    for path in args.paths:
+        files = [path] if os.path.isfile(path) else sorted(
+            os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+        for file_path in files:
+            matches = scan_log(file_path)
+            scanned += 1
+            flagged += bool(matches)
+            print(f"{file_path}\t{format_signatures(matches)}")
+    print(f"{flagged}/{scanned} file(s) with memory signatures")
+
+
+if __name__ == "__main__":
+    main()
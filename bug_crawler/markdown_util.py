@@ -1,35 +1,187 @@
-def dict_to_markdown_list(obj, indent=0):
-    """
-    Recursively converts a dictionary or list into a markdown nested list string.
-    """
-    markdown = ""
-    prefix = "  " * indent + "- "  # Markdown list prefix with indentation
+import io
+import os
+import re
+
+_END = object()
+
 
+def _entries(obj):
+    """(label, value) pairs of a dict or list; list scalars have no label."""
     if isinstance(obj, dict):
-        for key, value in obj.items():
-            if isinstance(value, (dict, list)):
-                markdown += f"{prefix}{key}:\n"
-                markdown += dict_to_markdown_list(value, indent + 1)
-            else:
-                markdown += f"{prefix}{key}: {value}\n"
+        yield from obj.items()
     elif isinstance(obj, list):
         for i, value in enumerate(obj):
-            if isinstance(value, (dict, list)):
-                markdown += f"{prefix}Item {i+1}:\n"
-                markdown += dict_to_markdown_list(value, indent + 1)
-            else:
-                markdown += f"{prefix}{value}\n"
-    return markdown
+            yield (f"Item {i+1}" if isinstance(value, (dict, list)) else None), value
+
+
+def write_markdown_list(f, obj, indent=0):
+    """
+    Writes a dictionary or list to the file `f` as a markdown nested list.
+
+    Nesting is walked with an explicit stack instead of recursion, so deep
+    structures cannot hit the recursion limit, and every line goes straight
+    to `f`, so the output is never built up in memory.
+    """
+    stack = [(_entries(obj), indent)]
+    while stack:
+        entries, level = stack[-1]
+        entry = next(entries, _END)
+        if entry is _END:
+            stack.pop()
+            continue
+        label, value = entry
+        prefix = "  " * level + "- "  # Markdown list prefix with indentation
+        if isinstance(value, (dict, list)):
+            f.write(f"{prefix}{label}:\n")
+            stack.append((_entries(value), level + 1))
+        elif label is None:
+            f.write(f"{prefix}{value}\n")
+        else:
+            f.write(f"{prefix}{label}: {value}\n")
+
+
+def dict_to_markdown_list(obj, indent=0):
+    """
+    Converts a dictionary or list into a markdown nested list string.
+    """
+    buffer = io.StringIO()
+    write_markdown_list(buffer, obj, indent)
+    return buffer.getvalue()
+
+
+def _file_name(name):
+    return re.sub(r"[^A-Za-z0-9._-]", "_", str(name)) + ".md"
+
+
+class MarkdownReportWriter:
+    """
+    Writes a markdown report one issue at a time.
 
+    Without sharding the report is the single file `output_file`. With
+    `shard_size`, every `shard_size` issues go to their own file, and with
+    `shard_by_key` every issue does; the files are written to the folder
+    `<output_file without .md>/` and `output_file` becomes an index page
+    linking to them. Index lines are appended as each shard is closed, so
+    only the open shard is tracked, however many issues are written.
 
-def json_list_to_markdown(json_list, output_file="report.md"):
+    Usage:
+        with MarkdownReportWriter("report.md", shard_size=1000) as report:
+            for issue in issues:
+                report.write(issue["key"], issue)
     """
-    Takes a list of JSON-like objects (dicts) and writes them as markdown nested lists.
+
+    def __init__(self, output_file="report.md", title="JSON Report", shard_size=None, shard_by_key=False):
+        self.output_file = output_file
+        self.title = title
+        self.shard_size = shard_size
+        self.shard_by_key = shard_by_key
+        self.shard_dir = os.path.splitext(output_file)[0]
+        self.count = 0
+        self.shards = 0
+        self._index = None
+        self._file = None
+        self._shard_path = None
+        self._shard_count = 0
+        self._shard_keys = None
+
+    @property
+    def sharded(self):
+        return bool(self.shard_size) or self.shard_by_key
+
+    def open(self):
+        os.makedirs(os.path.dirname(self.output_file) or ".", exist_ok=True)
+        if self.sharded:
+            os.makedirs(self.shard_dir, exist_ok=True)
+            self._index = open(self.output_file, "w", encoding="utf-8")
+            self._index.write(f"# {self.title}\n\n")
+        else:
+            self._file = open(self.output_file, "w", encoding="utf-8")
+            self._file.write(f"# {self.title}\n\n")
+        return self
+
+    def _open_shard(self, key):
+        self.shards += 1
+        if self.shard_by_key:
+            self._shard_path = os.path.join(self.shard_dir, _file_name(key))
+            heading = f"# {key}"
+        else:
+            self._shard_path = os.path.join(self.shard_dir, f"part-{self.shards:04d}.md")
+            heading = f"# {self.title} (part {self.shards})"
+        self._file = open(self._shard_path, "w", encoding="utf-8")
+        self._file.write(f"{heading}\n\n")
+        self._shard_count = 0
+        self._shard_keys = (key, key)
+
+    def _close_shard(self):
+        self._file.close()
+        self._file = None
+        link = os.path.relpath(self._shard_path, os.path.dirname(self.output_file) or ".").replace(os.sep, "/")
+        if self.shard_by_key:
+            self._index.write(f"- [{self._shard_keys[0]}]({link})\n")
+        else:
+            first, last = self._shard_keys
+            name = os.path.splitext(os.path.basename(self._shard_path))[0]
+            self._index.write(f"- [{name}]({link}): {self._shard_count} issues ({first} … {last})\n")
+        self._index.flush()
+
+    def write(self, key, obj):
+        """Appends one section, `## key` followed by `obj` as a nested list."""
+        if self.sharded:
+            if self._file is not None and (self.shard_by_key or self._shard_count >= self.shard_size):
+                self._close_shard()
+            if self._file is None:
+                self._open_shard(key)
+            self._shard_keys = (self._shard_keys[0], key)
+            self._shard_count += 1
+        self.count += 1
+        self._file.write(f"## {key}\n\n")
+        write_markdown_list(self._file, obj)
+        self._file.write("\n")
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        if self.sharded:
+            if self._file is not None:
+                self._close_shard()
+            if self._index is not None:
+                self._index.close()
+                self._index = None
+        elif self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+# Fields naming an issue: a JIRA result row, a pipeline record, a GitHub issue.
+ISSUE_KEY_FIELDS = ("Issue Key", "key", "number")
+
+
+def _issue_key(obj, i):
+    for field in ISSUE_KEY_FIELDS:
+        if isinstance(obj, dict) and obj.get(field) not in (None, ""):
+            return obj[field]
+    return f"Item {i}"
+
+
+def json_list_to_markdown(json_list, output_file="report.md", shard_size=None, shard_by_key=False):
+    """
+    Takes JSON-like objects (dicts), any iterable of them, and writes them as markdown nested lists.
+
+    Each object is a section named after its issue key (the first of
+    ISSUE_KEY_FIELDS it has, else "Item <n>"). With `shard_size` or
+    `shard_by_key` the report is split into several files behind an index
+    page (see `MarkdownReportWriter`); with `shard_by_key` they are named
+    after the issue keys, e.g. `report/FLINK-123.md`.
     """
-    with open(output_file, "w", encoding="utf-8") as f:
-        f.write("# JSON Report\n\n")
+    with MarkdownReportWriter(output_file, shard_size=shard_size, shard_by_key=shard_by_key) as report:
         for i, obj in enumerate(json_list, start=1):
-            f.write(f"## Item {i}\n\n")
-            f.write(dict_to_markdown_list(obj))
-            f.write("\n")
+            report.write(_issue_key(obj, i), obj)
     print(f"✅ Markdown report generated: {output_file}")
@@ -0,0 +1,295 @@
+import argparse
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_METRICS_FILE = "result/metrics.prom"
+EXPORT_INTERVAL = 15
+# Upper bounds (seconds) of the latency histogram buckets, Prometheus style.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, math.inf)
+# Estimated USD per million (prompt, completion) tokens; the longest matching model name prefix applies.
+DEFAULT_PRICES = {
+    "gpt-4": (30.0, 60.0),
+    "gpt-4-turbo": (10.0, 30.0),
+    "gpt-4.1": (2.0, 8.0),
+    "gpt-4.1-mini": (0.4, 1.6),
+    "gpt-4.1-nano": (0.1, 0.4),
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4o-mini": (0.15, 0.6),
+    "gpt-3.5-turbo": (0.5, 1.5),
+}
+
+_lock = threading.Lock()
+_counters = {}  # (name, labels) -> value
+_gauges = {}  # (name, labels) -> value
+_histograms = {}  # (name, labels) -> [bucket counts, sum, count]
+_prices = dict(DEFAULT_PRICES)
+
+
+def _key(name, labels):
+    return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+
+def inc(name, value=1, **labels):
+    """Adds `value` to a counter."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name, value, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = value
+
+
+def max_gauge(name, value, **labels):
+    """Raises a gauge to `value` if that is higher, e.g. to keep the peak of a queue depth."""
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = max(_gauges.get(key, value), value)
+
+
+def observe(name, seconds, **labels):
+    """Records one duration in a latency histogram."""
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [[0] * len(LATENCY_BUCKETS), 0.0, 0]
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                histogram[0][index] += 1
+                break
+        histogram[1] += seconds
+        histogram[2] += 1
+
+
+@contextmanager
+def timer(name, **labels):
+    """Observes the duration of the `with` block, also when it raises."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+
+def set_prices(prices):
+    """Overrides the per-model token prices: {model: [prompt USD, completion USD] per million tokens}."""
+    with _lock:
+        _prices.update({model: tuple(price) for model, price in prices.items()})
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    with _lock:
+        matches = [name for name in _prices if model == name or model.startswith(name + "-")]
+        if not matches:
+            return 0.0
+        prompt_price, completion_price = _prices[max(matches, key=len)]
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+def record_llm_usage(model, prompt_tokens, completion_tokens, price_factor=1.0):
+    """Counts the tokens of one LLM answer and their estimated cost (`price_factor`: e.g. the batch discount)."""
+    prompt_tokens = prompt_tokens or 0
+    completion_tokens = completion_tokens or 0
+    inc("crawler_llm_prompt_tokens_total", prompt_tokens, model=model)
+    inc("crawler_llm_completion_tokens_total", completion_tokens, model=model)
+    inc("crawler_llm_cost_usd_total", estimate_cost(model, prompt_tokens, completion_tokens) * price_factor,
+        model=model)
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
+
+
+def snapshot():
+    """All metrics as plain data: {"counters": [...], "gauges": [...], "histograms": [...]}."""
+    with _lock:
+        return {
+            "time": time.time(),
+            "counters": [{"name": name, "labels": dict(labels), "value": value}
+                         for (name, labels), value in sorted(_counters.items())],
+            "gauges": [{"name": name, "labels": dict(labels), "value": value}
+                       for (name, labels), value in sorted(_gauges.items())],
+            "histograms": [{"name": name, "labels": dict(labels), "buckets": list(buckets), "sum": total,
+                            "count": count}
+                           for (name, labels), (buckets, total, count) in sorted(_histograms.items())],
+        }
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels.items()) + (list(extra.items()) if extra else [])
+    if not items:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in items)
+    return "{" + ",".join(f'{label}="{value}"' for (label, _), value in zip(items, escaped)) + "}"
+
+
+def _format_bound(bound):
+    return "+Inf" if bound == math.inf else repr(float(bound))
+
+
+def to_prometheus(data):
+    """Renders a `snapshot` in the Prometheus text exposition format."""
+    lines = []
+    typed = set()
+
+    def declare(name, kind):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} {kind}")
+
+    for metric in data["counters"]:
+        declare(metric["name"], "counter")
+        lines.append(f"{metric['name']}{_format_labels(metric['labels'])} {metric['value']}")
+    for metric in data["gauges"]:
+        declare(metric["name"], "gauge")
+        lines.append(f"{metric['name']}{_format_labels(metric['labels'])} {metric['value']}")
+    for metric in data["histograms"]:
+        name, labels = metric["name"], metric["labels"]
+        declare(name, "histogram")
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, metric["buckets"]):
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels(labels, {'le': _format_bound(bound)})} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {metric['sum']}")
+        lines.append(f"{name}_count{_format_labels(labels)} {metric['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def write(path, fmt="prometheus"):
+    """Writes the current metrics to `path` atomically, as Prometheus text or a JSON snapshot."""
+    data = snapshot()
+    text = json.dumps(data, ensure_ascii=False, indent=2) if fmt == "json" else to_prometheus(data)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    part_path = path + ".part"
+    with open(part_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(part_path, path)
+
+
+def quantile(buckets, count, q):
+    """Estimates a quantile from histogram buckets by linear interpolation within the bucket."""
+    if not count:
+        return 0.0
+    rank = q * count
+    cumulative = 0
+    lower = 0.0
+    for bound, bucket_count in zip(LATENCY_BUCKETS, buckets):
+        if cumulative + bucket_count >= rank and bucket_count:
+            if bound == math.inf:
+                return lower
+            return lower + (bound - lower) * (rank - cumulative) / bucket_count
+        cumulative += bucket_count
+        lower = bound
+    return lower
+
+
+def _describe(metric):
+    labels = ",".join(f"{label}={value}" for label, value in metric["labels"].items())
+    return f"{metric['name']}{{{labels}}}" if labels else metric["name"]
+
+
+def summary(data=None):
+    """A text table of the latencies (count, mean, p50, p95), then the counters and gauges."""
+    data = data or snapshot()
+    lines = []
+    if data["histograms"]:
+        lines.append(f"  {'latency':<58} {'count':>8} {'mean':>8} {'p50':>8} {'p95':>8}")
+        for metric in data["histograms"]:
+            count = metric["count"]
+            mean = metric["sum"] / count if count else 0.0
+            lines.append(f"  {_describe(metric):<58} {count:>8} {mean:>7.3f}s "
+                         f"{quantile(metric['buckets'], count, 0.5):>7.3f}s "
+                         f"{quantile(metric['buckets'], count, 0.95):>7.3f}s")
+    for metric in data["counters"] + data["gauges"]:
+        value = metric["value"]
+        value = f"{value:.4f}" if isinstance(value, float) else str(value)
+        lines.append(f"  {_describe(metric):<58} {value:>8}")
+    return "\n".join(lines)
+
+
+class MetricsExporter:
+    """
+    Writes the process's metrics to a file every `interval` seconds.
+
+    The file is rewritten in full each time (Prometheus text format for a
+    node_exporter textfile collector, or a JSON snapshot), so it always
+    holds the totals of the run so far. `stop` writes the final values and
+    prints the summary table.
+
+    Usage:
+        exporter = MetricsExporter.from_config(config.get("metrics"))
+        exporter.start()
+        ... crawl ...
+        exporter.stop()
+    """
+
+    def __init__(self, path=DEFAULT_METRICS_FILE, fmt="prometheus", interval=EXPORT_INTERVAL):
+        self.path = path
+        self.fmt = fmt
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_config(cls, metrics_config, suffix=None):
+        """
+        Build an exporter from the optional "metrics" config section; None when disabled.
+
+        With `suffix` (e.g. a worker id) the file name gets it appended before
+        the extension, so the processes of a sharded crawl do not overwrite
+        each other's files.
+        """
+        if not metrics_config or not metrics_config.get("enabled", False):
+            return None
+        fmt = metrics_config.get("format", "prometheus")
+        path = metrics_config.get("path", DEFAULT_METRICS_FILE)
+        if suffix:
+            root, ext = os.path.splitext(path)
+            path = f"{root}-{suffix}{ext}"
+        if metrics_config.get("prices"):
+            set_prices(metrics_config["prices"])
+        return cls(path, fmt, metrics_config.get("interval", EXPORT_INTERVAL))
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                write(self.path, self.fmt)
+            except OSError as e:
+                print(f"⚠️ 指标文件写入失败：{self.path}，Error：{e}")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="metrics-exporter", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, print_summary=True):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        write(self.path, self.fmt)
+        if print_summary:
+            print("\n📈 运行指标：")
+            print(summary())
+            print(f"  (指标文件：{self.path})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print the summary table of a JSON metrics snapshot.")
+    parser.add_argument("snapshot", help="A metrics file written with \"format\": \"json\".")
+    args = parser.parse_args()
+    with open(args.snapshot, encoding="utf-8") as f:
+        print(summary(json.load(f)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+import asyncio
+import time
+
+from tqdm import tqdm
+
+import metrics
+
+DEFAULT_QUEUE_SIZE = 64
+# Stands in for an item a stage dropped, so ordered stages downstream do not wait for it.
+_DROPPED = object()
+_DONE = object()
+
+
+class Stage:
+    """
+    One step of a `Pipeline`.
+
+    `process` receives an item and returns the item to pass on (usually the
+    same dict, enriched), or None to drop it. Up to `concurrency` items are
+    processed at once. An `ordered` stage sees the items in source order,
+    whatever the concurrency upstream; it runs a single worker, which is
+    what sinks want.
+    """
+
+    name = "stage"
+
+    def __init__(self, concurrency=1, queue_size=None, ordered=False):
+        self.concurrency = 1 if ordered else max(1, concurrency)
+        self.queue_size = queue_size
+        self.ordered = ordered
+        self.stats = {"in": 0, "out": 0, "dropped": 0, "failed": 0}
+
+    async def open(self):
+        """Called before the first item."""
+
+    async def process(self, item):
+        return item
+
+    async def finish(self):
+        """Called once every item went through; skipped when the run failed."""
+
+    async def close(self):
+        """Called at the end of every run, complete or not."""
+
+
+class Source:
+    """The start of a `Pipeline`: `items` is an async generator of work items."""
+
+    name = "source"
+
+    async def open(self):
+        pass
+
+    async def items(self):
+        raise NotImplementedError
+        yield
+
+    def item_dropped(self, item, reason):
+        """Called when a stage drops one of this source's items or fails on it."""
+
+    async def close(self):
+        pass
+
+
+def _describe(item):
+    return item.get("key", "item") if isinstance(item, dict) else "item"
+
+
+class Pipeline:
+    """
+    Streams the items of a source through a chain of stages.
+
+    Each stage reads from a bounded queue of `queue_size` items and writes
+    to the queue of the next one, so a slow stage (the LLM, a sink) makes
+    the stages before it wait instead of letting items pile up: whatever
+    the size of the crawl, only the queued items and those being processed
+    are in memory, and the first results reach the sinks while the source
+    is still being read.
+
+    An ordered stage buffers the items that overtook the one it waits for.
+    The source stays at most the pipeline's capacity (every queue and
+    worker) ahead of the slowest ordered stage, so one slow item stalls the
+    source instead of letting the buffer grow.
+
+    A stage that fails on an item reports it and drops the item; a failing
+    source stops the run.
+
+    Usage:
+        pipeline = Pipeline(JiraSource(engine, ...), [JiraAttachmentStage(engine, ...), XlsxSink(...)])
+        stats = await pipeline.run()
+    """
+
+    def __init__(self, source, stages, queue_size=DEFAULT_QUEUE_SIZE, progress=True):
+        if not stages:
+            raise ValueError("a pipeline needs at least one stage")
+        self.source = source
+        self.stages = list(stages)
+        self.queue_size = queue_size
+        self.progress = progress
+        self._bar = None
+        self._next_seq = {}  # ordered stage index -> sequence number it waits for
+        self._advanced = asyncio.Event()
+
+    def window(self):
+        """How far the source may run ahead of the slowest ordered stage: every queue and worker full."""
+        return sum((stage.queue_size or self.queue_size) + stage.concurrency for stage in self.stages)
+
+    async def _feed(self, queue):
+        seq = 0
+        window = self.window()
+        async for item in self.source.items():
+            while self._next_seq and seq >= min(self._next_seq.values()) + window:
+                self._advanced.clear()
+                await self._advanced.wait()
+            await queue.put((seq, item))
+            seq += 1
+        for _ in range(self.stages[0].concurrency):
+            await queue.put(_DONE)
+
+    async def _handle(self, stage, seq, item, output):
+        if item is not _DROPPED:
+            stage.stats["in"] += 1
+            started = time.perf_counter()
+            try:
+                result = await stage.process(item)
+            except Exception as e:
+                outcome = "failed"
+                stage.stats["failed"] += 1
+                print(f"❌ [{stage.name}] 处理 {_describe(item)} 失败: {e}")
+                self.source.item_dropped(item, f"{stage.name}: {e}")
+                item = _DROPPED
+            else:
+                if result is None:
+                    outcome = "dropped"
+                    stage.stats["dropped"] += 1
+                    self.source.item_dropped(item, f"dropped by {stage.name}")
+                    item = _DROPPED
+                else:
+                    outcome = "out"
+                    stage.stats["out"] += 1
+                    item = result
+            metrics.observe("crawler_stage_seconds", time.perf_counter() - started, stage=stage.name)
+            metrics.inc("crawler_stage_items_total", stage=stage.name, outcome=outcome)
+        if output is not None:
+            await output.put((seq, item))
+        elif item is not _DROPPED:
+            self._bar.update(1)
+
+    async def _work(self, index, queue, output):
+        stage = self.stages[index]
+        pending = {}
+        next_seq = 0
+        while True:
+            entry = await queue.get()
+            # depth of the stage's input queue: a full queue points at this stage as the bottleneck
+            metrics.set_gauge("crawler_queue_depth", queue.qsize(), stage=stage.name)
+            metrics.max_gauge("crawler_queue_depth_max", queue.qsize(), stage=stage.name)
+            if entry is _DONE:
+                return
+            seq, item = entry
+            if not stage.ordered:
+                await self._handle(stage, seq, item, output)
+                continue
+            # every sequence number reaches every stage (dropped items as _DROPPED), so the gaps always fill;
+            # `_feed` keeps the source within `window()` of next_seq, which bounds `pending`
+            pending[seq] = item
+            while next_seq in pending:
+                await self._handle(stage, next_seq, pending.pop(next_seq), output)
+                next_seq += 1
+                self._next_seq[index] = next_seq
+                self._advanced.set()
+
+    async def _run_stage(self, index, queues):
+        stage = self.stages[index]
+        output = queues[index + 1] if index + 1 < len(queues) else None
+        await asyncio.gather(*(self._work(index, queues[index], output) for _ in range(stage.concurrency)))
+        if output is not None:
+            for _ in range(self.stages[index + 1].concurrency):
+                await output.put(_DONE)
+
+    async def run(self):
+        """Runs the source to exhaustion; returns the item counts of every stage."""
+        queues = [asyncio.Queue(maxsize=stage.queue_size or self.queue_size) for stage in self.stages]
+        self._bar = tqdm(desc="写入进度", ncols=100, disable=not self.progress)
+        self._next_seq = {index: 0 for index, stage in enumerate(self.stages) if stage.ordered}
+        opened = []
+        tasks = []
+        try:
+            for part in [self.source] + self.stages:
+                await part.open()
+                opened.append(part)
+            tasks.append(asyncio.ensure_future(self._feed(queues[0])))
+            tasks += [asyncio.ensure_future(self._run_stage(index, queues)) for index in range(len(self.stages))]
+            await asyncio.gather(*tasks)
+            for stage in self.stages:
+                await stage.finish()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for part in reversed(opened):
+                await part.close()
+            self._bar.close()
+        self.report()
+        return {stage.name: dict(stage.stats) for stage in self.stages}
+
+    def report(self):
+        print("\n📊 流水线统计：")
+        for stage in self.stages:
+            stats = stage.stats
+            print(f"  {stage.name:<14} in {stats['in']:>7}  out {stats['out']:>7}  "
+                  f"dropped {stats['dropped']:>6}  failed {stats['failed']:>6}")
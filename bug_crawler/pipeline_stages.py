@@ -0,0 +1,707 @@
+import asyncio
+import csv
+import os
+from pathlib import Path
+
+from dedup import attachment_sample
+from github_fetcher import SEARCH_HEADERS, fetch_issue_comments, iter_github_issues
+from jira_fetcher import fetch_attachments_with_linecount, iter_search_pages
+from log_reducer import reduce_log
+from log_scanner import scan_log
+import metrics
+from markdown_util import MarkdownReportWriter
+from pipeline import Source, Stage
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # only ParquetSink needs it
+    pa = pq = None
+
+PARQUET_ROW_GROUP_SIZE = 1000
+
+# Items travelling through the pipeline are dicts ("records"):
+#   source, key, issue (raw issue), title, body, comments   -- set by the source
+#   attachments: [(link, file name, line count, local path)]  -- JiraAttachmentStage
+#   logs: [(link, local path)] worth analysing, signatures: {link: matches}  -- AnalysisStage
+#   cluster_id  -- ClusterStage
+#   answers: {link: [answer per question]} (JIRA), answer (GitHub)  -- LLM stages
+#     (in batch mode placeholders, replaced by the answers when BatchJobSource replays the record)
+
+
+def new_record(source, key, issue, title="", body="", comments=""):
+    return {"source": source, "key": key, "issue": issue, "title": title or "", "body": body or "",
+            "comments": comments or "", "attachments": [], "logs": [], "signatures": {}, "cluster_id": None,
+            "answers": {}}
+
+
+def jira_record(bug):
+    fields = bug.get("fields", {})
+    return new_record("jira", bug.get("key"), bug, fields.get("summary"), fields.get("description"))
+
+
+def duplicate_of(record):
+    """The cluster an issue is a near-duplicate of, or None for a cluster's first issue."""
+    cluster_id = record.get("cluster_id")
+    return cluster_id if cluster_id not in (None, record["key"]) else None
+
+
+class JiraSource(Source):
+    """
+    Issues of a JIRA search, page by page (see `iter_search_pages`), skipping `skip_keys`.
+
+    `failed` counts the issues a stage failed on, which were not written.
+    """
+
+    name = "jira-search"
+
+    def __init__(self, engine, search_api, jql, page_size, max_total_issues, fan_out=4, fields=None,
+                 skip_keys=None):
+        self.engine = engine
+        self.search_api = search_api
+        self.jql = jql
+        self.page_size = page_size
+        self.max_total_issues = max_total_issues
+        self.fan_out = fan_out
+        self.fields = fields
+        self.skip_keys = set(skip_keys or ())
+        self.total = 0
+        self.failed = 0
+
+    async def items(self):
+        async for issues in iter_search_pages(self.engine, self.search_api, self.jql, self.page_size,
+                                              self.max_total_issues, fan_out=self.fan_out, fields=self.fields):
+            self.total += len(issues)
+            for bug in issues:
+                key = bug.get("key")
+                # skip issues that are already written
+                if key in self.skip_keys:
+                    print(f"Case {key} already exists in the result store. Skipping.")
+                    continue
+                self.skip_keys.add(key)
+                yield jira_record(bug)
+
+    def item_dropped(self, record, reason):
+        self.failed += 1
+
+
+class GitHubSource(Source):
+    """
+    Issues of a GitHub search (see `iter_github_issues`).
+
+    The blocking search runs in a worker thread, one page ahead of the
+    pipeline at most. `truncated` counts the searches that had more results
+    than could be fetched, `failed` the issues a stage failed on.
+    """
+
+    name = "github-search"
+
+    def __init__(self, owner, repo, token_pool, **search_args):
+        self.owner = owner
+        self.repo = repo
+        self.token_pool = token_pool
+        self.search_args = search_args
+        self.total = 0
+        self.truncated = 0
+        self.failed = 0
+
+    def _truncated(self, query_string, total):
+        self.truncated += 1
+
+    async def items(self):
+        issues = iter_github_issues(self.owner, self.repo, token_pool=self.token_pool, on_truncated=self._truncated,
+                                    **self.search_args)
+        done = object()
+        while True:
+            issue = await asyncio.to_thread(next, issues, done)
+            if issue is done:
+                return
+            self.total += 1
+            yield new_record("github", f"{self.owner}/{self.repo}#{issue['number']}", issue, issue.get("title"),
+                             issue.get("body"), issue.get("comments_thread_text"))
+
+    def item_dropped(self, record, reason):
+        self.failed += 1
+
+
+class QueueSource(Source):
+    """
+    Units claimed from a `WorkQueue` by one worker process.
+
+    `expanders` maps a unit kind to an async function returning the
+    `(kind, key, payload)` units it expands into (e.g. a search page into
+    its issues); such units are handled right here. Every other unit becomes
+    a record through `to_record(unit)` and must end in a `QueueCommitStage`;
+    meanwhile its lease is renewed in the background. At most
+    `max_in_flight` units are held at a time, so the work spreads over the
+    workers. The source ends when nothing is left to claim and no other
+    worker holds a lease, since an expired lease is claimed again.
+    """
+
+    name = "work-queue"
+
+    def __init__(self, queue, worker_id, to_record, expanders=None, batch_size=4, max_in_flight=16,
+                 poll_interval=2.0):
+        self.queue = queue
+        self.worker_id = worker_id
+        self.to_record = to_record
+        self.expanders = expanders or {}
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.poll_interval = poll_interval
+        self.in_flight = set()
+        self.total = 0
+        self._heartbeat = None
+        self._released = None
+
+    async def open(self):
+        self._released = asyncio.Event()
+        self._heartbeat = asyncio.ensure_future(self._beat())
+
+    def release(self, unit_id):
+        """Forgets a unit that was completed or given back."""
+        self.in_flight.discard(unit_id)
+        self._released.set()
+
+    async def _beat(self):
+        while True:
+            await asyncio.sleep(self.queue.lease / 3)
+            if self.in_flight:
+                await asyncio.to_thread(self.queue.heartbeat, self.worker_id, list(self.in_flight))
+
+    async def _expand(self, unit, expand):
+        self.in_flight.add(unit["id"])
+        try:
+            units = await expand(unit)
+            await asyncio.to_thread(self.queue.add_many, units)
+            await asyncio.to_thread(self.queue.complete, self.worker_id, unit["id"])
+        except Exception as e:
+            print(f"❌ 处理 {unit['kind']} {unit['key']} 失败: {e}")
+            await asyncio.to_thread(self.queue.fail, self.worker_id, unit["id"], e)
+        finally:
+            self.release(unit["id"])
+
+    async def items(self):
+        while True:
+            while len(self.in_flight) >= self.max_in_flight:
+                self._released.clear()
+                await self._released.wait()
+            units = await asyncio.to_thread(self.queue.claim, self.worker_id,
+                                            min(self.batch_size, self.max_in_flight - len(self.in_flight)))
+            if not units:
+                if self.in_flight or await asyncio.to_thread(self.queue.outstanding):
+                    await asyncio.sleep(self.poll_interval)
+                    continue
+                return
+            for unit in units:
+                expand = self.expanders.get(unit["kind"])
+                if expand:
+                    await self._expand(unit, expand)
+                    continue
+                self.in_flight.add(unit["id"])
+                record = self.to_record(unit)
+                record["unit_id"] = unit["id"]
+                self.total += 1
+                yield record
+
+    def item_dropped(self, record, reason):
+        self.queue.fail(self.worker_id, record["unit_id"], reason)
+        self.release(record["unit_id"])
+
+    async def close(self):
+        self._heartbeat.cancel()
+        # hand back what this worker did not finish
+        for unit_id in list(self.in_flight):
+            self.queue.fail(self.worker_id, unit_id, "worker stopped")
+        self.in_flight.clear()
+
+
+class QueueCommitStage(Stage):
+    """Marks the unit of each record done in the work queue, once the stages before it stored its result."""
+
+    name = "commit"
+
+    def __init__(self, source):
+        super().__init__()
+        self.source = source
+
+    async def process(self, record):
+        if not await asyncio.to_thread(self.source.queue.complete, self.source.worker_id, record["unit_id"]):
+            print(f"⚠️ {record['key']} 的租约已过期，已由其他 worker 重新领取")
+        self.source.release(record["unit_id"])
+        return record
+
+
+class JiraAttachmentStage(Stage):
+    """Downloads the attachments of each issue (see `fetch_attachments_with_linecount`)."""
+
+    name = "attachments"
+
+    def __init__(self, engine, issue_detail_api, log_save_path=None, expand_archives=False, concurrency=8):
+        super().__init__(concurrency)
+        self.engine = engine
+        self.issue_detail_api = issue_detail_api
+        self.log_save_path = log_save_path
+        self.expand_archives = expand_archives
+
+    async def process(self, record):
+        _, record["attachments"] = await fetch_attachments_with_linecount(
+            self.engine, self.issue_detail_api, record["issue"], self.log_save_path, self.expand_archives)
+        return record
+
+
+class GitHubCommentStage(Stage):
+    """Fetches the comment thread of each GitHub issue that has comments."""
+
+    name = "comments"
+
+    def __init__(self, token_pool, cache=None, concurrency=4):
+        super().__init__(concurrency)
+        self.token_pool = token_pool
+        self.cache = cache
+
+    async def process(self, record):
+        issue = record["issue"]
+        if issue.get("comments", 0) > 0 and "comments_thread" not in issue:
+            comments_url = f"{issue['repository_url']}/issues/{issue['number']}/comments"
+            issue["comments_thread"], issue["comments_thread_text"] = await asyncio.to_thread(
+                fetch_issue_comments, {"comments_url": comments_url}, SEARCH_HEADERS, self.cache, self.token_pool)
+            record["comments"] = issue["comments_thread_text"]
+        return record
+
+
+class AnalysisStage(Stage):
+    """
+    Local analysis of each issue, in worker threads.
+
+    Stored attachments of a type in `log_types` with at least `min_lines`
+    lines are scanned for memory signatures, and the issue is added to the
+    full-text index, with those logs, when `search_index` is given.
+    """
+
+    name = "analysis"
+
+    def __init__(self, log_types=(), min_lines=0, search_index=None, concurrency=4):
+        super().__init__(concurrency)
+        self.log_types = set(log_types)
+        self.min_lines = min_lines
+        self.search_index = search_index
+
+    def _scan(self, path):
+        try:
+            return scan_log(path)
+        except OSError as e:
+            print(f"⚠️ 无法扫描日志 {path}: {e}")
+            return {}
+
+    def _analyse(self, record):
+        logs = []
+        for link, name, line_count, path in record["attachments"]:
+            if isinstance(line_count, int) and line_count < self.min_lines:
+                continue
+            if path and (Path(link).suffix[1:] or "unknown") in self.log_types:
+                record["logs"].append((link, path))
+                record["signatures"][link] = self._scan(path)
+                logs.append((name, path))
+        if self.search_index:
+            # only the logs: patches, archives and heap dumps would fill the index with noise
+            self.search_index.add_issue(record["source"], record["key"], record["title"], record["body"],
+                                        record["comments"], attachments=logs)
+        return record
+
+    async def process(self, record):
+        return await asyncio.to_thread(self._analyse, record)
+
+
+class ClusterStage(Stage):
+    """
+    Assigns each issue its near-duplicate cluster (see `DedupIndex`).
+
+    The stage is ordered, so the first issue of a cluster, whose key names
+    the cluster, is the first one in search order.
+    """
+
+    name = "dedup"
+
+    def __init__(self, dedup):
+        super().__init__(ordered=True)
+        self.dedup = dedup
+
+    def _text(self, record):
+        """Title, body, comments and the head of each stored attachment: the text near-duplicates are detected on."""
+        parts = [record["title"], record["body"], record["comments"]]
+        for _, _, _, path in record["attachments"]:
+            if path:
+                try:
+                    parts.append(attachment_sample(path))
+                except OSError:
+                    pass
+        return "\n".join(parts)
+
+    async def process(self, record):
+        record["cluster_id"] = await asyncio.to_thread(self.dedup.assign, record["key"], self._text(record))
+        return record
+
+
+class LogQuestionStage(Stage):
+    """
+    Asks every question about every analysed log of an issue.
+
+    Each log is reduced once to `token_budget` tokens and shared by all
+    questions. With `signature_prefilter`, logs without a memory signature
+    are not sent; with `skip_duplicates`, neither are the logs of an issue
+    clustered with an earlier one. A question that still fails after the
+    scheduler's retries fails the issue, which is then not written and is
+    asked again on the next run.
+
+    Args:
+        questions (list): (question text, prompt template file names) pairs.
+    """
+
+    name = "llm"
+
+    def __init__(self, scheduler, questions, model, token_budget=6000, signature_prefilter=True,
+                 skip_duplicates=False, concurrency=16):
+        super().__init__(concurrency)
+        self.scheduler = scheduler
+        self.questions = questions
+        self.model = model
+        self.token_budget = token_budget
+        self.signature_prefilter = signature_prefilter
+        self.skip_duplicates = skip_duplicates
+
+    async def _ask(self, key, question, templates, path, log_text):
+        # imported here: the module reads the API key file, which crawls without GPT do not need
+        from service.gpt_service.util import format_gpt_prompt
+        return await self.scheduler.complete(format_gpt_prompt(question, path, log_text), model=self.model,
+                                             templates=templates, attachment_path=path, key=key)
+
+    async def _answers(self, record, link, path):
+        duplicate = duplicate_of(record) if self.skip_duplicates else None
+        if duplicate:
+            return [f"Skipped: near-duplicate of {duplicate}"] * len(self.questions)
+        if self.signature_prefilter and not record["signatures"].get(link):
+            return ["Skipped: no memory signature in the log"] * len(self.questions)
+        with metrics.timer("crawler_log_reduce_seconds"):
+            log_text = await asyncio.to_thread(reduce_log, path, self.token_budget, self.model)
+        return await asyncio.gather(*(self._ask(record["key"], question, templates, path, log_text)
+                                      for question, templates in self.questions))
+
+    async def process(self, record):
+        answers = await asyncio.gather(*(self._answers(record, link, path) for link, path in record["logs"]))
+        record["answers"] = {link: list(answer) for (link, _), answer in zip(record["logs"], answers)}
+        return record
+
+
+class IssuePromptStage(Stage):
+    """
+    Asks one question per issue; `build_prompt(record)` renders it. The answer goes to record["answer"].
+
+    A question that still fails after the scheduler's retries fails the issue, like in `LogQuestionStage`.
+    """
+
+    name = "llm"
+
+    def __init__(self, scheduler, build_prompt, model, temperature=None, templates=None, skip_duplicates=False,
+                 concurrency=16):
+        super().__init__(concurrency)
+        self.scheduler = scheduler
+        self.build_prompt = build_prompt
+        self.model = model
+        self.temperature = temperature
+        self.templates = templates
+        self.skip_duplicates = skip_duplicates
+
+    async def process(self, record):
+        duplicate = duplicate_of(record) if self.skip_duplicates else None
+        if duplicate:
+            record["answer"] = f"Skipped: near-duplicate of {duplicate}"
+            return record
+        record["answer"] = await self.scheduler.complete(self.build_prompt(record), self.model,
+                                                         self.temperature, self.templates, key=record["key"])
+        return record
+
+
+class BatchRecordSink(Stage):
+    """
+    Batch mode: parks each record in a `BatchJob` (see `service.gpt_service.llm_batch`) instead of writing it.
+
+    The LLM stages left placeholders for the answers; once the batches are
+    done, `BatchJobSource` replays the records, answers filled in, through
+    the real sinks.
+    """
+
+    name = "llm-batch"
+
+    def __init__(self, job):
+        super().__init__(ordered=True)
+        self.job = job
+        self.count = 0
+
+    async def process(self, record):
+        await asyncio.to_thread(self.job.add_record, record["key"], record)
+        self.count += 1
+        return record
+
+
+class BatchJobSource(Source):
+    """
+    The records parked by `BatchRecordSink`, in their original order, with the batch answers in place.
+
+    A record with a request the batches did not answer is not replayed but
+    counted in `failed`, like an issue a stage failed on, so it is crawled
+    and asked again next run.
+    """
+
+    name = "llm-batch"
+
+    def __init__(self, job):
+        self.job = job
+        self.total = 0
+        self.failed = 0
+
+    async def items(self):
+        failed_keys = await asyncio.to_thread(self.job.failed_keys)
+        records = self.job.iter_records()
+        done = object()
+        while True:
+            record = await asyncio.to_thread(next, records, done)
+            if record is done:
+                return
+            self.total += 1
+            if record["key"] in failed_keys:
+                print(f"❌ {record['key']} 的 batch 请求没有回答，下次运行将重新抓取")
+                self.failed += 1
+                continue
+            yield record
+
+    def item_dropped(self, record, reason):
+        self.failed += 1
+
+
+class XlsxSink(Stage):
+    """
+    Records each issue's `row(record)` in a `ResultStore` as it arrives and
+    exports the Excel report once the run is complete (unless `xlsx_file`
+    is None, e.g. in a worker process of a sharded crawl).
+    """
+
+    name = "xlsx"
+
+    def __init__(self, store, xlsx_file, header, row, sheet_title="Memory Bugs"):
+        super().__init__(ordered=True)
+        self.store = store
+        self.xlsx_file = xlsx_file
+        self.header = header
+        self.row = row
+        self.sheet_title = sheet_title
+        self.count = 0
+
+    async def process(self, record):
+        await asyncio.to_thread(self.store.append, record["key"], self.row(record))
+        return record
+
+    async def finish(self):
+        if self.xlsx_file is None:
+            return
+        # export the final report in one streaming pass
+        self.count = await asyncio.to_thread(self.store.export_xlsx, self.xlsx_file, self.header, self.sheet_title)
+
+
+class CsvSink(Stage):
+    """
+    Streams `row(record)` dicts to a CSV file.
+
+    Rows go to `<path>.part` as they arrive; the file replaces `path` once
+    the run is complete. With `merge_previous` (delta crawls), the rows of
+    the previous file whose `key_field` was not written again are appended
+    first.
+    """
+
+    name = "csv"
+
+    def __init__(self, path, fieldnames, row, key_field=None, merge_previous=False):
+        super().__init__(ordered=True)
+        self.path = path
+        self.fieldnames = fieldnames
+        self.row = row
+        self.key_field = key_field
+        self.merge_previous = merge_previous
+        self.count = 0
+        self._written = set()
+        self._file = None
+        self._writer = None
+
+    async def open(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._file = open(self.path + ".part", "w", newline="", encoding="utf-8")
+        self._writer = csv.DictWriter(self._file, self.fieldnames, extrasaction="ignore")
+        self._writer.writeheader()
+
+    async def process(self, record):
+        row = self.row(record)
+        self._writer.writerow(row)
+        self._file.flush()
+        self.count += 1
+        if self.key_field:
+            self._written.add(str(row.get(self.key_field)))
+        return record
+
+    async def finish(self):
+        if self.merge_previous and os.path.exists(self.path):
+            # replace the old rows of the changed issues, keep the others
+            with open(self.path, newline="", encoding="utf-8") as previous:
+                for row in csv.DictReader(previous):
+                    if row.get(self.key_field) not in self._written:
+                        self._writer.writerow(row)
+                        self.count += 1
+        self._file.close()
+        os.replace(self.path + ".part", self.path)
+
+    async def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+class ParquetSink(Stage):
+    """
+    Streams `row(record)` dicts into a Parquet file with a declared Arrow `schema`.
+
+    Rows are collected into row groups of `row_group_size` and each full
+    group is written as it is complete, so at most one group is held in
+    memory. Lists and structs (labels, comment threads, attachments) stay
+    nested columns. Like `CsvSink`, rows go to `<path>.part`, which
+    replaces `path` once the run is complete; with `merge_previous` the
+    rows of the previous file whose `key_field` was not written again are
+    carried over. Requires pyarrow.
+    """
+
+    name = "parquet"
+
+    def __init__(self, path, schema, row, key_field=None, merge_previous=False,
+                 row_group_size=PARQUET_ROW_GROUP_SIZE, compression="zstd"):
+        if pq is None:
+            raise RuntimeError("the Parquet sink needs pyarrow: pip install pyarrow")
+        super().__init__(ordered=True)
+        self.path = path
+        self.schema = schema
+        self.row = row
+        self.key_field = key_field
+        self.merge_previous = merge_previous
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.count = 0
+        self._rows = []
+        self._written = set()
+        self._writer = None
+
+    async def open(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._writer = pq.ParquetWriter(self.path + ".part", self.schema, compression=self.compression)
+
+    async def process(self, record):
+        row = self.row(record)
+        self._rows.append(row)
+        self.count += 1
+        if self.key_field:
+            self._written.add(str(row.get(self.key_field)))
+        if len(self._rows) >= self.row_group_size:
+            rows, self._rows = self._rows, []
+            await asyncio.to_thread(self._write, rows)
+        return record
+
+    def _write(self, rows):
+        self._writer.write_table(pa.Table.from_pylist(rows, schema=self.schema))
+
+    async def finish(self):
+        await asyncio.to_thread(self._finish)
+
+    def _finish(self):
+        if self._rows:
+            self._write(self._rows)
+            self._rows = []
+        if self.merge_previous and os.path.exists(self.path):
+            # replace the old rows of the changed issues, keep the others
+            self.count += _copy_parquet_rows(self.path, self._writer, self.schema, self.key_field, self._written,
+                                             self.row_group_size)
+        self._writer.close()
+        self._writer = None
+        os.replace(self.path + ".part", self.path)
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def _copy_parquet_rows(path, writer, schema, key_field, skip_keys, batch_size=PARQUET_ROW_GROUP_SIZE):
+    """Copies the rows of the Parquet file at `path` whose `key_field` is not in `skip_keys`; returns how many."""
+    copied = 0
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+        rows = [row for row in batch.to_pylist() if str(row.get(key_field)) not in skip_keys]
+        if rows:
+            # columns missing from an older file come out as nulls
+            writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+            copied += len(rows)
+    return copied
+
+
+def compact_parquet(path, part_paths, schema, key_field, row_group_size=PARQUET_ROW_GROUP_SIZE,
+                    compression="zstd"):
+    """
+    Merges Parquet files written by separate processes (e.g. the workers of
+    a sharded crawl) into `path`: rows of the part files first, then the
+    rows of the previous `path` whose key none of the parts wrote. The part
+    files are removed afterwards.
+
+    Returns:
+        int: Number of rows in the merged file.
+    """
+    if pq is None:
+        raise RuntimeError("the Parquet sink needs pyarrow: pip install pyarrow")
+    written = set()
+    count = 0
+    writer = pq.ParquetWriter(path + ".part", schema, compression=compression)
+    try:
+        for part_path in part_paths:
+            count += _copy_parquet_rows(part_path, writer, schema, key_field, written, row_group_size)
+            written.update(str(key) for key in pq.read_table(part_path, columns=[key_field]).column(0).to_pylist())
+        if os.path.exists(path):
+            count += _copy_parquet_rows(path, writer, schema, key_field, written, row_group_size)
+    finally:
+        writer.close()
+    os.replace(path + ".part", path)
+    for part_path in part_paths:
+        os.remove(part_path)
+    return count
+
+
+class MarkdownSink(Stage):
+    """
+    Appends one section per issue, `row(record)` rendered as a nested list, to a markdown report.
+
+    With `shard_size` or `shard_by_key` the report is split into several
+    files behind an index page (see `markdown_util.MarkdownReportWriter`).
+    """
+
+    name = "markdown"
+
+    def __init__(self, path, row, title="JSON Report", shard_size=None, shard_by_key=False):
+        super().__init__(ordered=True)
+        self.path = path
+        self.row = row
+        self.report = MarkdownReportWriter(path, title, shard_size=shard_size, shard_by_key=shard_by_key)
+
+    @property
+    def count(self):
+        return self.report.count
+
+    async def open(self):
+        self.report.open()
+
+    async def process(self, record):
+        self.report.write(record["key"], self.row(record))
+        self.report.flush()
+        return record
+
+    async def close(self):
+        self.report.close()
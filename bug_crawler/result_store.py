@@ -0,0 +1,171 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from openpyxl import Workbook, load_workbook
+
+import metrics
+
+EXPORT_BATCH_SIZE = 1000
+JIRA_RESULT_HEADER = ["Issue Key", "Summary", "Issue Link", "Cluster", "Attachment Link", "Attachment type & lines",
+                      "Memory signatures", "GPT response"]
+CLUSTER_COLUMN = JIRA_RESULT_HEADER.index("Cluster")
+
+
+def _attachment_cells(cells):
+    """
+    Splits the attachment cells of an old row into groups: [link, "type, lines", GPT answers...].
+
+    A group starts at a link followed by the "type, lines" cell made from
+    that link's suffix, which no GPT answer looks like.
+    """
+    groups = []
+    for index, cell in enumerate(cells):
+        following = cells[index + 1] if index + 1 < len(cells) else None
+        if (isinstance(cell, str) and isinstance(following, str)
+                and following.startswith(f"{Path(cell).suffix[1:] or 'unknown'}, ")):
+            groups.append([cell])
+        elif groups:
+            groups[-1].append(cell)
+    return groups
+
+
+def upgrade_row(row, header):
+    """
+    Maps a row written under an older `header` into the JIRA_RESULT_HEADER layout.
+
+    Rows from before the "Memory signatures" column get a signatures cell
+    after each attachment: empty where GPT answers follow, "N/A" where the
+    log was not analysed. Rows from before the "Cluster" column get an
+    empty cluster.
+    """
+    row = list(row)
+    if "Memory signatures" not in header and len(row) > CLUSTER_COLUMN and row[CLUSTER_COLUMN] != "None":
+        cells = row[:CLUSTER_COLUMN]
+        for group in _attachment_cells(row[CLUSTER_COLUMN:]):
+            cells += group[:2] + ([""] + group[2:] if len(group) > 2 else ["N/A"])
+        row = cells
+    if "Cluster" not in header:
+        row.insert(CLUSTER_COLUMN, "")
+    return row
+
+
+class ResultStore:
+    """
+    Append-only store for per-issue result rows.
+
+    Every processed issue is one row in a SQLite table keyed by issue key, so
+    recording a result costs O(1) no matter how many issues were written
+    before, and resuming only reads the key index. The Excel report is
+    produced separately by `export_xlsx`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                key TEXT UNIQUE NOT NULL,
+                row TEXT NOT NULL,
+                written_at REAL
+            )
+        """)
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def keys(self):
+        """Returns the set of issue keys already written (served from the key index)."""
+        with self._lock:
+            return {key for (key,) in self._conn.execute("SELECT key FROM results")}
+
+    def append(self, key, row):
+        """Records the result row of one issue; an earlier row with the same key is replaced in place."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO results (key, row, written_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET row = excluded.row, written_at = excluded.written_at",
+                (key, json.dumps(row, ensure_ascii=False, default=str), time.time()))
+            self._conn.commit()
+
+    def iter_rows(self):
+        """Yields result rows in the order they were written."""
+        last_seq = 0
+        while True:
+            with self._lock:
+                batch = self._conn.execute(
+                    "SELECT seq, row FROM results WHERE seq > ? ORDER BY seq LIMIT ?",
+                    (last_seq, EXPORT_BATCH_SIZE)).fetchall()
+            if not batch:
+                return
+            for _, row in batch:
+                yield json.loads(row)
+            last_seq = batch[-1][0]
+
+    def import_xlsx(self, xlsx_file):
+        """
+        One-off import of a workbook written by an earlier version of the crawler.
+
+        The rows are mapped into the current column layout by the workbook's header (see `upgrade_row`).
+        """
+        workbook = load_workbook(xlsx_file, read_only=True)
+        count = 0
+        header = None
+        for row in workbook.active.iter_rows(values_only=True):
+            if header is None:
+                header = [cell for cell in row if cell is not None]
+                continue
+            if row and row[0]:
+                row = list(row)
+                while row and row[-1] is None:
+                    row.pop()
+                self.append(row[0], upgrade_row(row, header))
+                count += 1
+        workbook.close()
+        return count
+
+    def export_xlsx(self, xlsx_file, header, sheet_title="Memory Bugs"):
+        """Writes all rows to `xlsx_file` with openpyxl's streaming write-only mode."""
+        os.makedirs(os.path.dirname(xlsx_file) or ".", exist_ok=True)
+        with metrics.timer("crawler_xlsx_export_seconds"):
+            workbook = Workbook(write_only=True)
+            sheet = workbook.create_sheet(sheet_title)
+            sheet.append(header)
+            count = 0
+            for row in self.iter_rows():
+                sheet.append(row)
+                count += 1
+            workbook.save(xlsx_file)
+        metrics.inc("crawler_xlsx_rows_total", count)
+        return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a result store to Excel.")
+    parser.add_argument("db", help="Path of the result store.")
+    parser.add_argument("xlsx", help="Path of the Excel file to write.")
+    args = parser.parse_args()
+
+    store = ResultStore(args.db)
+    count = store.export_xlsx(args.xlsx, JIRA_RESULT_HEADER)
+    store.close()
+    print(f"✅ 导出完成：{args.xlsx}（共 {count} 个 issue）")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,47 +1,254 @@
-from github_fetcher import fetch_github_issues
-from service.gpt_service.openai_client import call_openai
-import json 
+from datetime import datetime, timezone
+from github_fetcher import build_search_query, configure_endpoints
+from github_rate_limiter import GitHubTokenPool
+from http_cache import HttpCache
+from metrics import MetricsExporter
+from pipeline import Pipeline
+from pipeline_stages import (AnalysisStage, BatchJobSource, BatchRecordSink, ClusterStage, CsvSink,
+                             GitHubCommentStage, GitHubSource, IssuePromptStage, MarkdownSink, ParquetSink)
+from service.gpt_service.openai_client import OPENAI_API_KEY
+from service.gpt_service.llm_batch import BatchClient, BatchCollector, BatchJob, run_batch_job
+from service.gpt_service.llm_cache import LLMCache
+from service.gpt_service.llm_scheduler import LLMScheduler
+from watermark import WatermarkStore
+from dedup import DedupIndex
+from search_index import SearchIndex
+import asyncio
+import json
+import os
 
 # Configuration
 config_all = json.load(open("bug_crawler/config/config.json"))
 config = config_all['github']
 config_csv=config_all['csv']
- 
+config_llm = config_all.get('llm', {})
+config_dedup = config_all.get('dedup') or {}
+config_pipeline = config_all.get('pipeline', {})
+config_parquet = config_all.get('parquet') or {}
+config_markdown = config_all.get('markdown') or {}
 
-try:
-    issues = fetch_github_issues(
-        owner=config['owner'],
-        repo=config['repo'],
+FILTER_PROMPT_FILE = "bug_crawler/prompt_template/filter_application_resource.txt"
+with open(FILTER_PROMPT_FILE, "r") as f:
+    FILTER_PROMPT = f.read()
+
+CSV_FILE = config_csv['file_name'].format(repo=config['repo'], bug_type=config['bug_type'])
+CSV_FIELDS = ["number", "title", "body", "user", "state", "labels", "url", "created_at", "comments",
+              "repository_url", "html_url", "comments_thread", "comments_thread_text", "cluster_id",
+              "application_resoure"]
+
+
+PARQUET_FILE = config_parquet.get('file_name', 'bug_crawler/result/{repo}_{bug_type}_bugs.parquet').format(
+    repo=config['repo'], bug_type=config['bug_type'])
+MARKDOWN_FILE = config_markdown.get('file_name', 'bug_crawler/result/{repo}_{bug_type}_bugs.md').format(
+    repo=config['repo'], bug_type=config['bug_type'])
+
+
+def parquet_schema():
+    import pyarrow as pa  # optional dependency, only needed for the Parquet sink
+    return pa.schema([
+        ("number", pa.int64()),
+        ("title", pa.string()),
+        ("body", pa.string()),
+        ("user", pa.string()),
+        ("state", pa.string()),
+        ("labels", pa.list_(pa.string())),
+        ("url", pa.string()),
+        ("created_at", pa.timestamp("s", tz="UTC")),
+        ("comments", pa.int64()),
+        ("repository_url", pa.string()),
+        ("html_url", pa.string()),
+        ("comments_thread", pa.list_(pa.struct([("user", pa.string()), ("created_at", pa.string()),
+                                                ("body", pa.string())]))),
+        ("cluster_id", pa.string()),
+        ("application_resoure", pa.string()),
+    ])
+
+
+def parquet_row(record):
+    issue = record['issue']
+    created_at = issue.get('created_at')
+    return dict(issue,
+                created_at=datetime.fromisoformat(created_at.replace('Z', '+00:00')) if created_at else None,
+                comments_thread=issue.get('comments_thread') or [],
+                cluster_id=None if record['cluster_id'] is None else str(record['cluster_id']),
+                application_resoure=record.get('answer'))
+
+
+def filter_prompt(record):
+    issue_text = f"Title: {record['title']}\n\nDescription: {record['body']}\n\nComments: {record['comments']}"
+    return FILTER_PROMPT.format(app_name=config['repo'], issue_text=issue_text)
+
+
+def csv_row(record):
+    return dict(record['issue'], cluster_id=record['cluster_id'], application_resoure=record.get('answer'))
+
+
+def result_sinks(updated_since):
+    # in a delta crawl the changed issues replace their rows of the previous results
+    sinks = [CsvSink(CSV_FILE, CSV_FIELDS, csv_row, key_field='number', merge_previous=bool(updated_since))]
+    if config_parquet.get('enabled', False):
+        # nested columns (labels, comment threads), written one row group at a time
+        sinks.append(ParquetSink(PARQUET_FILE, parquet_schema(), parquet_row, key_field='number',
+                                 merge_previous=bool(updated_since),
+                                 row_group_size=config_parquet.get('row_group_size', 1000),
+                                 compression=config_parquet.get('compression', 'zstd')))
+    if config_markdown.get('enabled', False):
+        # one section per issue processed by this run, headed by its key (owner/repo#number)
+        sinks.append(MarkdownSink(MARKDOWN_FILE, csv_row, title=f"{config['owner']}/{config['repo']} issues",
+                                  shard_size=config_markdown.get('shard_size'),
+                                  shard_by_key=config_markdown.get('shard_by_key', False)))
+    return sinks
+
+
+async def merge_batch(batch_job, updated_since):
+    """
+    Batch mode, after the crawl: sends the parked prompts to the Batch API,
+    waits for the answers and writes the parked records, answers filled in,
+    to the CSV (and Parquet) file.
+
+    Returns:
+        int: The number of issues not written because a batch request failed.
+    """
+    async with BatchClient.from_config(config_llm, OPENAI_API_KEY) as client:
+        await run_batch_job(batch_job, client, LLMCache.from_config(config_all.get('llm_cache')))
+    source = BatchJobSource(batch_job)
+    await Pipeline(source, result_sinks(updated_since), queue_size=config_pipeline.get('queue_size', 64)).run()
+    batch_job.clear()
+    return source.failed
+
+
+async def search(updated_since, batch_job=None):
+    """
+    Streams the search through comment threads, local analysis and GPT into the result files,
+    or in batch mode into the batch job.
+
+    Returns:
+        GitHubSource: the source after the run.
+    """
+    http_cache = HttpCache.from_config(config_all.get('http_cache'))
+    dedup = DedupIndex.from_config(config_dedup)
+    search_index = SearchIndex.from_config(config_all.get('search_index'))
+    llm_cache = LLMCache.from_config(config_all.get('llm_cache'))
+    # batch mode: the prompts are parked and sent to the Batch API once the search is complete
+    scheduler = (BatchCollector(batch_job, llm_cache) if batch_job
+                 else LLMScheduler.from_config(config_llm, OPENAI_API_KEY, llm_cache))
+    token_pool = GitHubTokenPool(config.get('tokens') or config['token'])
+    configure_endpoints(config.get('search_api'), config.get('graphql_api'))
+
+    source = GitHubSource(
+        config['owner'], config['repo'], token_pool,
         state=config['state'],      # Search for closed issues
         per_page=config['per_page'],
         max_pages=config['max_pages'],
         start_date=config['start_date'],
         end_date=config['end_date'],
         keywords=config['keywords'],
-        token=config['token'],
-        include_comments=False
+        include_comments=config.get('include_comments', False),
+        cache=http_cache,
+        api=config.get('api', 'rest'),
+        shard_by_date=config.get('shard_by_date', False),
+        workers=config.get('search_workers', 4),
+        updated_since=updated_since
     )
+    stages = []
+    if config.get('include_comments', False):
+        stages.append(GitHubCommentStage(token_pool, http_cache,
+                                         concurrency=config_pipeline.get('comment_workers', 4)))
+    if search_index:
+        # full-text index; unchanged issues are skipped by their fingerprint
+        stages.append(AnalysisStage(search_index=search_index,
+                                    concurrency=config_pipeline.get('analysis_workers', 4)))
+    if dedup:
+        # near-duplicate clusters (backports, clones, re-filed reports)
+        stages.append(ClusterStage(dedup))
+    # many requests in flight under the configured rate limits
+    stages.append(IssuePromptStage(scheduler, filter_prompt, config_llm.get('model', 'gpt-4.1'),
+                                   config_llm.get('temperature', 0.001), [os.path.basename(FILTER_PROMPT_FILE)],
+                                   skip_duplicates=config_dedup.get('representatives_only', False),
+                                   concurrency=config_pipeline.get('llm_workers', 16)))
+    # in batch mode the records wait in the batch job until the answers are back
+    stages += [BatchRecordSink(batch_job)] if batch_job else result_sinks(updated_since)
+    async with scheduler:
+        try:
+            await Pipeline(source, stages, queue_size=config_pipeline.get('queue_size', 64)).run()
+        finally:
+            if http_cache:
+                http_cache.close()
+            if dedup:
+                dedup.close()
+            if search_index:
+                search_index.close()
+    return source
 
-    print(f"\nFound {len(issues)} issues in the date range.")
-    for issue in issues:
-        print(f"  #{issue['number']}: {issue['title']} (Created: {issue['created_at']})")
 
-except Exception as e:
-    print(f"An error occurred: {e}")
+async def crawl():
+    """
+    Streams the search through comment threads, local analysis and GPT into the CSV file.
 
+    When a watermark of an earlier complete run exists, only the issues
+    updated since then are crawled and merged into the previous CSV. In
+    batch mode the answers are merged in once the batches are done; a run
+    that died while waiting for them resumes there.
+    """
+    watermarks = WatermarkStore.from_config(config_all.get('watermark'))
+    batch_job = BatchJob.from_config(config_all.get('llm_batch'))
 
-with open("bug_crawler/prompt_template/filter_application_resource.txt", "r") as f:
-    FILTER_PROMPT = f.read()
-
-for issue in issues:
-    issue_text = f"Title: {issue['title']}\n\nDescription: {issue['body']}\n\nComments: {issue.get('comments_thread_text', '')}"
-    response = call_openai(FILTER_PROMPT.format(app_name=config['repo'], issue_text=issue_text))
-    issue['application_resoure'] = response
+    # Delta crawl: only issues updated since the last complete run of the same search
+    query_key = build_search_query(config['owner'], config['repo'], config['state'], config['start_date'],
+                                   config['end_date'], config['keywords'])
+    if batch_job and batch_job.collected():
+        print("Resuming the batch of the last run: the search is complete, waiting for the GPT answers")
+        started = datetime.fromisoformat(batch_job.get_meta('started'))
+        updated_since = batch_job.get_meta('updated_since')
+        updated_since = datetime.fromisoformat(updated_since) if updated_since else None
+        total = batch_job.get_meta('total')
+        truncated = batch_job.get_meta('truncated', 0)
+        failed = batch_job.get_meta('failed', 0)
+    else:
+        updated_since = watermarks.since('github', query_key) if watermarks else None
+        started = datetime.now(timezone.utc)
+        if updated_since:
+            print(f"Delta crawl: fetching issues updated since {updated_since.isoformat()}")
+        source = await search(updated_since, batch_job)
+        total, truncated, failed = source.total, source.truncated, source.failed
+        if batch_job:
+            batch_job.mark_collected(started=started.isoformat(), total=total, truncated=truncated, failed=failed,
+                                     updated_since=updated_since.isoformat() if updated_since else None)
+    if batch_job:
+        try:
+            failed += await merge_batch(batch_job, updated_since)
+        finally:
+            batch_job.close()
+    print(f"\nFound {total} issues in the date range, results in {CSV_FILE}.")
+    if config_parquet.get('enabled', False):
+        print(f"Parquet copy of the results: {PARQUET_FILE}")
+    if config_markdown.get('enabled', False):
+        print(f"Markdown report: {MARKDOWN_FILE}")
 
+    if watermarks:
+        # a search that was cut off did not see every issue, and failed issues must be crawled again,
+        # so neither may advance the watermark
+        if truncated:
+            print(f"Watermark not updated: {truncated} search(es) had more results than could be fetched")
+        elif failed:
+            print(f"Watermark not updated: {failed} issue(s) failed and will be crawled again next run")
+        else:
+            watermarks.set('github', query_key, started)
+        watermarks.close()
 
-import pandas as pd
-df = pd.json_normalize(issues)
-df.to_csv(config_csv['file_name'].format(repo=config['repo'], bug_type=config['bug_type']))
 
+def main():
+    exporter = MetricsExporter.from_config(config_all.get('metrics'))
+    if exporter:
+        exporter.start()
+    try:
+        asyncio.run(crawl())
+    except Exception as e:
+        print(f"An error occurred: {e}")
+    finally:
+        if exporter:
+            exporter.stop()
 
 
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,31 @@
 import os
+import sys
+import glob
 import json
-import requests
-from tqdm import tqdm
-from openpyxl import Workbook, load_workbook
+import socket
+import asyncio
+import argparse
+import subprocess
+from datetime import datetime
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from service.gpt_service.util import get_gpt_answer
+from crawl_engine import CrawlEngine
+from http_cache import HttpCache
+from result_store import ResultStore, JIRA_RESULT_HEADER
+from pipeline import Pipeline
+from pipeline_stages import (AnalysisStage, BatchJobSource, BatchRecordSink, ClusterStage, JiraAttachmentStage,
+                             JiraSource, LogQuestionStage, MarkdownSink, ParquetSink, QueueCommitStage, QueueSource,
+                             XlsxSink, compact_parquet, jira_record)
+from jira_fetcher import fetch_search_page, latest_update
+from work_queue import WorkQueue
+from metrics import MetricsExporter
+from service.gpt_service.llm_batch import BatchClient, BatchCollector, BatchJob, run_batch_job
+from service.gpt_service.llm_cache import LLMCache
+from service.gpt_service.llm_scheduler import LLMScheduler
+from service.gpt_service.util import API_KEY
+from log_scanner import format_signatures
+from dedup import DedupIndex
+from search_index import SearchIndex
+from watermark import WatermarkStore, jql_updated_since
 
 def load_config(file):
     with open(file, "r", encoding="utf-8") as f:
@@ -21,14 +41,64 @@ JIRA_BROWSE_URL = config["jira"]["browse_url"]
 BUG_TYPE = config["jira"]["bug_type"]
 MAX_TOTAL_ISSUES = config["jira"]["max_total_issues"]
 PAGE_SIZE = config["jira"]["page_size"]
+SEARCH_FAN_OUT = config["jira"].get("search_fan_out", 4)
+# fields returned by the search; including "attachment" saves one issue detail request per issue
+SEARCH_FIELDS = config["jira"].get("search_fields")
 MIN_LOG_LINE = config["jira"]["min_log_line"]
-SAVE_EVERY = config["jira"]["save_every"]
 ATTACHMENT_FILE_TYPES = config["jira"]["attachment_file_types"]
-GPT_MAX_ATTACHMENT_LINE = config["jira"]["gpt_max_attachment_line"]
+GPT_LOG_TOKEN_BUDGET = config["jira"].get("gpt_log_token_budget", 6000)
+# only logs with a local memory signature (OOM, GC overhead, killed process, ...) are sent to GPT
+SIGNATURE_PREFILTER = config["jira"].get("signature_prefilter", True)
 LOG_SAVE_PATH = config["jira"]["log_save_path"]
+# .gz / .zip / tarball attachments are unpacked and their files treated as attachments
+EXPAND_ARCHIVES = config["jira"].get("expand_archives", False)
+JQL = config["jira"]["jql"].format(search_term=BUG_TYPE)
+
+# http config
+HTTP_CONFIG = config.get("http", {})
+HTTP_CACHE_CONFIG = config.get("http_cache")
+
+# llm config
+LLM_CONFIG = config.get("llm", {})
+GPT_MODEL = LLM_CONFIG.get("model", "gpt-4")
+LLM_CACHE_CONFIG = config.get("llm_cache")
+# batch mode: prompts go to the OpenAI Batch API and the answers are merged into the results afterwards
+LLM_BATCH_CONFIG = config.get("llm_batch")
+
+# delta crawl config
+WATERMARK_CONFIG = config.get("watermark")
+
+# near-duplicate clustering config
+DEDUP_CONFIG = config.get("dedup")
+# send only the first issue of each near-duplicate cluster to GPT
+DEDUP_REPRESENTATIVES_ONLY = (DEDUP_CONFIG or {}).get("representatives_only", False)
+
+# full-text index config
+SEARCH_INDEX_CONFIG = config.get("search_index")
+
+# sharded crawl config: lease-based work queue shared by the worker processes
+WORK_QUEUE_CONFIG = config.get("work_queue")
+
+# pipeline config: workers per stage and the bound of the queues between stages
+PIPELINE_CONFIG = config.get("pipeline", {})
+
+# metrics config: latency histograms and counters, exported to a file while the crawl runs
+METRICS_CONFIG = config.get("metrics")
 
 # excel config
 EXCEL_FILE = config["excel"]["file_name"].format(bug_type=BUG_TYPE)
+# append-only result store the Excel file is exported from
+RESULT_STORE_FILE = config["excel"]["store_file_name"].format(bug_type=BUG_TYPE)
+
+# parquet config: optional columnar copy of the results with nested attachments (needs pyarrow)
+PARQUET_CONFIG = config.get("parquet") or {}
+PARQUET_FILE = (PARQUET_CONFIG.get("file_name", "result/apache_{bug_type}_bugs.parquet").format(bug_type=BUG_TYPE)
+                if PARQUET_CONFIG.get("enabled", False) else None)
+
+# markdown config: optional markdown report of the issues processed by a run, one section per issue
+MARKDOWN_CONFIG = config.get("markdown") or {}
+MARKDOWN_FILE = (MARKDOWN_CONFIG.get("file_name", "result/apache_{bug_type}_bugs.md").format(bug_type=BUG_TYPE)
+                 if MARKDOWN_CONFIG.get("enabled", False) else None)
 
 # predefined rules & prompt question
 PREDEFINED_RULE_FILE = './prompt_template/predefined_rules.txt'
@@ -43,169 +113,476 @@ QUESTIONS_FOR_GPT = [
     open(prompt_template_file, 'r').read()
     for prompt_template_file in PROMPT_QUESTION_FILE
 ]
+# template file names behind each question, recorded with cached answers for invalidation
+QUESTION_TEMPLATES = [
+    [os.path.basename(prompt_template_file)] + ([os.path.basename(PREDEFINED_RULE_FILE)] if q_index == 0 else [])
+    for q_index, prompt_template_file in enumerate(PROMPT_QUESTION_FILE)
+]
 
-def fetch_memory_bugs():
-    jql_query = config["jira"]["jql"].format(search_term=BUG_TYPE)
-
-    start_at = 0
-    all_bugs = []
-
-    while start_at < MAX_TOTAL_ISSUES:
-        params = {
-            "jql": jql_query,
-            "startAt": start_at,
-            "maxResults": PAGE_SIZE
-        }
-
-        response = requests.get(JIRA_SEARCH_API, params=params)
-        response.raise_for_status()
-        data = response.json()
-
-        issues = data.get("issues", [])
-        if not issues:
-            break
-
-        all_bugs.extend(issues)
-        print(f"Fetched {len(issues)} issues (startAt={start_at})")
-
-        start_at += PAGE_SIZE
-        if start_at >= data.get("total", 0):
-            break
-
-    return all_bugs
-
+def result_row(record):
+    """The result row of one issue: its links, then per log its signatures and GPT answers."""
+    key = record["key"]
+    issue_link = f"{JIRA_BROWSE_URL}{key}"
+    excel_line = [key, record["title"], issue_link, record["cluster_id"] or ""]
+    if not record["attachments"]:
+        return excel_line + ["None", "0"]
+
+    for attachment_link, _, line_count, _ in record["attachments"]:
+        # filter logs < 100 lines
+        if isinstance(line_count, int) and line_count < MIN_LOG_LINE:
+            continue
+        file_type = Path(attachment_link).suffix[1:] or "unknown"
+        excel_line.append(attachment_link)
+        excel_line.append(f"{file_type}, {line_count}")
+        if attachment_link in record["signatures"]:
+            excel_line.append(format_signatures(record["signatures"][attachment_link]))
+            excel_line.extend(record["answers"].get(attachment_link, []))
+        else:
+            excel_line.append("N/A")
+    return excel_line
+
+
+def parquet_schema():
+    import pyarrow as pa  # optional dependency, only needed for the Parquet sink
+    signature = pa.struct([("label", pa.string()), ("count", pa.int64()), ("offsets", pa.list_(pa.int64()))])
+    attachment = pa.struct([
+        ("link", pa.string()),
+        ("file_name", pa.string()),
+        ("file_type", pa.string()),
+        ("line_count", pa.int64()),
+        ("scanned", pa.bool_()),
+        ("signatures", pa.list_(signature)),
+        ("answers", pa.list_(pa.string())),
+    ])
+    return pa.schema([
+        ("key", pa.string()),
+        ("summary", pa.string()),
+        ("link", pa.string()),
+        ("created", pa.timestamp("ms", tz="UTC")),
+        ("resolution", pa.string()),
+        ("cluster_id", pa.string()),
+        ("attachments", pa.list_(attachment)),
+    ])
+
+
+def parquet_row(record):
+    """The Parquet row of one issue: every attachment, not only the logs long enough for the Excel report."""
+    key = record["key"]
+    fields = record["issue"].get("fields", {})
+    created = fields.get("created")
+    attachments = []
+    for attachment_link, file_name, line_count, _ in record["attachments"]:
+        signatures = record["signatures"].get(attachment_link)
+        attachments.append({
+            "link": attachment_link,
+            "file_name": file_name,
+            "file_type": Path(attachment_link).suffix[1:] or "unknown",
+            "line_count": line_count if isinstance(line_count, int) else None,
+            "scanned": signatures is not None,
+            "signatures": [{"label": label, "count": count, "offsets": offsets}
+                           for label, (count, offsets) in (signatures or {}).items()],
+            "answers": record["answers"].get(attachment_link, []),
+        })
+    return {
+        "key": key,
+        "summary": record["title"],
+        "link": f"{JIRA_BROWSE_URL}{key}",
+        "created": datetime.strptime(created, "%Y-%m-%dT%H:%M:%S.%f%z") if created else None,
+        "resolution": (fields.get("resolution") or {}).get("name"),
+        "cluster_id": record["cluster_id"],
+        "attachments": attachments,
+    }
+
+
+def markdown_row(record):
+    """The markdown section of one issue: its links, then per attachment its signatures and GPT answers."""
+    key = record["key"]
+    attachments = []
+    for attachment_link, _, line_count, _ in record["attachments"]:
+        signatures = record["signatures"].get(attachment_link)
+        attachments.append({
+            "Attachment Link": attachment_link,
+            "Attachment type & lines": f"{Path(attachment_link).suffix[1:] or 'unknown'}, {line_count}",
+            "Memory signatures": "N/A" if signatures is None else format_signatures(signatures),
+            "GPT response": record["answers"].get(attachment_link, []),
+        })
+    return {
+        "Summary": record["title"],
+        "Issue Link": f"{JIRA_BROWSE_URL}{key}",
+        "Cluster": record["cluster_id"] or "",
+        "Attachments": attachments,
+    }
+
+
+def worker_parquet_file(worker_id):
+    """Where a worker of a sharded crawl writes its rows; the files are merged into PARQUET_FILE at the end."""
+    return os.path.join(PARQUET_FILE + ".workers", f"{worker_id}.parquet")
+
+
+def open_result_store():
+    """Opens the result store, importing the Excel file of a pre-store run so it can be resumed."""
+    store = ResultStore(RESULT_STORE_FILE)
+    if len(store) == 0 and os.path.exists(EXCEL_FILE):
+        imported = store.import_xlsx(EXCEL_FILE)
+        print(f"📥 已从 {EXCEL_FILE} 导入 {imported} 个 issue")
+    return store
+
+
+def llm_config_share(share):
+    """The "llm" config section with its rate budgets split between `share` worker processes."""
+    return dict(LLM_CONFIG,
+                requests_per_minute=max(1, LLM_CONFIG.get("requests_per_minute", 500) // share),
+                tokens_per_minute=max(1, LLM_CONFIG.get("tokens_per_minute", 30000) // share))
+
+
+def result_sinks(store, xlsx_file=EXCEL_FILE, parquet_file=PARQUET_FILE, markdown_file=MARKDOWN_FILE):
+    """The result store (exported to `xlsx_file` at the end), and the Parquet and markdown files when given."""
+    sinks = [XlsxSink(store, xlsx_file, JIRA_RESULT_HEADER, result_row)]
+    if markdown_file:
+        sinks.append(MarkdownSink(markdown_file, markdown_row, title=f"Apache {BUG_TYPE} bugs",
+                                  shard_size=MARKDOWN_CONFIG.get("shard_size"),
+                                  shard_by_key=MARKDOWN_CONFIG.get("shard_by_key", False)))
+    if parquet_file:
+        # the previous rows are kept like those of the result store; reprocessed issues replace theirs
+        sinks.append(ParquetSink(parquet_file, parquet_schema(), parquet_row, key_field="key", merge_previous=True,
+                                 row_group_size=PARQUET_CONFIG.get("row_group_size", 1000),
+                                 compression=PARQUET_CONFIG.get("compression", "zstd")))
+    return sinks
+
+
+async def run_pipeline(make_source, store, xlsx_file=EXCEL_FILE, llm_config=LLM_CONFIG, progress=True,
+                       parquet_file=PARQUET_FILE, markdown_file=MARKDOWN_FILE, batch_job=None):
+    """
+    Runs the issues of `make_source(engine)` through attachments, local analysis, GPT and the result store
+    (and the Parquet file, when one is given).
+
+    With a `batch_job`, the prompts and the records are parked in it instead
+    (see `merge_batch`).
+
+    Returns:
+        tuple: (source, xlsx sink, or None with a batch job) after the run.
+    """
+    cache = HttpCache.from_config(HTTP_CACHE_CONFIG)
+    llm_cache = LLMCache.from_config(LLM_CACHE_CONFIG)
+    if batch_job:
+        scheduler = BatchCollector(batch_job, llm_cache)
+    else:
+        scheduler = LLMScheduler.from_config(llm_config, API_KEY, llm_cache)
+    dedup = DedupIndex.from_config(DEDUP_CONFIG)
+    search_index = SearchIndex.from_config(SEARCH_INDEX_CONFIG)
+    questions = [
+        ((PREDEFINED_RULE_FOR_GPT if q_index == 0 else "") + question, QUESTION_TEMPLATES[q_index])
+        for q_index, question in enumerate(QUESTIONS_FOR_GPT)
+    ]
+    async with CrawlEngine.from_config(HTTP_CONFIG, cache) as engine, scheduler:
+        source = make_source(engine)
+        stages = [
+            JiraAttachmentStage(engine, JIRA_ISSUE_DETAIL_API, LOG_SAVE_PATH, EXPAND_ARCHIVES,
+                                concurrency=PIPELINE_CONFIG.get("attachment_workers", 8)),
+            AnalysisStage(ATTACHMENT_FILE_TYPES, MIN_LOG_LINE, search_index,
+                          concurrency=PIPELINE_CONFIG.get("analysis_workers", 4)),
+        ]
+        if dedup:
+            stages.append(ClusterStage(dedup))
+        # OpenAI restrict GPT-4 model's maximum context length is 8192 tokens,
+        # so each log is reduced once to GPT_LOG_TOKEN_BUDGET tokens and shared by all questions.
+        stages.append(LogQuestionStage(scheduler, questions, GPT_MODEL, GPT_LOG_TOKEN_BUDGET, SIGNATURE_PREFILTER,
+                                       DEDUP_REPRESENTATIVES_ONLY,
+                                       concurrency=PIPELINE_CONFIG.get("llm_workers", 16)))
+        if batch_job:
+            # the records wait in the batch job until the answers are back
+            sink = None
+            stages.append(BatchRecordSink(batch_job))
+        else:
+            sinks = result_sinks(store, xlsx_file, parquet_file, markdown_file)
+            sink = sinks[0]
+            stages += sinks
+        if isinstance(source, QueueSource):
+            # a unit is done only once its row is stored
+            stages.append(QueueCommitStage(source))
+        pipeline = Pipeline(source, stages, queue_size=PIPELINE_CONFIG.get("queue_size", 64), progress=progress)
+        try:
+            await pipeline.run()
+        finally:
+            if cache:
+                cache.close()
+            if dedup:
+                dedup.close()
+            if search_index:
+                search_index.close()
+    return source, sink
+
+
+async def merge_batch(batch_job, store, xlsx_file=EXCEL_FILE, parquet_file=PARQUET_FILE):
+    """
+    Batch mode, after the crawl: sends the parked prompts to the Batch API,
+    waits for the answers and writes the parked records, answers filled in,
+    to the result store (and the Parquet file). Picks up the batches of a
+    run that died while waiting for them.
+
+    Returns:
+        tuple: (XlsxSink after the run, number of issues not written because a batch request failed).
+    """
+    async with BatchClient.from_config(LLM_CONFIG, API_KEY) as client:
+        await run_batch_job(batch_job, client, LLMCache.from_config(LLM_CACHE_CONFIG))
+    sinks = result_sinks(store, xlsx_file, parquet_file)
+    source = BatchJobSource(batch_job)
+    await Pipeline(source, sinks, queue_size=PIPELINE_CONFIG.get("queue_size", 64)).run()
+    batch_job.clear()
+    return sinks[0], source.failed
+
+
+def set_watermark(watermarks, latest, total, failed=0):
+    # a search cut off by max_total_issues did not see every issue, and failed issues must be crawled again,
+    # so neither may advance the watermark
+    if total >= MAX_TOTAL_ISSUES:
+        print(f"⚠️ 已达到 max_total_issues={MAX_TOTAL_ISSUES}，水位线未更新")
+    elif failed:
+        print(f"⚠️ {failed} 个 issue 处理失败，水位线未更新，下次运行将重新抓取")
+    elif latest is not None:
+        watermarks.set("jira", JQL, latest)
+
+
+async def probe_latest_update():
+    """The watermark this run may record: the latest update JIRA reports for the JQL, read before the crawl."""
+    async with CrawlEngine.from_config(HTTP_CONFIG) as engine:
+        return await latest_update(engine, JIRA_SEARCH_API, JQL)
+
+
+def delta_since(watermarks):
+    updated_since = watermarks.since("jira", JQL) if watermarks else None
+    if updated_since:
+        print(f"🔄 增量抓取：仅获取 {updated_since:%Y-%m-%d %H:%M} 之后更新的 issue")
+    return updated_since
+
+
+async def crawl():
+    """
+    Streams the search through the pipeline in this process.
+
+    Rows are stored while later pages are still being fetched. When a
+    watermark of an earlier complete run exists, only the issues updated
+    since then are crawled and merged into the result store.
+    """
+    store = open_result_store()
+    watermarks = WatermarkStore.from_config(WATERMARK_CONFIG)
+    batch_job = BatchJob.from_config(LLM_BATCH_CONFIG)
+    try:
+        if batch_job and batch_job.collected():
+            print("🔁 继续上次的 batch：爬取已完成，等待 GPT 回答")
+            latest = batch_job.get_meta("latest")
+            latest = datetime.fromisoformat(latest) if latest else None
+            total = batch_job.get_meta("total")
+            failed = batch_job.get_meta("failed", 0)
+        else:
+            latest = await probe_latest_update() if watermarks else None
+            updated_since = delta_since(watermarks)
+            # issues parked in the batch job by an interrupted run are not crawled again
+            skip_keys = None if updated_since else store.keys() | (batch_job.keys() if batch_job else set())
+            # in a delta crawl every changed issue is processed again and its row replaced
+            source, sink = await run_pipeline(
+                lambda engine: JiraSource(engine, JIRA_SEARCH_API, jql_updated_since(JQL, updated_since), PAGE_SIZE,
+                                          MAX_TOTAL_ISSUES, fan_out=SEARCH_FAN_OUT, fields=SEARCH_FIELDS,
+                                          skip_keys=skip_keys),
+                store, batch_job=batch_job)
+            total = source.total
+            failed = source.failed
+            if batch_job:
+                batch_job.mark_collected(latest=latest.isoformat() if latest else None, total=total, failed=failed)
+        if batch_job:
+            sink, batch_failed = await merge_batch(batch_job, store)
+            failed += batch_failed
+    finally:
+        store.close()
+        if batch_job:
+            batch_job.close()
+
+    if watermarks:
+        set_watermark(watermarks, latest, total, failed)
+        watermarks.close()
+    print(f"\n✅ 最终写入完成：{EXCEL_FILE}（共写入 {sink.count} 个 issue）")
+    if PARQUET_FILE:
+        print(f"✅ Parquet 文件：{PARQUET_FILE}")
+    if MARKDOWN_FILE:
+        print(f"✅ Markdown 报告：{MARKDOWN_FILE}")
+    return total
+
+
+def issue_units(bugs, written_keys=()):
+    return [("issue", bug.get("key"), bug) for bug in bugs if bug.get("key") not in written_keys]
+
+
+async def plan_units(queue, jql, written_keys, probe=False):
+    """
+    Queues the work of a sharded crawl: the issues of the first search page,
+    which is fetched to learn the total, and one unit per further page.
+
+    Returns:
+        tuple: (issues planned, the latest update of the JQL's issues if `probe`, see `latest_update`)
+    """
+    cache = HttpCache.from_config(HTTP_CACHE_CONFIG)
+    latest = None
+    try:
+        async with CrawlEngine.from_config(HTTP_CONFIG, cache) as engine:
+            if probe:
+                latest = await latest_update(engine, JIRA_SEARCH_API, JQL)
+            first = await fetch_search_page(engine, JIRA_SEARCH_API, jql, 0, PAGE_SIZE, SEARCH_FIELDS)
+    finally:
+        if cache:
+            cache.close()
+    # the server may cap maxResults below what was requested
+    step = first.get("maxResults") or PAGE_SIZE
+    total = min(first.get("total", 0), MAX_TOTAL_ISSUES)
+    queue.add_many(issue_units(first.get("issues", []), written_keys))
+    queue.add_many(("page", str(start_at), {"jql": jql, "start_at": start_at, "skip_written": bool(written_keys)})
+                   for start_at in range(step, total, step))
+    return total, latest
+
+
+async def crawl_worker(worker_id, share=1):
+    """
+    One worker of a sharded crawl: claims search pages and issues from the
+    work queue and runs the issues through the pipeline until the queue is
+    drained. Workers on other machines can join if they share the result
+    directory.
+    """
+    queue = WorkQueue.from_config(WORK_QUEUE_CONFIG)
+    store = ResultStore(RESULT_STORE_FILE)
+    batch_job = BatchJob.from_config(LLM_BATCH_CONFIG)
+    written_keys = store.keys()
+
+    def make_source(engine):
+        async def expand_page(unit):
+            payload = unit["payload"]
+            data = await fetch_search_page(engine, JIRA_SEARCH_API, payload["jql"], payload["start_at"], PAGE_SIZE,
+                                           SEARCH_FIELDS)
+            return issue_units(data.get("issues", []), written_keys if payload["skip_written"] else ())
+
+        return QueueSource(queue, worker_id, lambda unit: jira_record(unit["payload"]), {"page": expand_page})
 
-def fetch_attachments_with_linecount(issue_key):
-    """返回 issue_key, [(attachment_link, line_count)]"""
-    url = f"{JIRA_ISSUE_DETAIL_API}{issue_key}"
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        attachments = data.get("fields", {}).get("attachment", [])
-        result = []
-
-        for att in attachments:
-            att_url = att["content"]
-            att_file_name = att['filename']
-            try:
-                content_resp = requests.get(att_url, timeout=10)
-                content_resp.raise_for_status()
-                text = content_resp.text
-                line_count = len(text.strip().splitlines())
-            except Exception as e:
-                print(f"⚠️ 附件无法获取：{att_url}，Error：{e}")
-                line_count = "N/A"
-
-            result.append((att_url, att_file_name, line_count))
-
-        return issue_key, result
-
-    except Exception as e:
-        print(f"❌ 获取 issue {issue_key} 附件失败: {e}")
-        return issue_key, []
-
-
-def load_written_issue_keys():
-    if not os.path.exists(EXCEL_FILE):
-        return set()
-
-    wb = load_workbook(EXCEL_FILE)
-    sheet = wb.active
-    keys = set()
-    for row in sheet.iter_rows(min_row=2, values_only=True):
-        if row[0]:
-            keys.add(row[0])
-    return keys
-
-
-def save_to_excel_incremental(bugs, attachment_map, save_every=SAVE_EVERY):
-    if os.path.exists(EXCEL_FILE):
-        workbook = load_workbook(EXCEL_FILE)
-        sheet = workbook.active
+        source, _ = await run_pipeline(make_source, store, xlsx_file=None, llm_config=llm_config_share(share),
+                                       progress=False,
+                                       parquet_file=worker_parquet_file(worker_id) if PARQUET_FILE else None,
+                                       # one process cannot append to another's markdown report
+                                       markdown_file=None, batch_job=batch_job)
+    finally:
+        store.close()
+        queue.close()
+        if batch_job:
+            batch_job.close()
+    print(f"✅ worker {worker_id}：处理了 {source.total} 个 issue")
+
+
+def drain_queue(queue, store, watermarks, workers):
+    """
+    Plans the crawl into the work queue, unless an interrupted one is still
+    in it, and runs `workers` worker processes until the queue is drained.
+
+    Returns:
+        tuple: (issues planned, or None when an earlier plan was resumed, the watermark to record,
+            failed units, unfinished units)
+    """
+    total = latest = None
+    if queue.outstanding():
+        print(f"🔁 继续上次未完成的分片抓取（剩余 {queue.outstanding()} 个单元）")
     else:
-        workbook = Workbook()
-        sheet = workbook.active
-        sheet.title = "Memory Bugs"
-        sheet.append(["Issue Key", "Summary", "Issue Link", "Attachment Link", "Attachment type & lines", "GPT response"])
-
-    written_keys = load_written_issue_keys()
-    count_since_last_save = 0
-
-    print("\n📄 增量写入 Excel 文件（每写入 {} 条自动保存）...\n".format(save_every))
-
-    for bug in tqdm(bugs, desc="写入进度", ncols=100):
-        key = bug.get("key")
-        # skip lines that are already written
-        if key in written_keys:
-            print(f"Case {key} already exists in Excel. Skipping write operation to Excel.")
-            continue
-
-        summary = bug.get("fields", {}).get("summary", "")
-        issue_link = f"{JIRA_BROWSE_URL}{key}"
-        attachments = attachment_map.get(key, [])
-
-        if attachments:
-            excel_line = [key, summary, issue_link]
-            for index, (attachment_link, attachment_file_name, line_count) in enumerate(attachments):
-                # filter logs < 100 lines
-                if isinstance(line_count, int) and line_count < MIN_LOG_LINE:
-                    continue
-                file_type = Path(attachment_link).suffix[1:] or "unknown"
-                excel_line.append(attachment_link)
-                excel_line.append(f"{file_type}, {line_count}")
-                # insert GPT response into the excel result.
-                if file_type in ATTACHMENT_FILE_TYPES:
-                    # download log file into local folder '/bug_cases/logs'.
-                    response = requests.get(attachment_link)
-                    full_save_path = LOG_SAVE_PATH + key + f"/{attachment_file_name}"
-                    if response.status_code == 200:
-                        # Ensure the directory exists
-                        os.makedirs(os.path.dirname(full_save_path), exist_ok=True)
-                        with open(full_save_path, 'wb') as f:
-                            f.write(response.content)
-                        print(f"{key} - {attachment_file_name} is downloaded successfully.")
-                    # OpenAI restrict GPT-4 model's maximum context length is 8192 tokens.
-                    if line_count > GPT_MAX_ATTACHMENT_LINE:
-                        continue
-                    for q_index, question in enumerate(QUESTIONS_FOR_GPT):
-                        if q_index == 0:
-                            question = PREDEFINED_RULE_FOR_GPT + question
-                        try:
-                            response = get_gpt_answer(question, full_save_path)
-                        except Exception as e:
-                            response = f"Can't get response from GPT: {e}"
-                        excel_line.append(response)
-            sheet.append(excel_line)
+        updated_since = delta_since(watermarks)
+        queue.clear()
+        # in a delta crawl every changed issue is processed again and its row replaced
+        total, latest = asyncio.run(plan_units(queue, jql_updated_since(JQL, updated_since),
+                                               set() if updated_since else store.keys(), probe=bool(watermarks)))
+
+    processes = [subprocess.Popen([sys.executable, os.path.abspath(__file__), "--worker", "--share", str(workers)])
+                 for _ in range(workers)]
+    for process in processes:
+        process.wait()
+
+    stats = queue.stats()
+    unfinished = queue.outstanding()
+    failed = sum(states.get("failed", 0) for states in stats.values())
+    for kind, states in stats.items():
+        print(f"  {kind}: " + "  ".join(f"{state} {count}" for state, count in states.items()))
+    return total, latest, failed, unfinished
+
+
+def crawl_sharded(workers):
+    """
+    Plans the crawl into the work queue and drains it with `workers` worker processes.
+
+    Log scanning, reduction and indexing are CPU-bound, so separate
+    processes scale where threads of one process cannot. An interrupted
+    sharded crawl resumes from the queue; leases of crashed workers expire
+    and their units are claimed again.
+    """
+    queue = WorkQueue.from_config(WORK_QUEUE_CONFIG)
+    store = open_result_store()
+    watermarks = WatermarkStore.from_config(WATERMARK_CONFIG)
+    batch_job = BatchJob.from_config(LLM_BATCH_CONFIG)
+    if batch_job and batch_job.collected():
+        # the workers parked every record; only the batches of the last run are left to finish
+        print("🔁 继续上次的 batch：爬取已完成，等待 GPT 回答")
+        latest = batch_job.get_meta("latest")
+        latest = datetime.fromisoformat(latest) if latest else None
+        total = batch_job.get_meta("total")
+        failed = batch_job.get_meta("failed", 0)
+        unfinished = 0
+    else:
+        total, latest, failed, unfinished = drain_queue(queue, store, watermarks, workers)
+        if batch_job and not unfinished:
+            batch_job.mark_collected(latest=latest.isoformat() if latest else None, total=total, failed=failed)
+    queue.close()
+    if batch_job:
+        if batch_job.collected():
+            _, batch_failed = asyncio.run(merge_batch(batch_job, store, xlsx_file=None))
+            failed += batch_failed
         else:
-            sheet.append([key, summary, issue_link, "None", "0"])
-
-        written_keys.add(key)
-        count_since_last_save += 1
-
-        if count_since_last_save >= save_every:
-            workbook.save(EXCEL_FILE)
-            print(f"💾 中间保存 Excel（已写入 {len(written_keys)} 个 issue）")
-            count_since_last_save = 0
-
-    workbook.save(EXCEL_FILE)
-    print(f"\n✅ 最终写入完成：{EXCEL_FILE}（共写入 {len(written_keys)} 个 issue）")
+            print(f"⚠️ 仍有 {unfinished} 个单元未完成，batch 暂不提交；重新运行以继续")
+        batch_job.close()
+    count = store.export_xlsx(EXCEL_FILE, JIRA_RESULT_HEADER)
+    store.close()
+    if PARQUET_FILE:
+        part_files = sorted(glob.glob(worker_parquet_file("*")))
+        compact_parquet(PARQUET_FILE, part_files, parquet_schema(), "key",
+                        row_group_size=PARQUET_CONFIG.get("row_group_size", 1000),
+                        compression=PARQUET_CONFIG.get("compression", "zstd"))
+        workers_dir = os.path.dirname(worker_parquet_file("*"))
+        if os.path.isdir(workers_dir) and not os.listdir(workers_dir):
+            os.rmdir(workers_dir)
+    if watermarks:
+        # only a crawl planned and completed by this run may advance the watermark
+        if total is not None and not unfinished:
+            set_watermark(watermarks, latest, total, failed)
+        watermarks.close()
+    print(f"\n✅ 最终写入完成：{EXCEL_FILE}（共写入 {count} 个 issue）")
+    return total
 
 
 def main():
-    bugs = fetch_memory_bugs()
-    print(f"\n📦 共获取到 {len(bugs)} 个 memory 相关的 Bug。\n")
-
-    attachment_map = {}
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        future_to_key = {executor.submit(fetch_attachments_with_linecount, bug["key"]): bug["key"] for bug in bugs}
-        for future in as_completed(future_to_key):
-            try:
-                issue_key, attachments = future.result()
-                attachment_map[issue_key] = attachments
-            except Exception as e:
-                print(f"⚠️ 获取附件失败：{e}")
-    save_to_excel_incremental(bugs, attachment_map)
+    parser = argparse.ArgumentParser(description="Crawl JIRA bugs with their logs into the result store and Excel.")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Shard the crawl over this many worker processes through the work queue.")
+    parser.add_argument("--worker", action="store_true",
+                        help="Run one worker of a sharded crawl (started by --workers, or by hand to join one).")
+    parser.add_argument("--worker-id", default=f"{socket.gethostname()}-{os.getpid()}")
+    parser.add_argument("--share", type=int, default=1,
+                        help="With --worker: number of workers the LLM rate limits are split between.")
+    args = parser.parse_args()
+
+    # every worker process of a sharded crawl writes its own metrics file
+    exporter = MetricsExporter.from_config(METRICS_CONFIG, suffix=args.worker_id if args.worker else None)
+    if exporter:
+        exporter.start()
+    try:
+        if args.worker:
+            asyncio.run(crawl_worker(args.worker_id, args.share))
+            return
+        total = crawl_sharded(args.workers) if args.workers > 0 else asyncio.run(crawl())
+        if total is not None:
+            print(f"\n📦 共获取到 {total} 个 memory 相关的 Bug。\n")
+    finally:
+        if exporter:
+            exporter.stop()
 
 
 if __name__ == "__main__":
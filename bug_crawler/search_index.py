@@ -0,0 +1,217 @@
+import argparse
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from log_access import iter_line_chunks
+
+DEFAULT_INDEX_FILE = "result/search_index.sqlite"
+# Logs are indexed in pieces of about this size, so a hit points at a region of the file.
+INDEX_CHUNK_SIZE = 256 * 1024
+# bm25 weights of the columns key, source, title, body, comments, attachment, content
+COLUMN_WEIGHTS = (10.0, 0.0, 5.0, 2.0, 1.0, 2.0, 1.0)
+
+
+class SearchIndex:
+    """
+    Incremental SQLite FTS5 index over crawled issues and their attachments.
+
+    Issues are indexed as one document (key, title, body, comments);
+    attachments as a series of documents of about INDEX_CHUNK_SIZE bytes,
+    each remembering the line it starts at. Every document group carries a
+    fingerprint (a hash of the issue text, or the size and mtime of the
+    file), so re-indexing after a delta crawl only rewrites what changed.
+
+    Queries use the FTS5 syntax: phrases ("GC overhead"), boolean operators,
+    prefixes (alloc*) and column filters (title:oom, content:"Killed process",
+    source:github). Results are ranked with bm25 and come with snippets.
+
+    Usage:
+        index = SearchIndex("result/search_index.sqlite")
+        index.add_issue("jira", "FLINK-1", "title", "description", attachments=[("tm.log", "/logs/tm.log")])
+        for hit in index.search('content:"OutOfMemoryError" AND title:heap'):
+            print(hit)
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS documents (
+                doc_key TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                indexed_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS chunks (
+                id INTEGER PRIMARY KEY,
+                doc_key TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS chunks_doc ON chunks (doc_key);
+            CREATE VIRTUAL TABLE IF NOT EXISTS docs USING fts5(
+                key, source, title, body, comments, attachment, content, line UNINDEXED
+            );
+        """)
+        self._conn.commit()
+
+    @classmethod
+    def from_config(cls, index_config):
+        """Build an index from the "search_index" config section, or return None if it is disabled."""
+        if not index_config or not index_config.get("enabled", True):
+            return None
+        return cls(index_config.get("path", DEFAULT_INDEX_FILE))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _fingerprint(self, doc_key):
+        row = self._conn.execute("SELECT fingerprint FROM documents WHERE doc_key = ?", (doc_key,)).fetchone()
+        return row[0] if row else None
+
+    def _replace(self, doc_key, fingerprint, rows):
+        """Swaps the documents of `doc_key` for `rows` (tuples of the docs columns) in one transaction."""
+        with self._conn:
+            stale = [chunk_id for (chunk_id,) in
+                     self._conn.execute("SELECT id FROM chunks WHERE doc_key = ?", (doc_key,))]
+            self._conn.executemany("DELETE FROM docs WHERE rowid = ?", ((chunk_id,) for chunk_id in stale))
+            self._conn.execute("DELETE FROM chunks WHERE doc_key = ?", (doc_key,))
+            for row in rows:
+                chunk_id = self._conn.execute("INSERT INTO chunks (doc_key) VALUES (?)", (doc_key,)).lastrowid
+                self._conn.execute("INSERT INTO docs (rowid, key, source, title, body, comments, attachment, "
+                                   "content, line) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", (chunk_id, *row))
+            self._conn.execute("INSERT OR REPLACE INTO documents VALUES (?, ?, ?)",
+                               (doc_key, fingerprint, time.time()))
+
+    def add_issue(self, source, key, title="", body="", comments="", attachments=()):
+        """
+        Indexes one issue and its stored attachments, skipping whatever is unchanged.
+
+        Args:
+            source (str): "jira" or "github".
+            key (str): Issue key, e.g. "FLINK-16267" or "elastic/elasticsearch#1234".
+            attachments (iterable): (attachment name, local path) pairs.
+        Returns:
+            int: The number of documents (issue + attachments) that were (re)indexed.
+        """
+        updated = 0
+        title, body, comments = title or "", body or "", comments or ""
+        fingerprint = hashlib.sha1("\0".join((title, body, comments)).encode("utf-8")).hexdigest()
+        with self._lock:
+            if self._fingerprint(key) != fingerprint:
+                self._replace(key, fingerprint, [(key, source, title, body, comments, "", "", None)])
+                updated += 1
+        for name, path in attachments:
+            updated += self.add_file(source, key, name, path)
+        return updated
+
+    def add_file(self, source, key, name, path):
+        """Indexes a local attachment in line-aligned pieces; returns 1 if it was (re)indexed, else 0."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return 0
+        doc_key = f"{key}\0{name}"
+        fingerprint = f"{stat.st_size}:{stat.st_mtime_ns}"
+        with self._lock:
+            if self._fingerprint(doc_key) == fingerprint:
+                return 0
+
+        def pieces():
+            line = 1
+            for _, chunk in iter_line_chunks(path, INDEX_CHUNK_SIZE):
+                yield key, source, "", "", "", name, chunk.decode("utf-8", errors="replace"), line
+                line += chunk.count(b"\n")
+
+        with self._lock:
+            self._replace(doc_key, fingerprint, pieces())
+        return 1
+
+    def search(self, query, limit=20, snippet_tokens=16):
+        """
+        Runs an FTS5 query and returns the best matches first.
+
+        Returns:
+            list: dicts with key, source, attachment (empty for the issue itself),
+                line (first line of the matching log piece), score and snippet.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT key, source, attachment, line, bm25(docs, {', '.join(map(str, COLUMN_WEIGHTS))}) AS score, "
+                f"snippet(docs, -1, '[', ']', '…', ?) FROM docs WHERE docs MATCH ? ORDER BY score LIMIT ?",
+                (snippet_tokens, query, limit)).fetchall()
+        return [{"key": key, "source": source, "attachment": attachment, "line": line, "score": -score,
+                 "snippet": snippet.replace("\n", " ")}
+                for key, source, attachment, line, score, snippet in rows]
+
+    def optimize(self):
+        """Merges the FTS5 b-trees; worth running after a large crawl."""
+        with self._lock:
+            self._conn.execute("INSERT INTO docs (docs) VALUES ('optimize')")
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            documents = self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+            chunks = self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        return {"documents": documents, "chunks": chunks, "bytes": os.path.getsize(self.path)}
+
+
+def index_log_dir(index, log_dir, source="jira"):
+    """Indexes a downloaded log tree laid out as `<log_dir>/<issue key>/<file>`, e.g. bug_cases/logs."""
+    updated = 0
+    for issue_key in sorted(os.listdir(log_dir)):
+        issue_dir = os.path.join(log_dir, issue_key)
+        if not os.path.isdir(issue_dir):
+            continue
+        for root, _, names in os.walk(issue_dir):
+            for name in sorted(names):
+                if name.endswith(".part") or name.startswith("."):
+                    continue
+                path = os.path.join(root, name)
+                updated += index.add_file(source, issue_key, os.path.relpath(path, issue_dir), path)
+    return updated
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Full-text index over crawled issues and downloaded logs.")
+    parser.add_argument("--db", default=DEFAULT_INDEX_FILE, help="Path of the index database.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    query_parser = subparsers.add_parser("query", help="Search the index (FTS5 syntax).")
+    query_parser.add_argument("query", help='e.g. \'content:"GC overhead" AND title:heap\'')
+    query_parser.add_argument("--limit", type=int, default=20)
+    index_parser = subparsers.add_parser("index-logs", help="Index a <dir>/<issue key>/<file> log tree.")
+    index_parser.add_argument("log_dir")
+    index_parser.add_argument("--source", default="jira")
+    subparsers.add_parser("optimize", help="Merge the index segments.")
+    subparsers.add_parser("stats", help="Show the index size.")
+    args = parser.parse_args()
+
+    index = SearchIndex(args.db)
+    if args.command == "query":
+        start = time.perf_counter()
+        hits = index.search(args.query, args.limit)
+        elapsed = (time.perf_counter() - start) * 1000
+        for hit in hits:
+            where = f"{hit['attachment']}:{hit['line']}" if hit["attachment"] else "issue"
+            print(f"{hit['score']:7.2f}  {hit['key']}  {where}\n         {hit['snippet']}")
+        print(f"{len(hits)} result(s) in {elapsed:.1f} ms")
+    elif args.command == "index-logs":
+        start = time.perf_counter()
+        updated = index_log_dir(index, args.log_dir, args.source)
+        print(f"Indexed {updated} changed file(s) in {time.perf_counter() - start:.1f}s")
+    elif args.command == "optimize":
+        index.optimize()
+    else:
+        stats = index.stats()
+        print(f"Documents: {stats['documents']}, pieces: {stats['chunks']}, size: {stats['bytes']} bytes")
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,541 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+
+import aiohttp
+
+import metrics
+from service.gpt_service.llm_scheduler import DEFAULT_BASE_URL, RETRY_STATUS
+
+DEFAULT_BATCH_FILE = "result/llm_batch.sqlite"
+POLL_INTERVAL = 60
+COMPLETION_WINDOW = "24h"
+# API limits of one batch: 50,000 requests and a 200 MB input file
+MAX_REQUESTS_PER_BATCH = 50000
+MAX_BATCH_BYTES = 190 * 1024 * 1024
+# Batch requests cost half the price of synchronous ones.
+BATCH_PRICE_FACTOR = 0.5
+TERMINAL_STATUS = {"completed", "failed", "expired", "cancelled"}
+# What the LLM stages get back in batch mode; `BatchJob.iter_records` replaces it with the answer.
+PENDING_PREFIX = "llm-batch-pending:"
+RESULT_BATCH_SIZE = 500
+
+
+class BatchJob:
+    """
+    The state of one batch mode run, in SQLite.
+
+    During the crawl the LLM stages park their prompts here as requests
+    (`BatchCollector`), and the finished records wait here with placeholders
+    in place of the answers (`BatchRecordSink`). `run_batch_job` then sends
+    the requests to the OpenAI Batch API in chunks of at most
+    `max_requests` requests, polls the batches and stores the answers, and
+    `iter_records` yields the records with the answers filled in.
+
+    Every step is recorded before the next one starts: the crawl is marked
+    collected once it is complete, and each chunk keeps its input file and
+    batch id. A run that dies while the batches are processed resumes by
+    polling them again instead of crawling and paying a second time.
+    """
+
+    def __init__(self, path=DEFAULT_BATCH_FILE, poll_interval=POLL_INTERVAL, completion_window=COMPLETION_WINDOW,
+                 max_requests=MAX_REQUESTS_PER_BATCH, max_bytes=MAX_BATCH_BYTES):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS requests (
+                custom_id TEXT PRIMARY KEY,
+                key TEXT NOT NULL,
+                model TEXT,
+                body TEXT NOT NULL,
+                cache_key TEXT,
+                templates TEXT,
+                chunk INTEGER,
+                answer TEXT,
+                error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS requests_key ON requests (key);
+            CREATE INDEX IF NOT EXISTS requests_chunk ON requests (chunk);
+            CREATE TABLE IF NOT EXISTS records (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                key TEXT UNIQUE NOT NULL,
+                record TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS chunks (
+                id INTEGER PRIMARY KEY,
+                requests INTEGER,
+                input_file_id TEXT,
+                batch_id TEXT,
+                status TEXT NOT NULL DEFAULT 'new',
+                output_file_id TEXT,
+                error_file_id TEXT,
+                updated_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                name TEXT PRIMARY KEY,
+                value TEXT
+            );
+        """)
+        self._conn.commit()
+
+    @classmethod
+    def from_config(cls, batch_config):
+        """Build a job from the "llm_batch" config section, or return None if batch mode is off."""
+        if not batch_config or not batch_config.get("enabled", False):
+            return None
+        return cls(
+            path=batch_config.get("path", DEFAULT_BATCH_FILE),
+            poll_interval=batch_config.get("poll_interval", POLL_INTERVAL),
+            completion_window=batch_config.get("completion_window", COMPLETION_WINDOW),
+            max_requests=batch_config.get("max_requests_per_batch", MAX_REQUESTS_PER_BATCH),
+        )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def get_meta(self, name, default=None):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def set_meta(self, **values):
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                                   ((name, json.dumps(value, default=str)) for name, value in values.items()))
+            self._conn.commit()
+
+    def collected(self):
+        """True once the crawl that fills the job is complete, i.e. only the batches are left to finish."""
+        return bool(self.get_meta("collected", False))
+
+    def mark_collected(self, **values):
+        """Marks the crawl complete; `values` (e.g. its start time) are kept for the run that finishes the job."""
+        self.set_meta(collected=True, **values)
+
+    @staticmethod
+    def request_id(key, body):
+        """custom_id of a request: the issue key and a digest of the request, so a re-run adds it only once."""
+        digest = hashlib.sha256(json.dumps(body, sort_keys=True).encode("utf-8")).hexdigest()
+        return f"{key}:{digest[:16]}"
+
+    def add_request(self, key, body, cache_key=None, templates=None):
+        """Parks one chat completion request; returns its custom_id."""
+        custom_id = self.request_id(key, body)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO requests (custom_id, key, model, body, cache_key, templates) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (custom_id, key, body.get("model"), json.dumps(body, ensure_ascii=False), cache_key,
+                 json.dumps(sorted(templates or []))))
+            self._conn.commit()
+        return custom_id
+
+    def add_record(self, key, record):
+        """Parks a finished record until its answers are back; an earlier record with the same key is replaced."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO records (key, record) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET record = excluded.record",
+                (key, json.dumps(record, ensure_ascii=False, default=str)))
+            self._conn.commit()
+
+    def keys(self):
+        """Keys of the parked records."""
+        with self._lock:
+            return {key for (key,) in self._conn.execute("SELECT key FROM records")}
+
+    def plan_chunks(self):
+        """Assigns the requests not yet sent to new chunks of at most `max_requests` requests and `max_bytes`."""
+        with self._lock:
+            rows = self._conn.execute("SELECT rowid, length(CAST(body AS BLOB)) FROM requests "
+                                      "WHERE chunk IS NULL AND answer IS NULL AND error IS NULL "
+                                      "ORDER BY rowid").fetchall()
+            chunks = []
+            size = 0
+            for rowid, length in rows:
+                if not chunks or len(chunks[-1]) >= self.max_requests or size + length > self.max_bytes:
+                    chunks.append([])
+                    size = 0
+                chunks[-1].append(rowid)
+                size += length + 100  # the custom_id and the request line around the body
+            for rowids in chunks:
+                chunk_id = self._conn.execute("INSERT INTO chunks (requests, updated_at) VALUES (?, ?)",
+                                              (len(rowids), time.time())).lastrowid
+                self._conn.executemany("UPDATE requests SET chunk = ? WHERE rowid = ?",
+                                       ((chunk_id, rowid) for rowid in rowids))
+            self._conn.commit()
+        return len(chunks)
+
+    def chunks(self, done=False):
+        """The chunks still in progress (or, with `done`, all of them) as dicts."""
+        query = "SELECT * FROM chunks" + ("" if done else " WHERE status != 'merged'") + " ORDER BY id"
+        with self._lock:
+            cursor = self._conn.execute(query)
+            names = [column[0] for column in cursor.description]
+            return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def update_chunk(self, chunk_id, **fields):
+        fields = {name: value for name, value in fields.items()
+                  if name in ("input_file_id", "batch_id", "status", "output_file_id", "error_file_id")}
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE chunks SET {', '.join(f'{name} = ?' for name in fields)}, updated_at = ? WHERE id = ?",
+                (*fields.values(), time.time(), chunk_id))
+            self._conn.commit()
+
+    def write_chunk_file(self, chunk_id, path):
+        """Writes the requests of a chunk as a batch input file (JSONL, one request per line)."""
+        with self._lock:
+            rows = self._conn.execute("SELECT custom_id, body FROM requests WHERE chunk = ? ORDER BY rowid",
+                                      (chunk_id,)).fetchall()
+        with open(path, "w", encoding="utf-8") as f:
+            for custom_id, body in rows:
+                f.write(f'{{"custom_id": {json.dumps(custom_id)}, "method": "POST", '
+                        f'"url": "/v1/chat/completions", "body": {body}}}\n')
+        return len(rows)
+
+    def store_results(self, results):
+        """
+        Records `(custom_id, answer, error)` results.
+
+        Returns:
+            list: (cache_key, model, answer, templates) of the new answers, for the LLM cache.
+        """
+        with self._lock:
+            self._conn.executemany("UPDATE requests SET answer = ?, error = ? WHERE custom_id = ?",
+                                   ((answer, error, custom_id) for custom_id, answer, error in results))
+            self._conn.commit()
+            answered = [custom_id for custom_id, answer, _ in results if answer is not None]
+            cacheable = []
+            for start in range(0, len(answered), RESULT_BATCH_SIZE):
+                ids = answered[start:start + RESULT_BATCH_SIZE]
+                cacheable += self._conn.execute(
+                    f"SELECT cache_key, model, answer, templates FROM requests "
+                    f"WHERE cache_key IS NOT NULL AND custom_id IN ({','.join('?' * len(ids))})", ids).fetchall()
+        return [(cache_key, model, answer, json.loads(templates)) for cache_key, model, answer, templates in cacheable]
+
+    def fail_unanswered(self, chunk_id, error):
+        """Gives the requests of a chunk that got no result (expired, cancelled or failed batch) an error."""
+        with self._lock:
+            failed = self._conn.execute("UPDATE requests SET error = ? "
+                                        "WHERE chunk = ? AND answer IS NULL AND error IS NULL",
+                                        (error, chunk_id)).rowcount
+            self._conn.commit()
+        return failed
+
+    def failed_keys(self):
+        """Keys of the parked records with a request the batches did not answer."""
+        with self._lock:
+            return {key for (key,) in self._conn.execute("SELECT DISTINCT key FROM requests WHERE error IS NOT NULL")}
+
+    def _answers(self, key):
+        with self._lock:
+            rows = self._conn.execute("SELECT custom_id, answer, error FROM requests WHERE key = ?", (key,)).fetchall()
+        return {custom_id: answer if answer is not None else f"Can't get response from GPT: {error or 'no answer'}"
+                for custom_id, answer, error in rows}
+
+    def iter_records(self):
+        """Yields the parked records in the order they were parked, with their answers in place of the placeholders."""
+        last_seq = 0
+        while True:
+            with self._lock:
+                batch = self._conn.execute("SELECT seq, key, record FROM records WHERE seq > ? ORDER BY seq LIMIT ?",
+                                           (last_seq, RESULT_BATCH_SIZE)).fetchall()
+            if not batch:
+                return
+            for _, key, record in batch:
+                record = json.loads(record)
+                answers = self._answers(key)
+                for field in ("answer", "answers"):
+                    if field in record:
+                        record[field] = _resolve(record[field], answers)
+                yield record
+            last_seq = batch[-1][0]
+
+    def stats(self):
+        with self._lock:
+            records = self._conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+            requests, answered, failed = self._conn.execute(
+                "SELECT COUNT(*), COUNT(answer), COUNT(error) FROM requests").fetchone()
+            chunks = self._conn.execute("SELECT id, batch_id, status, requests FROM chunks ORDER BY id").fetchall()
+        return {"records": records, "requests": requests, "answered": answered, "failed": failed,
+                "collected": self.collected(), "chunks": chunks}
+
+    def clear(self):
+        """Drops the job once its records are merged, so the next run starts a new one."""
+        with self._lock:
+            for table in ("requests", "records", "chunks", "meta"):
+                self._conn.execute(f"DELETE FROM {table}")
+            self._conn.commit()
+
+
+def _resolve(value, answers):
+    if isinstance(value, str) and value.startswith(PENDING_PREFIX):
+        return answers.get(value[len(PENDING_PREFIX):], "Can't get response from GPT: no answer in the batch")
+    if isinstance(value, list):
+        return [_resolve(item, answers) for item in value]
+    if isinstance(value, dict):
+        return {name: _resolve(item, answers) for name, item in value.items()}
+    return value
+
+
+class BatchCollector:
+    """
+    Takes the place of `LLMScheduler` in batch mode.
+
+    `complete` answers from the LLM cache when it can; otherwise it parks the
+    request in the `BatchJob` under the issue `key` and returns a
+    placeholder, which `BatchJob.iter_records` later replaces with the answer.
+    """
+
+    def __init__(self, job, cache=None):
+        self.job = job
+        self.cache = cache
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        pass
+
+    async def complete(self, prompt, model, temperature=None, templates=None, attachment_path=None, key=None):
+        cache_key = None
+        if self.cache:
+            cache_key = await asyncio.to_thread(self.cache.cache_key, model, temperature, prompt, attachment_path)
+            answer = self.cache.get(cache_key)
+            if answer is not None:
+                metrics.inc("crawler_llm_cache_hits_total", model=model)
+                return answer
+        body = {"model": model, "messages": [{"role": "user", "content": prompt}]}
+        if temperature is not None:
+            body["temperature"] = temperature
+        custom_id = await asyncio.to_thread(self.job.add_request, key or "issue", body, cache_key, templates)
+        metrics.inc("crawler_llm_batch_requests_total", model=model)
+        return PENDING_PREFIX + custom_id
+
+
+class BatchClient:
+    """
+    The Files and Batches endpoints of an OpenAI-compatible API.
+
+    Like the scheduler, it talks to `base_url` directly, so a local stand-in
+    (`benchmark.py serve`) can take the API's place. 429 / 5xx answers and
+    connection errors are retried with exponential backoff.
+    """
+
+    def __init__(self, api_key, base_url=DEFAULT_BASE_URL, timeout=600, max_retries=5, backoff=1.0):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._session = None
+
+    @classmethod
+    def from_config(cls, llm_config, api_key):
+        """Build a client from the "llm" section of a crawler config."""
+        return cls(api_key, base_url=llm_config.get("base_url", DEFAULT_BASE_URL),
+                   max_retries=llm_config.get("max_retries", 5))
+
+    async def __aenter__(self):
+        if not self.api_key:
+            raise RuntimeError("No OpenAI API key found for the batch client.")
+        self._session = aiohttp.ClientSession(headers={"Authorization": f"Bearer {self.api_key}"},
+                                              timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._session.close()
+        self._session = None
+
+    async def _open(self, method, path, json_body=None, make_form=None):
+        """Sends a request, retrying 429 / 5xx answers and connection errors; returns the 200 response."""
+        attempt = 0
+        while True:
+            try:
+                response = await self._session.request(method, f"{self.base_url}{path}", json=json_body,
+                                                       data=make_form() if make_form else None)
+                if response.status == 200:
+                    return response
+                error_text = await response.text()
+                response.release()
+                if response.status not in RETRY_STATUS or attempt >= self.max_retries:
+                    raise RuntimeError(f"LLM batch API error: {response.status} {error_text}")
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt >= self.max_retries:
+                    raise
+            attempt += 1
+            await asyncio.sleep(self.backoff * (2 ** attempt) + random.uniform(0, self.backoff))
+
+    async def _call(self, method, path, json_body=None, make_form=None):
+        async with await self._open(method, path, json_body, make_form) as response:
+            return await response.json(content_type=None)
+
+    async def upload(self, path):
+        """Uploads a batch input file; returns the file object."""
+        def form():
+            data = aiohttp.FormData()
+            data.add_field("purpose", "batch")
+            data.add_field("file", open(path, "rb"), filename=os.path.basename(path),
+                           content_type="application/jsonl")
+            return data
+        return await self._call("POST", "/files", make_form=form)
+
+    async def create(self, input_file_id, completion_window=COMPLETION_WINDOW, metadata=None):
+        return await self._call("POST", "/batches", {"input_file_id": input_file_id,
+                                                     "endpoint": "/v1/chat/completions",
+                                                     "completion_window": completion_window,
+                                                     "metadata": metadata or {}})
+
+    async def retrieve(self, batch_id):
+        return await self._call("GET", f"/batches/{batch_id}")
+
+    async def find(self, input_file_id):
+        """The most recent batch created from `input_file_id`, or None."""
+        listing = await self._call("GET", "/batches?limit=100")
+        for batch in listing.get("data", []):
+            if batch.get("input_file_id") == input_file_id:
+                return batch
+        return None
+
+    async def iter_lines(self, file_id):
+        """Streams a result file, one parsed JSONL line at a time."""
+        async with await self._open("GET", f"/files/{file_id}/content") as response:
+            pending = b""
+            async for chunk in response.content.iter_chunked(64 * 1024):
+                *lines, pending = (pending + chunk).split(b"\n")
+                for line in lines:
+                    if line.strip():
+                        yield json.loads(line)
+            if pending.strip():
+                yield json.loads(pending)
+
+
+def _result(line):
+    """(custom_id, answer, error) of one line of a batch output or error file."""
+    response = line.get("response") or {}
+    body = response.get("body") or {}
+    if response.get("status_code") == 200 and body.get("choices"):
+        usage = body.get("usage") or {}
+        metrics.record_llm_usage(body.get("model", "unknown"), usage.get("prompt_tokens"),
+                                 usage.get("completion_tokens"), price_factor=BATCH_PRICE_FACTOR)
+        metrics.inc("crawler_llm_batch_results_total", status=200)
+        return line["custom_id"], body["choices"][0]["message"]["content"].strip(), None
+    error = line.get("error") or body.get("error") or {}
+    metrics.inc("crawler_llm_batch_results_total", status=response.get("status_code") or "error")
+    return line["custom_id"], None, error.get("message") or f"status {response.get('status_code')}"
+
+
+async def _submit(job, client, chunk):
+    batch = None
+    if chunk["input_file_id"] is None:
+        path = f"{os.path.splitext(job.path)[0]}-{chunk['id']}.jsonl"
+        await asyncio.to_thread(job.write_chunk_file, chunk["id"], path)
+        try:
+            uploaded = await client.upload(path)
+        finally:
+            os.remove(path)
+        chunk["input_file_id"] = uploaded["id"]
+        job.update_chunk(chunk["id"], input_file_id=uploaded["id"], status="uploaded")
+    else:
+        # a batch created just before the process died is found by its input file instead of created twice
+        batch = await client.find(chunk["input_file_id"])
+    if batch is None:
+        batch = await client.create(chunk["input_file_id"], job.completion_window,
+                                    {"crawler_chunk": str(chunk["id"])})
+    job.update_chunk(chunk["id"], batch_id=batch["id"], status=batch["status"])
+    print(f"📤 已提交 batch {batch['id']}（{chunk['requests']} 个请求）")
+
+
+async def _store(job, cache, results):
+    cacheable = await asyncio.to_thread(job.store_results, results)
+    if cache:
+        # a later synchronous run asking the same question is answered from the cache
+        for cache_key, model, answer, templates in cacheable:
+            cache.put(cache_key, model, answer, templates)
+
+
+async def _download(job, client, cache, chunk, batch):
+    for file_id in (batch.get("output_file_id"), batch.get("error_file_id")):
+        if not file_id:
+            continue
+        results = []
+        async for line in client.iter_lines(file_id):
+            results.append(_result(line))
+            if len(results) >= RESULT_BATCH_SIZE:
+                await _store(job, cache, results)
+                results = []
+        await _store(job, cache, results)
+    errors = (batch.get("errors") or {}).get("data") or []
+    reason = errors[0].get("message") if errors else batch["status"]
+    failed = job.fail_unanswered(chunk["id"], f"batch {batch['id']} {batch['status']}: {reason}")
+    job.update_chunk(chunk["id"], status="merged")
+    metrics.inc("crawler_llm_batches_total", status=batch["status"])
+    print(f"📥 batch {batch['id']} {batch['status']}" + (f"，{failed} 个请求没有回答" if failed else ""))
+
+
+async def run_batch_job(job, client, cache=None):
+    """
+    Sends the job's unanswered requests as batches and waits until every batch is done and its results stored.
+
+    Safe to call again after a crash: chunks already uploaded or submitted
+    are not sent again, and batches still running are polled.
+    """
+    await asyncio.to_thread(job.plan_chunks)
+    for chunk in job.chunks():
+        if chunk["batch_id"] is None:
+            await _submit(job, client, chunk)
+    while True:
+        chunks = job.chunks()
+        if not chunks:
+            return
+        for chunk in chunks:
+            batch = await client.retrieve(chunk["batch_id"])
+            job.update_chunk(chunk["id"], status=batch["status"], output_file_id=batch.get("output_file_id"),
+                             error_file_id=batch.get("error_file_id"))
+            if batch["status"] in TERMINAL_STATUS:
+                await _download(job, client, cache, chunk, batch)
+            else:
+                counts = batch.get("request_counts") or {}
+                print(f"⏳ batch {batch['id']} {batch['status']}："
+                      f"{counts.get('completed', 0)}/{counts.get('total', chunk['requests'])}")
+        if job.chunks():
+            await asyncio.sleep(job.poll_interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or reset the state of the LLM batch mode.")
+    parser.add_argument("command", choices=["stats", "clear"])
+    parser.add_argument("--db", default=DEFAULT_BATCH_FILE, help="Path of the batch job database.")
+    args = parser.parse_args()
+
+    job = BatchJob(args.db)
+    if args.command == "clear":
+        job.clear()
+        print("Cleared the batch job.")
+    else:
+        stats = job.stats()
+        print(f"Records: {stats['records']}  requests: {stats['requests']}  answered: {stats['answered']}  "
+              f"failed: {stats['failed']}  crawl complete: {stats['collected']}")
+        for chunk_id, batch_id, status, requests in stats["chunks"]:
+            print(f"  chunk {chunk_id}: {batch_id or '-'} {status} ({requests} requests)")
+    job.close()
+
+
+if __name__ == "__main__":
+    main()
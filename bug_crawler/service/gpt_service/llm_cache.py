@@ -0,0 +1,157 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_FILE = "result/llm_cache.sqlite"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_digest(path):
+    """sha256 of a file, read in chunks so large logs are never held in memory."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class LLMCache:
+    """
+    Content-addressed cache of LLM answers.
+
+    The key is a hash of the model, temperature, full prompt and (when the
+    prompt is about a log file) the attachment's content, so any change to
+    one of them is a miss and an unchanged question is answered from disk.
+    Each entry also records the prompt templates it was built from, so the
+    answers of one template can be invalidated after editing it under
+    `prompt_template/`.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_FILE, max_age=90 * 24 * 3600, max_bytes=256 * 1024 * 1024):
+        self.path = path
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS answers (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                templates TEXT,
+                answer TEXT,
+                size INTEGER,
+                created_at REAL,
+                accessed_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS answers_accessed ON answers (accessed_at);
+        """)
+        self._conn.commit()
+
+    @classmethod
+    def from_config(cls, cache_config):
+        """Build a cache from the "llm_cache" config section, or return None if it is disabled."""
+        if not cache_config or not cache_config.get("enabled", True):
+            return None
+        return cls(
+            path=cache_config.get("path", DEFAULT_CACHE_FILE),
+            max_age=cache_config.get("max_age_days", 90) * 24 * 3600,
+            max_bytes=cache_config.get("max_mb", 256) * 1024 * 1024,
+        )
+
+    @staticmethod
+    def cache_key(model, temperature, prompt, attachment_path=None):
+        digest = hashlib.sha256()
+        digest.update(json.dumps([model, temperature]).encode("utf-8"))
+        digest.update(prompt.encode("utf-8"))
+        if attachment_path:
+            digest.update(file_digest(attachment_path).encode("utf-8"))
+        return digest.hexdigest()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT answer, created_at FROM answers WHERE key = ?", (key,)).fetchone()
+            if row is None or time.time() - row[1] > self.max_age:
+                return None
+            self._conn.execute("UPDATE answers SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return row[0]
+
+    def put(self, key, model, answer, templates=None):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, model, json.dumps(sorted(templates or [])), answer, len(answer.encode("utf-8")), now, now))
+            self._conn.commit()
+
+    def evict(self):
+        """Drops answers older than `max_age`, then least recently used ones until the cache fits `max_bytes`."""
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM answers WHERE created_at < ?",
+                                         (time.time() - self.max_age,)).rowcount
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM answers").fetchone()[0]
+            if total > self.max_bytes:
+                doomed = []
+                for key, size in self._conn.execute("SELECT key, size FROM answers ORDER BY accessed_at"):
+                    if total <= self.max_bytes:
+                        break
+                    doomed.append((key,))
+                    total -= size
+                self._conn.executemany("DELETE FROM answers WHERE key = ?", doomed)
+                removed += len(doomed)
+            self._conn.commit()
+        return removed
+
+    def invalidate(self, template=None):
+        """Deletes the answers built from `template` (a file name under prompt_template/), or all answers."""
+        with self._lock:
+            if template is None:
+                removed = self._conn.execute("DELETE FROM answers").rowcount
+            else:
+                pattern = "%" + json.dumps(os.path.basename(template)) + "%"
+                removed = self._conn.execute("DELETE FROM answers WHERE templates LIKE ?", (pattern,)).rowcount
+            self._conn.commit()
+        return removed
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM answers").fetchone()
+            templates = {}
+            for (names,) in self._conn.execute("SELECT templates FROM answers"):
+                for name in json.loads(names):
+                    templates[name] = templates.get(name, 0) + 1
+        return {"entries": entries, "bytes": size, "templates": templates}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or maintain the LLM response cache.")
+    parser.add_argument("command", choices=["stats", "evict", "invalidate"])
+    parser.add_argument("--db", default=DEFAULT_CACHE_FILE, help="Path of the cache database.")
+    parser.add_argument("--template", help="With 'invalidate': only drop answers built from this prompt template.")
+    args = parser.parse_args()
+
+    cache = LLMCache(args.db)
+    if args.command == "invalidate":
+        print(f"Invalidated {cache.invalidate(args.template)} cached answers.")
+    elif args.command == "evict":
+        print(f"Evicted {cache.evict()} cached answers.")
+    else:
+        stats = cache.stats()
+        print(f"Entries: {stats['entries']} ({stats['bytes']} bytes)")
+        for name, count in sorted(stats["templates"].items()):
+            print(f"  {name}: {count}")
+    cache.close()
+
+
+if __name__ == "__main__":
+    main()
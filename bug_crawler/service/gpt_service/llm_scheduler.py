@@ -0,0 +1,220 @@
+import asyncio
+import random
+import time
+from collections import deque
+
+import aiohttp
+
+import metrics
+
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+# Status codes that are retried: rate limiting and transient server errors.
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def estimate_tokens(text):
+    """Rough prompt size used for the tokens-per-minute budget (about 4 characters per token)."""
+    return len(text) // 4 + 1
+
+
+class RateBudget:
+    """
+    Sliding one-minute window of requests and tokens.
+
+    `acquire` waits until one more request of `tokens` tokens fits under both
+    the requests-per-minute and tokens-per-minute limits.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute, window=60.0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.window = window
+        self._events = deque()
+        self._tokens = 0
+        self._lock = asyncio.Lock()
+        self._changed = asyncio.Event()
+
+    def _expire(self, now):
+        while self._events and now - self._events[0][0] >= self.window:
+            _, tokens = self._events.popleft()
+            self._tokens -= tokens[0]
+
+    async def acquire(self, tokens):
+        # a single prompt larger than the whole budget can never fit, let it through alone
+        tokens = min(tokens, self.tokens_per_minute)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._expire(now)
+                if (len(self._events) < self.requests_per_minute
+                        and self._tokens + tokens <= self.tokens_per_minute):
+                    slot = [tokens]
+                    self._events.append((now, slot))
+                    self._tokens += tokens
+                    return slot
+                # sleep until the oldest entry leaves the window, or until a settled estimate frees tokens
+                self._changed.clear()
+                try:
+                    await asyncio.wait_for(self._changed.wait(),
+                                           timeout=max(self.window - (now - self._events[0][0]), 0.05))
+                except asyncio.TimeoutError:
+                    pass
+
+    def settle(self, slot, actual_tokens):
+        """Replaces the estimate of a granted request with the usage reported by the API."""
+        for _, tokens in self._events:
+            if tokens is slot:
+                self._tokens += actual_tokens - slot[0]
+                slot[0] = actual_tokens
+                self._changed.set()
+                return
+
+    def pause(self, seconds):
+        """Blocks new requests for `seconds`, e.g. after the API answered 429."""
+        now = time.monotonic()
+        # occupy the whole window so nothing is granted before the pause ends
+        filler = [self.tokens_per_minute]
+        self._events.appendleft((now - self.window + seconds, filler))
+        self._tokens += filler[0]
+
+
+class LLMScheduler:
+    """
+    Keeps many chat completion requests in flight under rate limits.
+
+    Requests go straight to an OpenAI-compatible `/chat/completions`
+    endpoint, so `base_url` can point at a local stand-in server. The
+    scheduler admits a request only when it fits the requests-per-minute
+    and tokens-per-minute budgets, caps the number of requests in flight,
+    and retries 429 / 5xx answers, honouring `Retry-After`. With an
+    `LLMCache`, answers to an identical question are served from disk and
+    never reach the API.
+
+    Usage:
+        async with LLMScheduler(api_key, requests_per_minute=500) as scheduler:
+            answer = await scheduler.complete(prompt, model="gpt-4.1")
+    """
+
+    def __init__(self, api_key, base_url=DEFAULT_BASE_URL, requests_per_minute=500, tokens_per_minute=30000,
+                 max_in_flight=16, max_retries=5, backoff=1.0, timeout=120, max_completion_tokens=512,
+                 cache=None):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.max_completion_tokens = max_completion_tokens
+        self.budget = RateBudget(requests_per_minute, tokens_per_minute)
+        self.cache = cache
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+        self._session = None
+
+    @classmethod
+    def from_config(cls, llm_config, api_key, cache=None):
+        """Build a scheduler from the "llm" section of a crawler config."""
+        return cls(
+            api_key,
+            base_url=llm_config.get("base_url", DEFAULT_BASE_URL),
+            requests_per_minute=llm_config.get("requests_per_minute", 500),
+            tokens_per_minute=llm_config.get("tokens_per_minute", 30000),
+            max_in_flight=llm_config.get("max_in_flight", 16),
+            max_retries=llm_config.get("max_retries", 5),
+            timeout=llm_config.get("timeout", 120),
+            cache=cache,
+        )
+
+    async def __aenter__(self):
+        if not self.api_key:
+            raise RuntimeError("No OpenAI API key found for the LLM scheduler.")
+        self._session = aiohttp.ClientSession(
+            headers={"Authorization": f"Bearer {self.api_key}"},
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._session.close()
+        self._session = None
+        if self.cache:
+            self.cache.evict()
+
+    def _retry_delay(self, attempt, headers=None):
+        if headers:
+            retry_after_ms = headers.get("retry-after-ms")
+            if retry_after_ms:
+                return float(retry_after_ms) / 1000
+            retry_after = headers.get("Retry-After")
+            if retry_after:
+                try:
+                    return float(retry_after)
+                except ValueError:
+                    pass
+        return self.backoff * (2 ** attempt) + random.uniform(0, self.backoff)
+
+    async def complete(self, prompt, model, temperature=None, templates=None, attachment_path=None, key=None):
+        """
+        Sends one single-message chat completion and returns the answer text.
+
+        Args:
+            prompt (str): The full prompt.
+            model (str): The model name.
+            temperature (float, optional): Sampling temperature.
+            templates (list, optional): Prompt template file names the prompt was built from,
+                recorded with the cached answer for later invalidation.
+            attachment_path (str, optional): Log file the prompt is about; its content is part of the cache key.
+            key (str, optional): Issue the prompt is about; only batch mode uses it (see `BatchCollector`).
+        """
+        cache_key = None
+        if self.cache:
+            cache_key = await asyncio.to_thread(self.cache.cache_key, model, temperature, prompt, attachment_path)
+            answer = self.cache.get(cache_key)
+            if answer is not None:
+                metrics.inc("crawler_llm_cache_hits_total", model=model)
+                return answer
+        answer = await self._request(prompt, model, temperature)
+        if self.cache:
+            self.cache.put(cache_key, model, answer, templates)
+        return answer
+
+    async def _request(self, prompt, model, temperature):
+        payload = {"model": model, "messages": [{"role": "user", "content": prompt}]}
+        if temperature is not None:
+            payload["temperature"] = temperature
+        estimate = estimate_tokens(prompt) + self.max_completion_tokens
+
+        attempt = 0
+        while True:
+            with metrics.timer("crawler_llm_wait_seconds", model=model):
+                slot = await self.budget.acquire(estimate)
+            async with self._in_flight:
+                started = time.perf_counter()
+                status = "error"
+                try:
+                    async with self._session.post(f"{self.base_url}/chat/completions", json=payload) as response:
+                        status = response.status
+                        if response.status == 200:
+                            data = await response.json(content_type=None)
+                            usage = data.get("usage") or {}
+                            if usage.get("total_tokens"):
+                                self.budget.settle(slot, usage["total_tokens"])
+                            metrics.record_llm_usage(model, usage.get("prompt_tokens"), usage.get("completion_tokens"))
+                            return data["choices"][0]["message"]["content"].strip()
+                        error_text = await response.text()
+                        # a rejected request used no tokens, only its request slot
+                        self.budget.settle(slot, 0)
+                        if response.status not in RETRY_STATUS or attempt >= self.max_retries:
+                            raise RuntimeError(f"LLM API error: {response.status} {error_text}")
+                        delay = self._retry_delay(attempt, response.headers)
+                        if response.status == 429:
+                            self.budget.pause(delay)
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                    if attempt >= self.max_retries:
+                        raise
+                    status = type(e).__name__
+                    delay = self._retry_delay(attempt)
+                finally:
+                    metrics.observe("crawler_llm_request_seconds", time.perf_counter() - started, model=model)
+                    metrics.inc("crawler_llm_requests_total", model=model, status=status)
+            metrics.inc("crawler_llm_retries_total", model=model, reason=status)
+            attempt += 1
+            await asyncio.sleep(delay)
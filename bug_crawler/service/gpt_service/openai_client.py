@@ -1,5 +1,4 @@
 from openai import OpenAI
-import json
 import os
 from dotenv import load_dotenv
 
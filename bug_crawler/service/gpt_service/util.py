@@ -1,5 +1,6 @@
 import openai
-import base64
+import os
+from log_reducer import reduce_log
 
 API_KEY_PATH = '/bug_crawler/config/gpt/your_key.txt'
 
@@ -8,26 +9,35 @@ with open(API_KEY_PATH, 'r') as f:
 
 '''
     OpenAI restrict GPT-4 model's maximum context length is 8192 tokens.
-    If upload file content > 8192 tokens. Please reduce the length of the messages.
+    The log is sent as plaintext, reduced by `reduce_log` to LOG_TOKEN_BUDGET tokens.
 '''
-def get_gpt_answer(question, file_path):
-    # 读取 .log 文件并转换为 base64 编码
-    with open(file_path, "rb") as f:
-        file_data = f.read()
+LOG_TOKEN_BUDGET = 6000
+
+
+def format_gpt_prompt(question, file_path, log_text):
+    return (f"Question：{question}\n\n"
+            f"Log file {os.path.basename(file_path)} (repeated lines collapsed, omitted ranges marked)：\n"
+            f"{log_text}")
+
 
-    # 将文件数据编码为 base64 字符串
-    base64_string = base64.b64encode(file_data).decode("utf-8")
+def build_gpt_prompt(question, file_path, token_budget=LOG_TOKEN_BUDGET, model="gpt-4"):
+    # 读取 .log 文件并压缩到 token 预算以内（纯文本，不再使用 base64）
+    return format_gpt_prompt(question, file_path, reduce_log(file_path, token_budget, model))
 
+
+def get_gpt_answer(question, file_path):
     # 设置 OpenAI API 密钥
     openai.api_key = API_KEY
 
+    prompt = build_gpt_prompt(question, file_path)
+
     # 使用node v1/chat/completions 发送请求
     response = openai.ChatCompletion.create(
         model="gpt-4",
         messages=[
             {
                 "role": "user",
-                "content": f"Question：{question}\n\n (base64 encoding)：{base64_string}"
+                "content": prompt
             },
         ]
     )
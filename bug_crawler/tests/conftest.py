@@ -0,0 +1,77 @@
+import asyncio
+import os
+import sys
+import threading
+
+import pytest
+from aiohttp import web
+
+CRAWLER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# the crawler modules import each other as top-level modules, like when run from bug_crawler/
+sys.path.insert(0, CRAWLER_DIR)
+
+from benchmark import FakeServices  # noqa: E402
+
+
+class ServerThread:
+    """Serves an aiohttp application on a free local port from a background event loop."""
+
+    def __init__(self, app):
+        self.app = app
+        self.loop = asyncio.new_event_loop()
+        self.base = None
+        self._runner = None
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    async def _start(self):
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base = f"http://127.0.0.1:{port}"
+
+    def start(self):
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self.loop).result(10)
+        return self
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self.loop).result(10)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(10)
+
+
+@pytest.fixture
+def fake_services():
+    """
+    Starts `benchmark.FakeServices` with the given scenario (no latency by default).
+
+    Usage:
+        services, base = fake_services(github_issues=500)
+    """
+    servers = []
+
+    def start(**scenario):
+        scenario = {"latency": 0, "jitter": 0, **scenario}
+        services = FakeServices(**scenario)
+        servers.append(ServerThread(services.app()).start())
+        return services, servers[-1].base
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+@pytest.fixture
+def serve_app():
+    """Serves a custom aiohttp application; returns its base URL."""
+    servers = []
+
+    def start(app):
+        servers.append(ServerThread(app).start())
+        return servers[-1].base
+
+    yield start
+    for server in servers:
+        server.stop()
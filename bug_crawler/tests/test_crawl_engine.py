@@ -0,0 +1,103 @@
+import asyncio
+import time
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from crawl_engine import LATENCY_MIN_SAMPLES, AdaptiveLimit, CrawlEngine
+from http_cache import HttpCache
+
+
+def flaky_app(statuses, hits):
+    """Answers /data with the queued (status, headers) pairs, then with 200 {"ok": true}."""
+    async def data(request):
+        hits.append(time.monotonic())
+        if statuses:
+            status, headers = statuses.pop(0)
+            return web.json_response({"message": "try later"}, status=status, headers=headers)
+        return web.json_response({"ok": True})
+
+    app = web.Application()
+    app.router.add_get("/data", data)
+    return app
+
+
+async def get_json(url, **engine_args):
+    async with CrawlEngine(**engine_args) as engine:
+        return await engine.get_json(url)
+
+
+def test_retry_waits_for_retry_after(serve_app):
+    hits = []
+    base = serve_app(flaky_app([(429, {"Retry-After": "1"}), (503, {})], hits))
+    assert asyncio.run(get_json(f"{base}/data", backoff=0.01)) == {"ok": True}
+    assert len(hits) == 3
+    assert hits[1] - hits[0] >= 0.9
+    assert hits[2] - hits[1] < 0.9
+
+
+def test_retries_give_up(serve_app):
+    hits = []
+    base = serve_app(flaky_app([(503, {})] * 5, hits))
+    with pytest.raises(aiohttp.ClientResponseError) as error:
+        asyncio.run(get_json(f"{base}/data", retries=2, backoff=0.01))
+    assert error.value.status == 503
+    assert len(hits) == 3
+
+
+def test_search_pages_survive_injected_faults(fake_services):
+    services, base = fake_services(jira_issues=500, rate_limit_rate=0.2, error_rate=0.2, retry_after=0)
+
+    async def crawl():
+        async with CrawlEngine(retries=20, backoff=0.001) as engine:
+            pages = [engine.get_json(f"{base}/jira/rest/api/2/search", params={"startAt": start, "maxResults": 50})
+                     for start in range(0, 500, 50)]
+            return await asyncio.gather(*pages)
+
+    pages = asyncio.run(crawl())
+    assert sum(len(page["issues"]) for page in pages) == 500
+    assert services.stats["injected_429"] and services.stats["injected_errors"]
+
+
+def test_stale_download_is_revalidated(fake_services, tmp_path):
+    services, base = fake_services(jira_issues=2, attachment_bytes=10000)
+    url = f"{base}/jira/attachment/BENCH-2/BENCH-2.log"
+    dest = str(tmp_path / "BENCH-2.log")
+    cache = HttpCache(str(tmp_path / "cache.sqlite"), ttl=0)
+
+    async def download():
+        async with CrawlEngine(cache=cache) as engine:
+            return await engine.download(url, dest)
+
+    first = asyncio.run(download())
+    assert asyncio.run(download()) == first
+    assert services.stats["requests"] == {"jira_attachment": 1, "jira_attachment_304": 1}
+    assert cache.stats()["revalidated"] == 1
+    cache.close()
+
+
+def released(limit, latencies):
+    """Feeds healthy responses with the given times to first byte; returns the limit after each one."""
+    limits = []
+    for latency in latencies:
+        ticket = time.monotonic()
+        limit.in_flight += 1
+        limit.release(ticket, True, latency)
+        limits.append(limit.limit)
+    return limits
+
+
+def test_one_latency_spike_cuts_the_limit_once():
+    limit = AdaptiveLimit("jira", 32, minimum=1, maximum=64)
+    limits = released(limit, [0.01] * 50 + [0.1] * 10 + [0.01] * 100)
+    assert limits[-1] == 16
+    assert len(set(limits)) == 2
+
+
+def test_lasting_slowdown_cuts_again_after_a_fresh_window():
+    limit = AdaptiveLimit("jira", 32, minimum=1, maximum=64)
+    limits = released(limit, [0.01] * 50 + [0.1] * 100)
+    cuts = [index for index in range(1, len(limits)) if limits[index] < limits[index - 1]]
+    assert len(cuts) >= 2
+    assert all(later - earlier >= LATENCY_MIN_SAMPLES for earlier, later in zip(cuts, cuts[1:]))
@@ -0,0 +1,48 @@
+import github_fetcher
+from benchmark import GITHUB_END, GITHUB_OWNER, GITHUB_REPO, GITHUB_START
+from github_fetcher import configure_endpoints, fetch_github_issues, iter_github_issues
+from github_rate_limiter import GitHubTokenPool
+
+
+def _window():
+    return GITHUB_START.strftime("%Y-%m-%d"), GITHUB_END.strftime("%Y-%m-%d")
+
+
+def _search(base, **args):
+    start_date, end_date = _window()
+    configure_endpoints(f"{base}/github/search/issues")
+    truncated = []
+    issues = list(iter_github_issues(GITHUB_OWNER, GITHUB_REPO, state="closed", start_date=start_date,
+                                     end_date=end_date, token_pool=GitHubTokenPool(),
+                                     on_truncated=lambda query, total: truncated.append(total), **args))
+    return issues, truncated
+
+
+def test_sharded_search_fetches_every_issue_past_max_pages(fake_services, monkeypatch):
+    monkeypatch.setattr(github_fetcher, "SEARCH_API", github_fetcher.SEARCH_API)
+    _, base = fake_services(github_issues=750)
+    # 750 issues: under the 1000 cap, but far more than 10 pages of 30
+    issues, truncated = _search(base, per_page=30, max_pages=10, shard_by_date=True, workers=4)
+    assert len(issues) == 750
+    assert len({issue["number"] for issue in issues}) == 750
+    assert truncated == []
+
+
+def test_sharded_search_past_the_search_api_cap(fake_services, monkeypatch):
+    monkeypatch.setattr(github_fetcher, "SEARCH_API", github_fetcher.SEARCH_API)
+    _, base = fake_services(github_issues=2500)
+    start_date, end_date = _window()
+    configure_endpoints(f"{base}/github/search/issues")
+    issues = fetch_github_issues(GITHUB_OWNER, GITHUB_REPO, state="closed", per_page=100, max_pages=10,
+                                 start_date=start_date, end_date=end_date, token_pool=GitHubTokenPool(),
+                                 shard_by_date=True)
+    assert len(issues) == 2500
+
+
+def test_unsharded_search_reports_the_cut(fake_services, monkeypatch):
+    monkeypatch.setattr(github_fetcher, "SEARCH_API", github_fetcher.SEARCH_API)
+    _, base = fake_services(github_issues=400)
+    issues, truncated = _search(base, per_page=30, max_pages=10)
+    assert len(issues) == 300
+    assert truncated == [400]
+
@@ -0,0 +1,51 @@
+import time
+from email.utils import formatdate
+
+from aiohttp import web
+
+from github_rate_limiter import GitHubTokenPool, retry_after_seconds
+from http_cache import HttpCache
+
+
+def rate_limited_app(responses, hits):
+    """Answers /issues with the queued (status, headers) pairs, then with 200s; counts the requests."""
+    async def issues(request):
+        hits.append(request.headers.get("Authorization"))
+        status, headers = responses.pop(0) if responses else (200, {})
+        reset = str(int(time.time()) + 3600)
+        remaining = str(100 - len(hits))
+        return web.json_response({"items": []}, status=status, headers={
+            "X-RateLimit-Remaining": remaining, "X-RateLimit-Reset": reset, "ETag": '"v1"', **headers})
+
+    app = web.Application()
+    app.router.add_get("/issues", issues)
+    return app
+
+
+def test_fresh_cache_hits_take_no_budget(serve_app, tmp_path):
+    hits = []
+    base = serve_app(rate_limited_app([], hits))
+    cache = HttpCache(str(tmp_path / "cache.sqlite"))
+    pool = GitHubTokenPool(["t1"])
+    for _ in range(3):
+        assert pool.get(f"{base}/issues", cache=cache).json() == {"items": []}
+    assert len(hits) == 1
+    assert pool._remaining[("t1", "core")] == 99
+    cache.close()
+
+
+def test_retry_after_http_date_pauses_the_token(serve_app):
+    hits = []
+    retry_at = formatdate(time.time() - 5, usegmt=True)
+    base = serve_app(rate_limited_app([(429, {"Retry-After": retry_at})], hits))
+    pool = GitHubTokenPool(["t1"])
+    assert pool.get(f"{base}/issues").status_code == 200
+    assert len(hits) == 2
+
+
+def test_retry_after_seconds():
+    now = time.time()
+    assert retry_after_seconds("30", now) == 30
+    assert 59 <= retry_after_seconds(formatdate(now + 60, usegmt=True), now) <= 61
+    assert retry_after_seconds(formatdate(now - 60, usegmt=True), now) == 0
+    assert retry_after_seconds("soon", now) is None
@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+
+from service.gpt_service.llm_batch import BatchClient, BatchJob, run_batch_job
+
+
+class Crash(Exception):
+    pass
+
+
+class CrashBeforeCreate(BatchClient):
+    async def create(self, input_file_id, completion_window="24h", metadata=None):
+        raise Crash()
+
+
+class CrashAfterCreate(BatchClient):
+    async def create(self, input_file_id, completion_window="24h", metadata=None):
+        await super().create(input_file_id, completion_window, metadata)
+        raise Crash()
+
+
+def parked_job(tmp_path):
+    job = BatchJob(str(tmp_path / "batch.sqlite"), poll_interval=0.05)
+    for n in range(3):
+        job.add_request(f"BENCH-{n}", {"model": "gpt-4.1", "messages": [{"role": "user", "content": f"log {n}"}]})
+    return job
+
+
+def run(job, client_class, base):
+    async def go():
+        async with client_class("test-key", base_url=f"{base}/openai/v1", backoff=0.01) as client:
+            await run_batch_job(job, client)
+    asyncio.run(go())
+
+
+@pytest.mark.parametrize("crashing_client", [CrashBeforeCreate, CrashAfterCreate])
+def test_resume_after_crash_submits_one_batch(fake_services, tmp_path, crashing_client):
+    services, base = fake_services(batch_seconds=0, llm_latency=0)
+    job = parked_job(tmp_path)
+    with pytest.raises(Crash):
+        run(job, crashing_client, base)
+    run(job, BatchClient, base)
+
+    stats = job.stats()
+    assert (stats["requests"], stats["answered"], stats["failed"]) == (3, 3, 0)
+    assert services.stats["requests"]["files"] == 1
+    assert len(services._batches) == 1
+    assert [(batch_id, status) for _, batch_id, status, _ in stats["chunks"]] == [("batch-bench-1", "merged")]
+    job.close()
@@ -0,0 +1,70 @@
+import asyncio
+import time
+
+from aiohttp import web
+
+from service.gpt_service.llm_scheduler import LLMScheduler, RateBudget
+
+
+def test_settled_usage_frees_the_budget():
+    async def run():
+        budget = RateBudget(requests_per_minute=100, tokens_per_minute=100)
+        slot = await budget.acquire(80)
+        waiting = asyncio.ensure_future(budget.acquire(50))
+        await asyncio.sleep(0.1)
+        assert not waiting.done()
+        budget.settle(slot, 20)
+        await asyncio.wait_for(waiting, 1)
+        return budget._tokens
+
+    assert asyncio.run(run()) == 70
+
+
+def test_pause_blocks_new_requests():
+    async def run():
+        budget = RateBudget(requests_per_minute=100, tokens_per_minute=100)
+        budget.pause(0.3)
+        started = time.monotonic()
+        await budget.acquire(10)
+        return time.monotonic() - started
+
+    assert 0.25 <= asyncio.run(run()) < 5
+
+
+def test_estimates_settle_to_reported_usage(fake_services):
+    services, base = fake_services(llm_latency=0)
+
+    async def run():
+        # each estimate holds 512+ tokens, so only three fit unless the reported usage settles them
+        async with LLMScheduler("test-key", base_url=f"{base}/openai/v1", tokens_per_minute=1600) as scheduler:
+            answers = await asyncio.wait_for(
+                asyncio.gather(*(scheduler.complete(f"Is log {n} an OOM?", "gpt-4.1") for n in range(10))), 10)
+            return answers, scheduler.budget._tokens
+
+    answers, tokens = asyncio.run(run())
+    assert len(answers) == 10 and all(answer.startswith("NO") for answer in answers)
+    assert tokens < 10 * 20
+    assert services.stats["requests"]["chat"] == 10
+
+
+def test_429_retry_after_is_honoured(serve_app):
+    hits = []
+
+    async def chat(request):
+        hits.append(time.monotonic())
+        if len(hits) == 1:
+            return web.json_response({"error": {"message": "slow down"}}, status=429, headers={"Retry-After": "1"})
+        return web.json_response({"choices": [{"message": {"content": " YES "}}],
+                                  "usage": {"prompt_tokens": 5, "completion_tokens": 1, "total_tokens": 6}})
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", chat)
+    base = serve_app(app)
+
+    async def run():
+        async with LLMScheduler("test-key", base_url=f"{base}/v1", backoff=0.01) as scheduler:
+            return await scheduler.complete("Is this an OOM?", "gpt-4.1")
+
+    assert asyncio.run(run()) == "YES"
+    assert len(hits) == 2
+    assert hits[1] - hits[0] >= 0.9
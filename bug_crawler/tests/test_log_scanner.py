@@ -0,0 +1,106 @@
+import os
+
+import pytest
+
+from log_scanner import format_signatures, scan_log
+
+BUG_CASES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                             "bug_cases")
+# attachments of memory bugs that hold evidence of the OOM itself
+MEMORY_EVIDENCE = [
+    "logs/CASSANDRA-14495/cas_heap.txt",
+    "logs/FLINK-16267/oomkilled_taskmanager.log",
+    "FLINK-20663/exception.txt",
+    "FLINK-20663/taskmanager.log.txt",
+    "Qpid-Dispatch-37/out01.log",
+]
+# attachments of the same bugs without it: source patches, a test page, a crash report without a signal
+NO_MEMORY_EVIDENCE = [
+    "logs/HADOOP-4035/HADOOP-4035-20081202.txt",
+    "logs/HADOOP-4035/HADOOP-4035-20081126.1.txt",
+    "logs/XALANJ-914/ASF.LICENSE.NOT.GRANTED--XSLTServletWithParam_Test.txt",
+    "logs/TS-4859/crash-2016-09-13-192754.log",
+    "FLINK-20663/LazyMemorySegmentPool.java",
+]
+
+
+@pytest.mark.parametrize("log", MEMORY_EVIDENCE)
+def test_memory_bug_log_is_flagged(log):
+    # with the signature prefilter on, an unflagged log never reaches GPT
+    assert scan_log(os.path.join(BUG_CASES_DIR, log)), f"{log} has no memory signature"
+
+
+@pytest.mark.parametrize("attachment", NO_MEMORY_EVIDENCE)
+def test_attachment_without_memory_evidence_is_not_flagged(attachment):
+    assert scan_log(os.path.join(BUG_CASES_DIR, attachment)) == {}
+
+
+def test_log_without_memory_evidence_is_not_flagged(tmp_path):
+    log = tmp_path / "server.log"
+    log.write_text("".join(f"2024-01-01 12:00:{n % 60:02d},000 INFO  [main] request {n} served in 12 ms\n"
+                           for n in range(5000)))
+    assert scan_log(str(log)) == {}
+
+
+def test_file_name_hits_have_no_offsets(tmp_path):
+    log = tmp_path / "oomkilled_taskmanager.log"
+    log.write_text("INFO checkpoint completed\n")
+    matches = scan_log(str(log))
+    assert matches == {"OOMKilled (file name)": [1, []]}
+    assert format_signatures(matches) == "OOMKilled (file name) ×1"
+
+
+@pytest.mark.parametrize("name, lines", [
+    ("gc.log", [
+        "CommandLine flags: -XX:MaxMetaspaceSize=256m -XX:+HeapDumpOnOutOfMemory -Xmx4g",
+        "2024-01-01T12:00:01.123+0000: 1.234: [GC (Allocation Failure) [PSYoungGen: 524800K->21472K(611840K)] "
+        "524800K->21488K(2010112K), 0.0212 secs]",
+        " Metaspace       used 34567K, capacity 35000K, committed 35328K, reserved 1081344K",
+        "Heap after GC invocations=1 (full 0): total 2010112K, used 21488K",
+    ]),
+    ("hadoop-yarn-nodemanager.log", [
+        "2024-01-01 12:00:00,000 INFO org.apache.hadoop.yarn.server.nodemanager.containermanager.monitor."
+        "ContainersMonitorImpl: Memory usage of ProcessTree 4242 for container-id container_1_0001_01_000002: "
+        "1.2 GB of 2 GB physical memory used; 2.9 GB of 4.2 GB virtual memory used",
+        "2024-01-01 12:00:05,000 INFO org.apache.hadoop.mapred.TaskTracker: maxVmemForTasks=-1, totalMemoryAllottedForTasks=4096",
+        "2024-01-01 12:00:09,000 INFO org.apache.hadoop.yarn.server.nodemanager.ContainerExecutor: "
+        "Container killed on request. Exit code is 143",
+        "2024-01-01 12:00:10,000 INFO org.apache.hadoop.yarn.server.nodemanager.NMAuditLogger: "
+        "USER=hadoop OPERATION=Container Finished - Killed TARGET=ContainerImpl RESULT=SUCCESS",
+    ]),
+    ("metrics.log", [
+        "Time      TotalMem   FreeMem   UsedMem   Threads",
+        "12:00:00  2048MB     1024MB    1024MB    137",
+        "jvm.memory.heap.used=734003200 jvm.memory.heap.max=4294967296 jvm.memory.non-heap.used=98566144",
+        "process.exit.code=0 signals.received=0 crash.reports=0",
+    ]),
+    ("HADOOP-9999.patch", [
+        "--- a/src/mapred/org/apache/hadoop/mapred/JobConf.java",
+        "+++ b/src/mapred/org/apache/hadoop/mapred/JobConf.java",
+        "@@ -1394,6 +1394,18 @@ public class JobConf extends Configuration {",
+        "+  public long getMaxVirtualMemoryForTask() {",
+        "+    long maxVmemForMapTasks = getLong(MAPRED_JOB_MAP_MEMORY_MB_PROPERTY, DISABLED_MEMORY_LIMIT);",
+        "+    // the task is killed when its memory exceeds the limit, see TaskMemoryManagerThread",
+        "+    return maxVmemForMapTasks * 1024 * 1024;",
+        "+  }",
+    ]),
+])
+def test_ordinary_logs_are_not_flagged(tmp_path, name, lines):
+    log = tmp_path / name
+    log.write_text("\n".join(lines * 50) + "\n")
+    assert scan_log(str(log)) == {}
+
+
+@pytest.mark.parametrize("line, label", [
+    ("Container [pid=4242] is running beyond physical memory limits. Killing container. Exit code is 137",
+     "Exit code 137"),
+    ("worker-3 exited with code 137", "Exit code 137"),
+    ("ERROR: could not allocate 16777216 bytes", "Allocation failure"),
+    ("malloc: cannot allocate memory", "Cannot allocate memory"),
+    ("# A fatal error has been detected by the Java Runtime Environment: SIGSEGV (0xb) at pc=0x00007f", "Process crash"),
+    ("[  412.345] Out of memory: Killed process 4242 (java) total-vm:8123456kB", "Killed process"),
+])
+def test_oom_and_crash_evidence_is_flagged(tmp_path, line, label):
+    log = tmp_path / "worker.log"
+    log.write_text(f"INFO started\n{line}\n")
+    assert label in scan_log(str(log))
@@ -0,0 +1,19 @@
+from markdown_util import json_list_to_markdown
+
+
+def test_shards_are_named_after_the_issue_keys(tmp_path):
+    output = tmp_path / "report.md"
+    rows = [{"Issue Key": "FLINK-123", "Summary": "heap grows"}, {"Issue Key": "HDFS-596", "Summary": "leak"},
+            {"Summary": "no key"}]
+    json_list_to_markdown(rows, str(output), shard_by_key=True)
+
+    assert sorted(path.name for path in (tmp_path / "report").iterdir()) == ["FLINK-123.md", "HDFS-596.md",
+                                                                              "Item_3.md"]
+    assert (tmp_path / "report" / "FLINK-123.md").read_text().startswith("# FLINK-123\n\n## FLINK-123\n")
+    assert "- [HDFS-596](report/HDFS-596.md)" in output.read_text()
+
+
+def test_github_issues_are_keyed_by_number(tmp_path):
+    output = tmp_path / "report.md"
+    json_list_to_markdown([{"number": 42, "title": "OOM"}], str(output))
+    assert "## 42\n" in output.read_text()
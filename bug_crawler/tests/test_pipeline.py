@@ -0,0 +1,58 @@
+import asyncio
+
+from pipeline import Pipeline, Source, Stage
+
+
+class Numbers(Source):
+    def __init__(self, count):
+        self.count = count
+        self.fed = 0
+
+    async def items(self):
+        for n in range(self.count):
+            self.fed += 1
+            yield {"key": n}
+
+
+class SlowFirst(Stage):
+    """Holds item 0 until `release` is set, like an LLM call being retried."""
+
+    name = "slow-first"
+
+    def __init__(self, source):
+        super().__init__(concurrency=4)
+        self.source = source
+        self.release = asyncio.Event()
+        self.fed_while_stalled = 0
+
+    async def process(self, item):
+        if item["key"] == 0:
+            # give the other workers every chance to run ahead
+            for _ in range(200):
+                await asyncio.sleep(0)
+            self.fed_while_stalled = self.source.fed
+        return item
+
+
+class Collect(Stage):
+    name = "collect"
+
+    def __init__(self):
+        super().__init__(ordered=True)
+        self.keys = []
+
+    async def process(self, item):
+        self.keys.append(item["key"])
+        return item
+
+
+def test_ordered_stage_behind_a_slow_item_stalls_the_source():
+    source = Numbers(2000)
+    slow = SlowFirst(source)
+    sink = Collect()
+    pipeline = Pipeline(source, [slow, sink], queue_size=8, progress=False)
+    asyncio.run(pipeline.run())
+
+    assert sink.keys == list(range(2000))
+    # without the window the other workers would have taken the whole source meanwhile
+    assert slow.fed_while_stalled <= pipeline.window() + 1
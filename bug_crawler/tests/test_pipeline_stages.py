@@ -0,0 +1,112 @@
+import asyncio
+
+from aiohttp import web
+
+from crawl_engine import CrawlEngine
+from pipeline import Pipeline, Stage
+from pipeline_stages import BatchJobSource, IssuePromptStage, JiraAttachmentStage, JiraSource, MarkdownSink
+from service.gpt_service.llm_batch import PENDING_PREFIX, BatchJob
+
+
+class Collect(Stage):
+    name = "collect"
+
+    def __init__(self):
+        super().__init__(ordered=True)
+        self.records = []
+
+    async def process(self, record):
+        self.records.append(record)
+        return record
+
+
+def jira_app():
+    """Three issues: BROKEN-1's attachment keeps failing, GONE-2's was deleted, OK-3's downloads."""
+    async def search(request):
+        base = f"http://{request.host}"
+        issues = [{"key": key, "fields": {"summary": key, "attachment": [
+            {"filename": f"{key}.log", "content": f"{base}/attachment/{status}/{key}.log"}]}}
+            for key, status in (("BROKEN-1", 503), ("GONE-2", 404), ("OK-3", 200))]
+        start_at = int(request.query.get("startAt", 0))
+        return web.json_response({"startAt": start_at, "maxResults": 50, "total": len(issues),
+                                  "issues": issues[start_at:]})
+
+    async def attachment(request):
+        status = int(request.match_info["status"])
+        if status != 200:
+            return web.json_response({"message": "no"}, status=status)
+        return web.Response(text="line 1\nline 2\n")
+
+    app = web.Application()
+    app.router.add_get("/search", search)
+    app.router.add_get("/attachment/{status}/{name}", attachment)
+    return app
+
+
+def test_failed_attachment_download_fails_the_issue(serve_app):
+    base = serve_app(jira_app())
+    sink = Collect()
+
+    async def run():
+        async with CrawlEngine(retries=1, backoff=0.01) as engine:
+            source = JiraSource(engine, f"{base}/search", "project = X ORDER BY key ASC", 50, 100)
+            await Pipeline(source, [JiraAttachmentStage(engine, f"{base}/issue/"), sink], progress=False).run()
+            return source
+
+    source = asyncio.run(run())
+    assert source.failed == 1
+    assert [record["key"] for record in sink.records] == ["GONE-2", "OK-3"]
+    # a deleted attachment will never come back, so it does not hold the issue back
+    assert sink.records[0]["attachments"][0][2] == "N/A"
+    assert sink.records[1]["attachments"][0][2] == 2
+
+
+class FlakyScheduler:
+    async def complete(self, prompt, model, temperature=None, templates=None, key=None):
+        if key == "A-1":
+            raise RuntimeError("LLM API error: 500")
+        return "YES"
+
+
+class Records(JiraSource):
+    def __init__(self, keys):
+        super().__init__(None, None, None, 50, 100)
+        self.keys = keys
+
+    async def items(self):
+        for key in self.keys:
+            yield {"key": key, "title": key}
+
+
+def test_failed_llm_question_fails_the_issue():
+    source = Records(["A-1", "A-2"])
+    sink = Collect()
+    stage = IssuePromptStage(FlakyScheduler(), lambda record: record["title"], "gpt-4.1")
+    asyncio.run(Pipeline(source, [stage, sink], progress=False).run())
+    assert source.failed == 1
+    assert [(record["key"], record["answer"]) for record in sink.records] == [("A-2", "YES")]
+
+
+def test_unanswered_batch_request_fails_the_issue(tmp_path):
+    job = BatchJob(str(tmp_path / "batch.sqlite"))
+    for key in ("A-1", "A-2"):
+        custom_id = job.add_request(key, {"model": "gpt-4.1", "messages": [{"role": "user", "content": key}]})
+        job.add_record(key, {"key": key, "answer": PENDING_PREFIX + custom_id})
+        job.store_results([(custom_id, None, "rate limited") if key == "A-1" else (custom_id, "YES", None)])
+    source = BatchJobSource(job)
+    sink = Collect()
+    asyncio.run(Pipeline(source, [sink], progress=False).run())
+    assert source.failed == 1
+    assert [(record["key"], record["answer"]) for record in sink.records] == [("A-2", "YES")]
+    job.close()
+
+
+def test_markdown_sink_writes_one_file_per_issue(tmp_path):
+    report = tmp_path / "bugs.md"
+    source = Records(["FLINK-1", "HDFS-2"])
+    sink = MarkdownSink(str(report), lambda record: {"Summary": record["title"]}, title="Bugs", shard_by_key=True)
+    asyncio.run(Pipeline(source, [sink], progress=False).run())
+
+    assert sink.count == 2
+    assert (tmp_path / "bugs" / "HDFS-2.md").read_text() == "# HDFS-2\n\n## HDFS-2\n\n- Summary: HDFS-2\n\n"
+    assert report.read_text() == "# Bugs\n\n- [FLINK-1](bugs/FLINK-1.md)\n- [HDFS-2](bugs/HDFS-2.md)\n"
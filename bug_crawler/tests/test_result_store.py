@@ -0,0 +1,48 @@
+from openpyxl import Workbook
+
+from result_store import JIRA_RESULT_HEADER, ResultStore
+
+LINK = "https://issues.apache.org/jira/browse/"
+FILE = "https://issues.apache.org/jira/secure/attachment/1/"
+
+
+def write_workbook(path, header, rows):
+    workbook = Workbook()
+    workbook.active.append(header)
+    for row in rows:
+        workbook.active.append(row)
+    workbook.save(path)
+
+
+def imported_rows(tmp_path, header, rows):
+    write_workbook(tmp_path / "old.xlsx", header, rows)
+    store = ResultStore(str(tmp_path / "results.sqlite"))
+    assert store.import_xlsx(str(tmp_path / "old.xlsx")) == len(rows)
+    return list(store.iter_rows())
+
+
+def test_import_maps_rows_without_signatures_or_cluster(tmp_path):
+    header = ["Issue Key", "Summary", "Issue Link", "Attachment Link", "Attachment type & lines", "GPT response"]
+    rows = [
+        ["A-1", "leak", LINK + "A-1", "None", "0"],
+        ["A-2", "oom", LINK + "A-2", FILE + "gc.log", "log, 120", "yes", "no",
+         FILE + "fix.patch", "patch, 30"],
+    ]
+    assert imported_rows(tmp_path, header, rows) == [
+        ["A-1", "leak", LINK + "A-1", "", "None", "0"],
+        ["A-2", "oom", LINK + "A-2", "", FILE + "gc.log", "log, 120", "", "yes", "no",
+         FILE + "fix.patch", "patch, 30", "N/A"],
+    ]
+
+
+def test_import_adds_cluster_to_rows_with_signatures(tmp_path):
+    header = ["Issue Key", "Summary", "Issue Link", "Attachment Link", "Attachment type & lines",
+              "Memory signatures", "GPT response"]
+    rows = [["A-3", "oom", LINK + "A-3", FILE + "gc.log", "log, 120", "Java heap space @ 7", "yes"]]
+    assert imported_rows(tmp_path, header, rows) == [
+        ["A-3", "oom", LINK + "A-3", "", FILE + "gc.log", "log, 120", "Java heap space @ 7", "yes"]]
+
+
+def test_import_keeps_current_rows(tmp_path):
+    rows = [["A-4", "oom", LINK + "A-4", "2", FILE + "gc.log", "log, 120", "Java heap space @ 7", "yes"]]
+    assert imported_rows(tmp_path, JIRA_RESULT_HEADER, rows) == rows
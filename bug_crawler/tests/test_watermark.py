@@ -0,0 +1,91 @@
+import asyncio
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+import github_fetcher
+from benchmark import GITHUB_OWNER, GITHUB_REPO
+from crawl_engine import CrawlEngine
+from github_fetcher import configure_endpoints
+from github_rate_limiter import GitHubTokenPool
+from http_cache import HttpCache
+from jira_fetcher import fetch_search_page, latest_update
+from pipeline import Pipeline, Stage
+from pipeline_stages import GitHubSource
+from watermark import WatermarkStore, jql_latest_updated_first, jql_updated_since, parse_jira_time
+
+
+def test_jql_dates_keep_the_jira_timezone(tmp_path):
+    latest = parse_jira_time("2024-03-05T10:30:00.000+0800")
+    store = WatermarkStore(str(tmp_path / "watermarks.sqlite"), overlap=timedelta(minutes=60))
+    store.set("jira", "project = X", latest)
+    since = store.since("jira", "project = X")
+    store.close()
+    # the wall-clock time JIRA showed, not the client's local time or UTC
+    assert jql_updated_since("project = X ORDER BY key", since) == \
+        '(project = X) AND updated >= "2024-03-05 09:30" ORDER BY key'
+
+
+def test_latest_update_orders_by_updated():
+    assert jql_latest_updated_first("text ~ memory ORDER BY key ASC") == "text ~ memory ORDER BY updated DESC"
+
+
+def test_shipped_jql_pages_in_a_stable_order():
+    with open(os.path.join(os.path.dirname(__file__), "..", "config", "memory_bug", "config.json"), encoding="utf-8") as f:
+        jql = json.load(f)["jira"]["jql"].format(search_term="memory")
+    since = datetime(2024, 3, 5, 9, 30, tzinfo=timezone.utc)
+    assert jql.endswith(" ORDER BY key ASC")
+    assert jql_updated_since(jql, since).endswith(' AND updated >= "2024-03-05 09:30" ORDER BY key ASC')
+    assert jql_latest_updated_first(jql).endswith('"memory" ORDER BY updated DESC')
+
+
+def test_latest_update_from_fake_jira(fake_services):
+    _, base = fake_services(jira_issues=30)
+
+    async def probe():
+        async with CrawlEngine() as engine:
+            return await latest_update(engine, f"{base}/jira/rest/api/2/search", "text ~ memory")
+
+    latest = asyncio.run(probe())
+    assert latest.utcoffset() == timedelta(hours=8)
+
+
+class FailOn(Stage):
+    name = "fail-on"
+
+    def __init__(self, keys):
+        super().__init__()
+        self.keys = keys
+
+    async def process(self, record):
+        if record["key"] in self.keys:
+            raise RuntimeError("boom")
+        return record
+
+
+def test_github_source_reports_cut_off_searches_and_failures(fake_services, monkeypatch):
+    monkeypatch.setattr(github_fetcher, "SEARCH_API", github_fetcher.SEARCH_API)
+    _, base = fake_services(github_issues=120)
+    configure_endpoints(f"{base}/github/search/issues")
+    source = GitHubSource(GITHUB_OWNER, GITHUB_REPO, GitHubTokenPool(), state="closed", per_page=30, max_pages=2,
+                          start_date="2022-01-01", end_date="2022-12-31")
+    fail = {f"{GITHUB_OWNER}/{GITHUB_REPO}#{number}" for number in range(1, 121)}
+    asyncio.run(Pipeline(source, [FailOn(fail)], progress=False).run())
+    assert source.total == 60
+    assert source.truncated == 1
+    assert source.failed == 60
+
+
+def test_search_pages_skip_the_http_cache(fake_services, tmp_path):
+    services, base = fake_services(jira_issues=30)
+    cache = HttpCache(str(tmp_path / "cache.sqlite"), ttl=3600)
+
+    async def search_twice():
+        async with CrawlEngine(cache=cache) as engine:
+            for _ in range(2):
+                await fetch_search_page(engine, f"{base}/jira/rest/api/2/search", "text ~ memory", 0, 10)
+
+    asyncio.run(search_twice())
+    # a delta crawl must see what JIRA has now, not a page cached by the last run
+    assert services.stats["requests"]["jira_search"] == 2
+    cache.close()
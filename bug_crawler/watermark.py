@@ -0,0 +1,142 @@
+import argparse
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+DEFAULT_WATERMARK_FILE = "result/watermarks.sqlite"
+ORDER_BY_PATTERN = re.compile(r"\s+ORDER\s+BY\s", re.IGNORECASE)
+
+
+class WatermarkStore:
+    """
+    Point in time up to which the last complete crawl saw every update, per source and per query.
+
+    A run reads the watermark of its query, restricts the search to issues
+    updated since then (minus `overlap`, for updates that were still being
+    indexed) and, once its results are merged, records the new one. The
+    moment is taken from the server's clock where the query is evaluated
+    in the server's timezone: for JIRA the latest `updated` of the matching
+    issues as JIRA reports it (see `latest_update`), for GitHub the UTC
+    start time of the run. An interrupted run, or one that failed on some
+    issues or could not fetch all results, leaves the watermark untouched,
+    so the next run fetches the same delta again.
+
+    Usage:
+        watermarks = WatermarkStore("result/watermarks.sqlite")
+        since = watermarks.since("jira", jql)      # None on the first run
+        latest = await latest_update(engine, search_api, jql)
+        ... crawl ...
+        watermarks.set("jira", jql, latest)
+    """
+
+    def __init__(self, path=DEFAULT_WATERMARK_FILE, overlap=timedelta(minutes=60)):
+        self.path = path
+        self.overlap = overlap
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS watermarks (
+                source TEXT NOT NULL,
+                query TEXT NOT NULL,
+                value TEXT NOT NULL,
+                PRIMARY KEY (source, query)
+            )
+        """)
+        self._conn.commit()
+
+    @classmethod
+    def from_config(cls, watermark_config):
+        """Build a store from the "watermark" config section, or return None if delta crawls are disabled."""
+        if not watermark_config or not watermark_config.get("enabled", True):
+            return None
+        return cls(
+            path=watermark_config.get("path", DEFAULT_WATERMARK_FILE),
+            overlap=timedelta(minutes=watermark_config.get("overlap_minutes", 60)),
+        )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def get(self, source, query):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM watermarks WHERE source = ? AND query = ?",
+                                     (source, query)).fetchone()
+        return datetime.fromisoformat(row[0]) if row else None
+
+    def since(self, source, query):
+        """The lower bound for the next delta crawl of `query`, or None if it was never crawled."""
+        watermark = self.get(source, query)
+        return watermark - self.overlap if watermark else None
+
+    def set(self, source, query, moment):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO watermarks VALUES (?, ?, ?)",
+                               (source, query, moment.isoformat()))
+            self._conn.commit()
+
+    def reset(self, source=None):
+        """Forgets the watermarks of `source` (or all), so the next run crawls the full window again."""
+        with self._lock:
+            if source is None:
+                removed = self._conn.execute("DELETE FROM watermarks").rowcount
+            else:
+                removed = self._conn.execute("DELETE FROM watermarks WHERE source = ?", (source,)).rowcount
+            self._conn.commit()
+        return removed
+
+    def items(self):
+        with self._lock:
+            return self._conn.execute("SELECT source, query, value FROM watermarks ORDER BY source, query").fetchall()
+
+
+def jql_updated_since(jql, since):
+    """
+    Adds `updated >= since` to a JQL query, in front of its ORDER BY clause if it has one.
+
+    JQL dates carry no timezone and are read in the JIRA user's timezone,
+    so `since` is written as its wall-clock time in its own offset: a
+    moment parsed from a JIRA timestamp (`parse_jira_time`) comes back
+    exactly as JIRA showed it.
+    """
+    if since is None:
+        return jql
+    clause = f'updated >= "{since.strftime("%Y-%m-%d %H:%M")}"'
+    match = ORDER_BY_PATTERN.search(jql)
+    if match:
+        return f"({jql[:match.start()]}) AND {clause}{jql[match.start():]}"
+    return f"({jql}) AND {clause}"
+
+
+def jql_latest_updated_first(jql):
+    """The same JQL ordered by `updated`, newest first, in place of its own ORDER BY clause."""
+    match = ORDER_BY_PATTERN.search(jql)
+    return f"{jql[:match.start()] if match else jql} ORDER BY updated DESC"
+
+
+def parse_jira_time(value):
+    """Parses a JIRA timestamp such as "2024-01-31T17:05:00.000+0800", keeping its offset."""
+    return datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%f%z")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or reset the delta crawl watermarks.")
+    parser.add_argument("command", choices=["list", "reset"])
+    parser.add_argument("--db", default=DEFAULT_WATERMARK_FILE, help="Path of the watermark database.")
+    parser.add_argument("--source", help="With 'reset': only reset this source (jira or github).")
+    args = parser.parse_args()
+
+    watermarks = WatermarkStore(args.db)
+    if args.command == "reset":
+        print(f"Reset {watermarks.reset(args.source)} watermark(s).")
+    else:
+        for source, query, value in watermarks.items():
+            print(f"{source}\t{value}\t{query}")
+    watermarks.close()
+
+
+if __name__ == "__main__":
+    main()
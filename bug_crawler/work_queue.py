@@ -0,0 +1,205 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_QUEUE_FILE = "result/work_queue.sqlite"
+LEASE_SECONDS = 300
+MAX_ATTEMPTS = 3
+
+
+class WorkQueue:
+    """
+    Lease-based work queue in SQLite, shared by crawler processes.
+
+    A unit is a kind ("page", "issue", ...), a key unique within its kind
+    and a JSON payload. `claim` hands a unit to one worker for `lease`
+    seconds; the worker renews the lease with `heartbeat` while it works
+    and ends it with `complete` or `fail`. When a worker crashes or hangs,
+    its lease runs out and the unit can be claimed again; a unit claimed
+    `max_attempts` times without completing is marked failed.
+
+    Claims run in `BEGIN IMMEDIATE` transactions, so concurrent processes
+    never get the same unit. Every process opens its own connection; the
+    database must live on a local disk (SQLite locking is unreliable over
+    network file systems).
+
+    Usage:
+        queue = WorkQueue("result/work_queue.sqlite")
+        queue.add_many([("issue", "FLINK-1", {...})])
+        for unit in queue.claim("worker-1", limit=4):
+            ... process unit["payload"] ...
+            queue.complete("worker-1", unit["id"])
+    """
+
+    def __init__(self, path=DEFAULT_QUEUE_FILE, lease=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        self.path = path
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # autocommit mode: transactions are opened explicitly where several statements must be atomic
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS units (
+                id INTEGER PRIMARY KEY,
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                payload TEXT,
+                state TEXT NOT NULL DEFAULT 'pending',
+                owner TEXT,
+                lease_until REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                updated_at REAL,
+                UNIQUE (kind, key)
+            );
+            CREATE INDEX IF NOT EXISTS units_state ON units (state, id);
+        """)
+
+    @classmethod
+    def from_config(cls, queue_config):
+        """Build a queue from the "work_queue" config section; defaults apply to missing settings."""
+        queue_config = queue_config or {}
+        return cls(
+            path=queue_config.get("path", DEFAULT_QUEUE_FILE),
+            lease=queue_config.get("lease_seconds", LEASE_SECONDS),
+            max_attempts=queue_config.get("max_attempts", MAX_ATTEMPTS),
+        )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def add_many(self, units):
+        """Adds `(kind, key, payload)` units; units already queued (in any state) are left alone."""
+        now = time.time()
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO units (kind, key, payload, updated_at) VALUES (?, ?, ?, ?)",
+                ((kind, key, json.dumps(payload, ensure_ascii=False), now) for kind, key, payload in units))
+            self._conn.execute("COMMIT")
+            return self._conn.total_changes - before
+
+    def add(self, kind, key, payload=None):
+        return self.add_many([(kind, key, payload)]) == 1
+
+    def claim(self, worker, limit=1, kinds=None):
+        """
+        Leases up to `limit` units to `worker`, oldest first: pending units,
+        and units whose lease has run out.
+
+        Returns:
+            list: dicts with id, kind, key, payload and attempts.
+        """
+        now = time.time()
+        kind_filter = f" AND kind IN ({','.join('?' * len(kinds))})" if kinds else ""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # units whose worker died too often are given up
+                self._conn.execute(
+                    "UPDATE units SET state = 'failed', owner = NULL, error = coalesce(error, 'lease expired'), "
+                    "updated_at = ? WHERE state = 'leased' AND lease_until < ? AND attempts >= ?",
+                    (now, now, self.max_attempts))
+                rows = self._conn.execute(
+                    "SELECT id, kind, key, payload, attempts FROM units "
+                    f"WHERE (state = 'pending' OR (state = 'leased' AND lease_until < ?)){kind_filter} "
+                    "ORDER BY id LIMIT ?", (now, *(kinds or ()), limit)).fetchall()
+                self._conn.executemany(
+                    "UPDATE units SET state = 'leased', owner = ?, lease_until = ?, attempts = attempts + 1, "
+                    "updated_at = ? WHERE id = ?", ((worker, now + self.lease, now, row[0]) for row in rows))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [{"id": unit_id, "kind": kind, "key": key, "payload": json.loads(payload), "attempts": attempts + 1}
+                for unit_id, kind, key, payload, attempts in rows]
+
+    def heartbeat(self, worker, unit_ids):
+        """Extends the leases `worker` still holds on `unit_ids`; returns how many it still holds."""
+        if not unit_ids:
+            return 0
+        now = time.time()
+        with self._lock:
+            return self._conn.execute(
+                f"UPDATE units SET lease_until = ?, updated_at = ? WHERE owner = ? AND state = 'leased' "
+                f"AND id IN ({','.join('?' * len(unit_ids))})", (now + self.lease, now, worker, *unit_ids)).rowcount
+
+    def complete(self, worker, unit_id):
+        """Marks a unit done; False if `worker` lost its lease (the unit was reclaimed by another worker)."""
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE units SET state = 'done', lease_until = NULL, error = NULL, updated_at = ? "
+                "WHERE id = ? AND owner = ? AND state = 'leased'", (time.time(), unit_id, worker)).rowcount == 1
+
+    def fail(self, worker, unit_id, error):
+        """Gives a unit back for another attempt, or marks it failed after `max_attempts`."""
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE units SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "owner = NULL, lease_until = NULL, error = ?, updated_at = ? "
+                "WHERE id = ? AND owner = ? AND state = 'leased'",
+                (self.max_attempts, str(error), time.time(), unit_id, worker)).rowcount == 1
+
+    def outstanding(self):
+        """Number of units not yet done or failed."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM units WHERE state IN ('pending', 'leased')").fetchone()[0]
+
+    def stats(self):
+        """{kind: {state: count}}."""
+        stats = {}
+        with self._lock:
+            for kind, state, count in self._conn.execute(
+                    "SELECT kind, state, COUNT(*) FROM units GROUP BY kind, state ORDER BY kind, state"):
+                stats.setdefault(kind, {})[state] = count
+        return stats
+
+    def failures(self, limit=20):
+        with self._lock:
+            return self._conn.execute("SELECT kind, key, attempts, error FROM units WHERE state = 'failed' "
+                                      "ORDER BY id LIMIT ?", (limit,)).fetchall()
+
+    def requeue_failed(self, kind=None):
+        """Gives failed units a fresh set of attempts."""
+        with self._lock:
+            if kind is None:
+                return self._conn.execute("UPDATE units SET state = 'pending', attempts = 0 "
+                                          "WHERE state = 'failed'").rowcount
+            return self._conn.execute("UPDATE units SET state = 'pending', attempts = 0 "
+                                      "WHERE state = 'failed' AND kind = ?", (kind,)).rowcount
+
+    def clear(self):
+        """Drops every unit, e.g. before planning a new crawl."""
+        with self._lock:
+            return self._conn.execute("DELETE FROM units").rowcount
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or repair the crawl work queue.")
+    parser.add_argument("command", choices=["stats", "requeue-failed", "clear"])
+    parser.add_argument("--db", default=DEFAULT_QUEUE_FILE, help="Path of the work queue database.")
+    parser.add_argument("--kind", help="With 'requeue-failed': only requeue units of this kind.")
+    args = parser.parse_args()
+
+    queue = WorkQueue(args.db)
+    if args.command == "requeue-failed":
+        print(f"Requeued {queue.requeue_failed(args.kind)} unit(s).")
+    elif args.command == "clear":
+        print(f"Removed {queue.clear()} unit(s).")
+    else:
+        for kind, states in queue.stats().items():
+            print(f"{kind}\t" + "  ".join(f"{state}: {count}" for state, count in states.items()))
+        for kind, key, attempts, error in queue.failures():
+            print(f"  failed {kind} {key} after {attempts} attempt(s): {error}")
+    queue.close()
+
+
+if __name__ == "__main__":
+    main()